@@ -0,0 +1,223 @@
+"""
+Leaderboard style reports computed as batched NumPy operations over the arrays of a FrozenGraph.
+Edge weights are summed per segment of the CSR adjacency, connections are counted with a type mask
+over the edge list and ages are grouped with np.unique, so no report loops over vertices in Python.
+Top x reports pick their candidates with np.partition instead of sorting every actor.
+Every function takes a Graph or a FrozenGraph and returns the same result as the Graph method it is named after.
+"""
+
+import threading
+import weakref
+import numpy as np
+from FrozenGraph import FrozenGraph
+
+# Graph -> (version, _GraphArrays of its frozen copy), so that a Graph is only frozen again once it changes
+# the Graphs are held weakly, and the cached arrays only reference the frozen copy
+_arrays_cache = weakref.WeakKeyDictionary()
+_arrays_lock = threading.Lock()
+
+
+'''
+Wraps the arrays of a frozen graph as NumPy arrays, without copying them
+'''
+class _GraphArrays:
+    def __init__(self, graph):
+        self.graph = graph
+        self.types = np.frombuffer(graph.types, dtype=np.int8)
+        self.info = np.frombuffer(graph.info, dtype=np.int64)
+        self.income = np.frombuffer(graph.income, dtype=np.int64)
+        self.offsets = np.frombuffer(graph.offsets, dtype=np.int64)
+        self.targets = np.frombuffer(graph.targets, dtype=np.int32)
+        self.weights = np.frombuffer(graph.weights, dtype=np.int64)
+
+        # sources[e] is the vertex that edge e starts from
+        self.sources = np.repeat(np.arange(graph.num_vertices), np.diff(self.offsets))
+
+    # ids of the vertices of a type, as a NumPy range
+    def ids_of_type(self, type):
+        start, end = self.graph.type_ranges.get(type, (0, 0))
+        return np.arange(start, end)
+
+    # boolean mask of the edges whose endpoint (sources or targets) is of a type
+    def edge_mask(self, endpoints, type):
+        start, end = self.graph.type_ranges.get(type, (0, 0))
+        return (endpoints >= start) & (endpoints < end)
+
+    def name(self, i):
+        return self.graph.names[int(i)]
+
+
+'''
+Returns the _GraphArrays of a Graph or FrozenGraph
+a Graph is frozen first, which costs as much as copying it, so its arrays are reused
+until the graph's version changes
+'''
+def _arrays(graph):
+    if isinstance(graph, FrozenGraph):
+        return _GraphArrays(graph)
+
+    version = graph.version
+    with _arrays_lock:
+        cached = _arrays_cache.get(graph)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+
+    arrays = _GraphArrays(graph.freeze())
+    with _arrays_lock:
+        _arrays_cache[graph] = (version, arrays)
+    return arrays
+
+
+'''
+Returns (name, score) pairs for the x highest scores, highest first, ties broken by name in reverse,
+which is the order the Graph reports sort in
+np.partition finds the x-th highest score, so only the candidates at or above it are sorted
+:param ids: NumPy array of vertex ids
+:param scores: NumPy array of the score of each id
+:param x: number of results, or None for all of them
+'''
+def _top(arrays, ids, scores, x=None):
+    if x is not None and x < len(ids):
+        if x <= 0:
+            return []
+        kth = np.partition(scores, len(scores) - x)[len(scores) - x]
+        keep = scores >= kth
+        ids = ids[keep]
+        scores = scores[keep]
+
+    ranked = sorted(((arrays.name(i), int(s)) for i, s in zip(ids, scores)),
+                    key=lambda f: (f[1], f[0]), reverse=True)
+    return ranked if x is None else ranked[:x]
+
+
+'''
+List the top X actors with the most total grossing value
+edge weights from each movie are summed per target actor
+:return: list of highest x grossing income actors
+'''
+def get_top_x_paid_actors(graph, x):
+    arrays = _arrays(graph)
+    ids, incomes = _paid(arrays)
+    return [name for name, income in _top(arrays, ids, incomes, x)]
+
+
+# ids of the actors with at least one movie, and the summed weights of their movie edges
+def _paid(arrays):
+    from_movie = arrays.edge_mask(arrays.sources, 'Movie')
+    targets = arrays.targets[from_movie]
+
+    incomes = np.zeros(arrays.graph.num_vertices, dtype=np.int64)
+    np.add.at(incomes, targets, arrays.weights[from_movie])
+
+    # only actors with at least one movie are ranked
+    ids = np.unique(targets)
+    return ids, incomes[ids]
+
+
+'''
+List the oldest X actors
+:return: list of (actor, age) pairs
+'''
+def get_oldest_x_actors(graph, x):
+    arrays = _arrays(graph)
+    ids = arrays.ids_of_type('Actor')
+    return _top(arrays, ids, arrays.info[ids], x)
+
+
+'''
+Counts the actors each actor is connected to
+:param x: if given, only the x actors with the most connections are returned
+:return: list of (actor, # of connections), most connections first
+'''
+def get_hub_actors(graph, x=None):
+    arrays = _arrays(graph)
+    ids, counts = _connections(arrays)
+    return _top(arrays, ids, counts, x)
+
+
+# ids of the actors, and the number of co-stars of each
+def _connections(arrays):
+    left, right = _costar_pairs(arrays)
+    counts = np.bincount(left, minlength=arrays.graph.num_vertices)
+
+    ids = arrays.ids_of_type('Actor')
+    return ids, counts[ids]
+
+
+'''
+Returns the co-star relation of a graph as two NumPy arrays of vertex ids, (left[k], right[k]) being one
+ordered pair of co-stars, every pair appearing once in each direction
+a graph that does not materialize its co-stars pairs every two actors of each movie instead,
+and the distinct pairs are kept
+'''
+def _costar_pairs(arrays):
+    from_actor = arrays.edge_mask(arrays.sources, 'Actor')
+    actor_to_actor = from_actor & arrays.edge_mask(arrays.targets, 'Actor')
+    left = arrays.sources[actor_to_actor].astype(np.int64)
+    right = arrays.targets[actor_to_actor].astype(np.int64)
+    if arrays.graph.materialize_costars:
+        return left, right
+
+    to_movie = from_actor & arrays.edge_mask(arrays.targets, 'Movie')
+    actors = arrays.sources[to_movie]
+    movies = arrays.targets[to_movie]
+
+    # group the cast of each movie together
+    order = np.argsort(movies, kind='stable')
+    actors = actors[order]
+    movies = movies[order]
+    starts = np.searchsorted(movies, movies, side='left')
+    sizes = np.searchsorted(movies, movies, side='right') - starts
+
+    # pair each cast slot with every slot of the same movie
+    cast_left = np.repeat(actors, sizes)
+    offsets_in_group = np.arange(len(cast_left)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    cast_right = actors[np.repeat(starts, sizes) + offsets_in_group]
+    keep = cast_left != cast_right
+
+    n = arrays.graph.num_vertices
+    pairs = np.unique(np.concatenate([cast_left[keep].astype(np.int64) * n + cast_right[keep],
+                                      left * n + right]))
+    return pairs // n, pairs % n
+
+
+'''
+Sums the income of the actors of each age
+:return: list of (age, total income), highest income first
+'''
+def highest_grossing_ages(graph):
+    arrays = _arrays(graph)
+    ids = arrays.ids_of_type('Actor')
+
+    ages, groups = np.unique(arrays.info[ids], return_inverse=True)
+    totals = np.zeros(len(ages), dtype=np.int64)
+    np.add.at(totals, groups, arrays.income[ids])
+
+    # lexsort sorts by the last key first: income, then age
+    order = np.lexsort((ages, totals))[::-1]
+    return [(int(ages[i]), int(totals[i])) for i in order]
+
+
+'''
+Computes a whole ranking of the ones Leaderboards keeps for a Graph
+:param by: 'paid', 'age', 'connections', 'income' or 'age_income'
+:return: list of (actor, score) pairs, or (age, total income) for 'age_income', highest first
+'''
+def get_ranking(graph, by):
+    if by == 'age_income':
+        return highest_grossing_ages(graph)
+
+    arrays = _arrays(graph)
+    if by == 'paid':
+        ids, scores = _paid(arrays)
+    elif by == 'connections':
+        ids, scores = _connections(arrays)
+    elif by == 'age':
+        ids = arrays.ids_of_type('Actor')
+        scores = arrays.info[ids]
+    elif by == 'income':
+        ids = arrays.ids_of_type('Actor')
+        scores = arrays.income[ids]
+    else:
+        raise KeyError(by)
+    return _top(arrays, ids, scores)
@@ -0,0 +1,157 @@
+"""
+Applies a batch of graph mutations, as sent to POST /batch.
+Each operation is a dict with an 'op' key:
+    {'op': 'upsert', 'type': 'Actor' or 'Movie', 'name': ..., 'info': ..., 'income': ...}
+        adds the vertex, or updates its income if a vertex of that type already has the name
+        the info of an existing vertex cannot change, an upsert giving another info is an error
+    {'op': 'income', 'name': ..., 'income': ...}
+        sets the income of an existing vertex
+    {'op': 'delete', 'name': ..., 'type': optional}
+        removes the vertex and its edges
+    {'op': 'edge', 'from': ..., 'to': ..., 'weight': ..., 'costars': optional}
+        adds or re-weights the edge between two existing vertices, as Graph.add_edge does
+        an actor linked to a new movie also gets co-star edges to its cast, see Graph.add_cast_member,
+        unless costars is false
+    {'op': 'unlink', 'from': ..., 'to': ..., 'costars': optional}
+        removes the edge between two existing vertices
+        an actor unlinked from a movie also loses the co-star edges it no longer has a movie for,
+        see Graph.remove_cast_member, unless costars is false
+One bad operation does not stop the batch: every operation gets its own status.
+The batch is applied in one Graph.batch, so the indexes are updated once, when it ends.
+"""
+
+OPERATIONS = ('upsert', 'income', 'delete', 'edge', 'unlink')
+TYPES = ('Actor', 'Movie')
+
+
+class BatchError(Exception):
+    pass
+
+
+def _require(operation, key, kind=None):
+    if key not in operation:
+        raise BatchError('missing ' + key)
+    value = operation[key]
+    if kind is int and (isinstance(value, bool) or not isinstance(value, int)):
+        raise BatchError(key + ' must be an integer')
+    if kind is str and not isinstance(value, str):
+        raise BatchError(key + ' must be a string')
+    return value
+
+
+def _optional_int(operation, key):
+    if operation.get(key) is None:
+        return None
+    return _require(operation, key, int)
+
+
+def _costars(operation):
+    costars = operation.get('costars', True)
+    if not isinstance(costars, bool):
+        raise BatchError('costars must be true or false')
+    return costars
+
+
+def _upsert(graph, operation):
+    type = _require(operation, 'type', str)
+    if type not in TYPES:
+        raise BatchError('type must be Actor or Movie')
+    name = _require(operation, 'name', str)
+    info = _optional_int(operation, 'info')
+    income = _optional_int(operation, 'income')
+
+    if graph.has_vertex(name, type):
+        if info is not None and info != graph.get_vertex(name).get_info():
+            raise BatchError('the info of ' + name + ' cannot change')
+        if income is not None:
+            graph.get_vertex(name).set_income(income)
+        return 'updated'
+    if graph.has_vertex(name):
+        raise BatchError(name + ' already exists with another type')
+
+    graph.add_vertex(name, info or 0, income or 0, type)
+    return 'created'
+
+
+def _income(graph, operation):
+    name = _require(operation, 'name', str)
+    income = _require(operation, 'income', int)
+    v = graph.get_vertex(name)
+    if v is None:
+        return 'not found'
+    v.set_income(income)
+    return 'updated'
+
+
+def _delete(graph, operation):
+    name = _require(operation, 'name', str)
+    type = operation.get('type')
+    if not graph.has_vertex(name, type):
+        return 'not found'
+    graph.remove_vertex(name)
+    return 'deleted'
+
+
+def _edge(graph, operation):
+    frm = _require(operation, 'from', str)
+    to = _require(operation, 'to', str)
+    weight = _optional_int(operation, 'weight') or 0
+    costars = _costars(operation)
+    if not graph.has_vertex(frm) or not graph.has_vertex(to):
+        return 'not found'
+    types = (graph.get_vertex(frm).get_type(), graph.get_vertex(to).get_type())
+    if costars and types == ('Actor', 'Movie'):
+        graph.add_cast_member(frm, to, weight)
+    elif costars and types == ('Movie', 'Actor'):
+        graph.add_cast_member(to, frm, weight)
+    else:
+        graph.add_edge(frm, 0, 0, 'None', to, 0, 0, 'None', weight)
+    return 'linked'
+
+
+def _unlink(graph, operation):
+    frm = _require(operation, 'from', str)
+    to = _require(operation, 'to', str)
+    costars = _costars(operation)
+    if not graph.has_vertex(frm) or not graph.has_vertex(to):
+        return 'not found'
+    types = (graph.get_vertex(frm).get_type(), graph.get_vertex(to).get_type())
+    if costars and types == ('Actor', 'Movie'):
+        unlinked = graph.remove_cast_member(frm, to)
+    elif costars and types == ('Movie', 'Actor'):
+        unlinked = graph.remove_cast_member(to, frm)
+    else:
+        unlinked = graph.remove_edge(frm, to)
+    return 'unlinked' if unlinked else 'not found'
+
+
+APPLY = {
+    'upsert': _upsert,
+    'income': _income,
+    'delete': _delete,
+    'edge': _edge,
+    'unlink': _unlink,
+}
+
+
+'''
+Applies operations to graph in order
+the caller is expected to hold the graph's write lock for the whole batch
+:return: list of {'index', 'op', 'status'} dicts, one per operation, with 'error' set when status is 'error'
+'''
+def apply_batch(graph, operations):
+    with graph.batch():
+        return [_apply(graph, index, operation) for index, operation in enumerate(operations)]
+
+
+def _apply(graph, index, operation):
+    op = operation.get('op') if isinstance(operation, dict) else None
+    result = {'index': index, 'op': op}
+    try:
+        if op not in APPLY:
+            raise BatchError('op must be one of ' + ', '.join(OPERATIONS))
+        result['status'] = APPLY[op](graph, operation)
+    except BatchError as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    return result
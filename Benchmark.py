@@ -0,0 +1,312 @@
+"""
+Benchmarks building the graph, the Graph queries and the api routes on synthetic datasets
+generated at a multiple of the size of data.json.
+
+Generated datasets use the [actors, movies] schema of data.json. Cast sizes follow the
+casts of data.json, and actors are picked for each cast in proportion to a Zipf weight,
+so a few actors appear in many movies and most appear in a few, like the scraped data.
+
+Results are written as JSON so that runs on different commits can be compared:
+    python Benchmark.py --scales 1 10 100 --output before.json
+    python Benchmark.py --scales 1 10 100 --output after.json --compare before.json
+"""
+
+import argparse
+import datetime
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+# size of data.json, which scale 1 matches
+BASE_ACTORS = 309
+BASE_MOVIES = 301
+
+# (cast size, weight) of the movies of data.json that have a cast
+CAST_SIZES = [(2, 8), (3, 9), (4, 27), (5, 21), (6, 32), (7, 15), (8, 8), (9, 5), (10, 6), (12, 2), (13, 1)]
+
+# exponent of the Zipf weight actors are picked with
+ACTOR_SKEW = 0.8
+
+
+'''
+Generates a dataset in the schema of data.json
+:param scale: the dataset has scale times the actors and movies of data.json
+:param seed: seed of the random generator, the same seed always generates the same dataset
+:return: [actors, movies], dicts of name -> record
+'''
+def generate(scale=1, seed=0):
+    rng = random.Random(seed)
+    num_actors = max(2, int(BASE_ACTORS * scale))
+    num_movies = max(1, int(BASE_MOVIES * scale))
+
+    actor_names = ['Actor ' + str(i) for i in range(num_actors)]
+    # shuffle the popularity ranks so that the most cast actors are spread over the name order
+    ranks = list(range(1, num_actors + 1))
+    rng.shuffle(ranks)
+    # cumulative once, choices would otherwise sum the weights of every actor on each call
+    popularity = list(itertools.accumulate(1 / rank ** ACTOR_SKEW for rank in ranks))
+
+    actors = {}
+    for name in actor_names:
+        actors[name] = {
+            'json_class': 'Actor',
+            'name': name,
+            'age': rng.randint(18, 90),
+            'total_gross': int(rng.lognormvariate(17, 2)),
+            'movies': [],
+        }
+
+    sizes = [size for size, weight in CAST_SIZES]
+    weights = [weight for size, weight in CAST_SIZES]
+    movies = {}
+    for i in range(num_movies):
+        name = 'Movie ' + str(i)
+        size = min(rng.choices(sizes, weights)[0], num_actors)
+        # a dict as an ordered set, so that the cast order does not depend on the string hash seed
+        cast = {}
+        while len(cast) < size:
+            cast.update(dict.fromkeys(rng.choices(actor_names, cum_weights=popularity, k=size - len(cast))))
+        cast = list(cast)
+        for actor in cast:
+            actors[actor]['movies'].append(name)
+
+        movies[name] = {
+            'json_class': 'Movie',
+            'name': name,
+            'wiki_page': '',
+            # about a third of the scraped movies have no box office figure
+            'box_office': 0 if rng.random() < 0.3 else int(rng.lognormvariate(17, 1.5)),
+            'year': rng.randint(1950, 2018),
+            'actors': cast,
+        }
+
+    return [actors, movies]
+
+
+'''
+Writes a generated dataset to path as JSON
+'''
+def write_dataset(path, scale=1, seed=0):
+    with open(path, 'w') as file:
+        json.dump(generate(scale, seed), file)
+
+
+'''
+Calls fn repeat times cold, then repeat times warm
+:param reset: called before each cold call, untimed, to drop whatever the previous calls cached
+:return: dict of the first call's time, which includes any lazily built index, and the best and
+mean of the cold calls after it and of the warm calls, all in seconds
+'''
+def time_calls(fn, repeat=5, reset=None):
+    repeat = max(repeat, 1)
+
+    def timed():
+        start = time.perf_counter()
+        fn()
+        return time.perf_counter() - start
+
+    first = timed()
+    cold = []
+    for i in range(repeat - 1):
+        if reset is not None:
+            reset()
+        cold.append(timed())
+    warm = [timed() for i in range(repeat)]
+
+    cold = cold or [first]
+    return {
+        'first': first,
+        'cold_best': min(cold),
+        'cold_mean': statistics.mean(cold),
+        'warm_best': min(warm),
+        'warm_mean': statistics.mean(warm),
+        'repeat': repeat,
+    }
+
+
+# the Graph queries benchmarked, as name -> function of the graph and a few sample names
+def _queries(sample):
+    actor, other_actor, movie, year = sample['actor'], sample['other_actor'], sample['movie'], sample['year']
+    return {
+        'get_top_x_paid_actors': lambda g: g.get_top_x_paid_actors(25),
+        'get_oldest_x_actors': lambda g: g.get_oldest_x_actors(25),
+        'get_hub_actors': lambda g: g.get_hub_actors(),
+        'highest_grossing_ages': lambda g: g.highest_grossing_ages(),
+        'get_actors_by_movie': lambda g: g.get_actors_by_movie(movie),
+        'get_movies_by_actor': lambda g: g.get_movies_by_actor(actor),
+        'get_movies_by_year': lambda g: g.get_movies_by_year(year),
+        'get_actors_by_year': lambda g: g.get_actors_by_year(year),
+        'get_costars': lambda g: g.get_costars(actor),
+        'search_names': lambda g: g.search_names('ctor 1', 'Actor', 100),
+        'page_names': lambda g: g.page_names('Actor', None, 100),
+        'shortest_path': lambda g: g.shortest_path(actor, other_actor),
+    }
+
+
+# the api routes benchmarked, as name -> (method, url)
+def _routes(sample):
+    actor = sample['actor'].replace(' ', '_')
+    other_actor = sample['other_actor'].replace(' ', '_')
+    movie = sample['movie'].replace(' ', '_')
+    return {
+        'GET /actors?limit=100': ('GET', '/actors?limit=100'),
+        'GET /actors': ('GET', '/actors'),
+        'GET /actors?name=': ('GET', '/actors?name=ctor&limit=100'),
+        'GET /actors/top': ('GET', '/actors/top?by=paid&limit=50'),
+        'GET /actors/<name>': ('GET', '/actors/' + actor),
+        'GET /movies/<name>': ('GET', '/movies/' + movie),
+        'GET /path': ('GET', '/path?from=' + actor + '&to=' + other_actor),
+        'PUT /actors/<name>': ('PUT', '/actors/' + actor + '?total_gross=1000'),
+    }
+
+
+# picks the names the queries and routes are run with: the most and the least cast actors that
+# have a movie, and a movie of the first
+def _sample(graph):
+    actors = [a for a in graph.get_actors() if graph.get_movies_by_actor(a)]
+    actors.sort(key=lambda a: (len(graph.get_movies_by_actor(a)), a), reverse=True)
+    movie = graph.get_movies_by_actor(actors[0])[0]
+    return {
+        'actor': actors[0],
+        'other_actor': actors[-1],
+        'movie': movie,
+        'year': graph.get_vertex(movie).get_info(),
+    }
+
+
+'''
+Runs every benchmark on a dataset of one scale
+:return: list of result dicts
+'''
+def run_scale(scale, repeat=5, seed=0, routes=True):
+    import CreateGraph
+
+    results = []
+
+    def record(group, name, timing):
+        results.append(dict(scale=scale, group=group, benchmark=name, **timing))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'data.json')
+        write_dataset(path, scale, seed)
+
+        graphs = []
+        record('build', 'createGraph', time_calls(lambda: graphs.append(CreateGraph.createGraph(path)), repeat))
+        graph = graphs[-1]
+
+    # the cold timings drop what the previous call memoized; the leaderboards and the other indexes
+    # are kept, as the graph keeps them up to date through writes too, and their build is in 'first'
+    sample = _sample(graph)
+    for name, query in _queries(sample).items():
+        record('query', name, time_calls(lambda: query(graph), repeat, graph.clear_caches))
+
+    if routes:
+        # keep the api from loading or logging to a mutation log of its own
+        os.environ['GRAPH_DATA_DIR'] = ''
+        import api
+        api.set_graph(graph)
+        client = api.app.test_client()
+
+        def reset():
+            graph.clear_caches()
+            api.response_cache.clear()
+
+        for name, (method, url) in _routes(sample).items():
+            record('route', name, time_calls(lambda: client.open(url, method=method).get_data(), repeat, reset))
+
+    edges = sum(len(graph.get_vertex(name).get_neighbors()) for name in graph.get_vertices()) // 2
+    for result in results:
+        result['vertices'] = graph.num_vertices
+        result['edges'] = edges
+    return results
+
+
+# the commit the benchmarks ran on, or None outside of a git checkout
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+'''
+Runs the benchmarks at every scale
+:return: the report, a dict of the run's metadata and its results
+'''
+def run(scales=(1, 10, 100), repeat=5, seed=0, routes=True):
+    results = []
+    for scale in scales:
+        results.extend(run_scale(scale, repeat, seed, routes))
+    return {
+        'commit': _commit(),
+        'python': platform.python_version(),
+        'timestamp': datetime.datetime.now().isoformat(),
+        'seed': seed,
+        'results': results,
+    }
+
+
+'''
+Pairs the results of two reports by scale, group and benchmark
+:param timing: the timing compared, 'cold_best' by default
+:return: list of (scale, group, benchmark, old timing, new timing, new timing / old timing)
+results without the timing, such as those of reports from before it was recorded, are skipped
+'''
+def compare(old_report, new_report, timing='cold_best'):
+    old = {(r['scale'], r['group'], r['benchmark']): r for r in old_report['results']}
+    rows = []
+    for r in new_report['results']:
+        key = (r['scale'], r['group'], r['benchmark'])
+        if key in old and timing in old[key] and timing in r:
+            before, after = old[key][timing], r[timing]
+            rows.append(key + (before, after, after / before if before else None))
+    return rows
+
+
+def _print_report(report):
+    for r in report['results']:
+        print('{:>6} {:<6} {:<28} first {:>10.6f}s  cold {:>10.6f}s  warm {:>10.6f}s'.format(
+            r['scale'], r['group'], r['benchmark'], r['first'], r['cold_best'], r['warm_best']))
+
+
+def _print_comparison(rows):
+    for scale, group, benchmark, old_best, new_best, ratio in rows:
+        print('{:>6} {:<6} {:<28} {:>10.6f}s -> {:>10.6f}s  {}'.format(
+            scale, group, benchmark, old_best, new_best, 'n/a' if ratio is None else '{:.2f}x'.format(ratio)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the graph on synthetic datasets')
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100],
+                        help='dataset sizes, as multiples of data.json')
+    parser.add_argument('--repeat', type=int, default=5, help='calls per benchmark')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated datasets')
+    parser.add_argument('--no-routes', action='store_true', help='skip the api route benchmarks')
+    parser.add_argument('--output', default='benchmark.json', help='file the results are written to')
+    parser.add_argument('--compare', help='results of an earlier run to compare against')
+    parser.add_argument('--generate', metavar='PATH', help='only write a dataset of the first scale to PATH')
+    args = parser.parse_args(argv)
+
+    if args.generate:
+        write_dataset(args.generate, args.scales[0], args.seed)
+        return
+
+    report = run(args.scales, args.repeat, args.seed, not args.no_routes)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+    _print_report(report)
+
+    if args.compare:
+        with open(args.compare) as file:
+            _print_comparison(compare(json.load(file), report))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+"""
+Centrality measures of the co-star graph, where the vertices are the actors and two actors are
+adjacent if they worked together: closeness, betweenness and PageRank.
+Closeness and betweenness run one breadth first search per source actor, which is O(V * E) in total,
+so the sources are split across a pool of worker processes. The co-star graph is copied once into a
+shared memory block in CSR form, and every worker maps that block instead of being sent a pickled copy
+of the graph with each task. Each task returns per actor partial sums, which are added up.
+Both measures can also be estimated from a random sample of sources, which scales the cost down
+by the sample size over the number of actors.
+"""
+
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import Analytics
+
+# tasks per worker, more than one so that a worker finishing early picks up more work
+CHUNKS_PER_WORKER = 4
+
+
+'''
+The co-star graph of a Graph or FrozenGraph in CSR form, actors numbered from 0
+the co-stars of actor i are targets[offsets[i]:offsets[i + 1]]
+'''
+class ActorGraph:
+    def __init__(self, graph):
+        arrays = Analytics._arrays(graph)
+        left, right = Analytics._costar_pairs(arrays)
+        start, end = arrays.graph.type_ranges.get('Actor', (0, 0))
+
+        self.num_actors = end - start
+        self.names = [arrays.name(i) for i in range(start, end)]
+        order = np.argsort(left, kind='stable')
+        self.targets = (right[order] - start).astype(np.int32)
+        self.offsets = np.zeros(self.num_actors + 1, dtype=np.int64)
+        np.cumsum(np.bincount(left - start, minlength=self.num_actors), out=self.offsets[1:])
+
+    '''
+    Copies the CSR arrays into a new shared memory block
+    the caller closes and unlinks the block once the workers are done with it
+    '''
+    def share(self):
+        offsets_size = self.offsets.nbytes
+        block = shared_memory.SharedMemory(create=True, size=max(1, offsets_size + self.targets.nbytes))
+        block.buf[:offsets_size] = self.offsets.tobytes()
+        block.buf[offsets_size:offsets_size + self.targets.nbytes] = self.targets.tobytes()
+        return block
+
+
+# the shared CSR arrays of a worker process, set by _attach
+_shared = None
+
+
+# pool initializer: maps the shared memory block of an ActorGraph into the worker
+def _attach(name, num_actors, num_edges):
+    global _shared
+    block = shared_memory.SharedMemory(name=name)
+    offsets_size = 8 * (num_actors + 1)
+    offsets = block.buf[:offsets_size].cast('q')
+    targets = block.buf[offsets_size:offsets_size + 4 * num_edges].cast('i')
+    # keep the block referenced, its buffer is only valid while it is open
+    _shared = (block, offsets, targets)
+
+
+def _run_shared(sources, betweenness):
+    block, offsets, targets = _shared
+    return _run_sources(offsets, targets, sources, betweenness)
+
+
+'''
+Runs a breadth first search from each source
+:param betweenness: if True, also accumulate the Brandes dependencies of every source
+:return: (reached, distances, dependencies) NumPy arrays, where reached[v] counts the sources v was
+reached from, distances[v] sums the distances to v, and dependencies[v] sums the dependencies of
+each source on v, or is None if betweenness was not asked for
+'''
+def _run_sources(offsets, targets, sources, betweenness):
+    n = len(offsets) - 1
+    reached = [0] * n
+    distances = [0] * n
+    dependencies = [0.0] * n if betweenness else None
+
+    for s in sources:
+        dist = [-1] * n
+        dist[s] = 0
+        sigma = [0] * n
+        sigma[s] = 1
+        order = [s]
+        for v in order:
+            next_dist = dist[v] + 1
+            for e in range(offsets[v], offsets[v + 1]):
+                w = targets[e]
+                if dist[w] < 0:
+                    dist[w] = next_dist
+                    order.append(w)
+                if dist[w] == next_dist:
+                    sigma[w] += sigma[v]
+
+        for v in order[1:]:
+            reached[v] += 1
+            distances[v] += dist[v]
+
+        if betweenness:
+            # accumulate dependencies from the farthest vertices back to the source
+            delta = [0.0] * n
+            for v in reversed(order):
+                next_dist = dist[v] + 1
+                for e in range(offsets[v], offsets[v + 1]):
+                    w = targets[e]
+                    if dist[w] == next_dist:
+                        delta[v] += sigma[v] / sigma[w] * (1 + delta[w])
+                if v != s:
+                    dependencies[v] += delta[v]
+
+    return (np.array(reached, dtype=np.int64), np.array(distances, dtype=np.int64),
+            None if dependencies is None else np.array(dependencies))
+
+
+'''
+Runs _run_sources over every source in the pool and adds up the partial results
+:param workers: number of worker processes, or None for one per CPU; with 1 the searches run in this process
+'''
+def _run(actor_graph, sources, betweenness, workers):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(sources) <= 1:
+        return _run_sources(memoryview(actor_graph.offsets), memoryview(actor_graph.targets),
+                            sources, betweenness)
+
+    size = -(-len(sources) // (workers * CHUNKS_PER_WORKER))
+    chunks = [sources[i:i + size] for i in range(0, len(sources), size)]
+
+    block = actor_graph.share()
+    try:
+        with ProcessPoolExecutor(workers, initializer=_attach,
+                                 initargs=(block.name, actor_graph.num_actors, len(actor_graph.targets))) as pool:
+            partials = list(pool.map(_run_shared, chunks, [betweenness] * len(chunks)))
+    finally:
+        block.close()
+        block.unlink()
+
+    reached, distances, dependencies = partials[0]
+    for partial in partials[1:]:
+        reached = reached + partial[0]
+        distances = distances + partial[1]
+        if betweenness:
+            dependencies = dependencies + partial[2]
+    return reached, distances, dependencies
+
+
+# the sources to search from, all the actors or a random sample of them
+def _sources(actor_graph, samples, seed):
+    n = actor_graph.num_actors
+    if samples is None or samples >= n:
+        return list(range(n))
+    return sorted(random.Random(seed).sample(range(n), samples))
+
+
+'''
+Returns (actor, score) pairs, highest score first, ties broken by name in reverse
+as in the Graph reports
+'''
+def _ranked(actor_graph, scores, x=None):
+    ranked = sorted(zip(actor_graph.names, (float(s) for s in scores)), key=lambda f: (f[1], f[0]), reverse=True)
+    return ranked if x is None else ranked[:x]
+
+
+'''
+Closeness centrality of every actor: how close an actor is to the actors it can reach
+an actor reaching r - 1 others at a total distance d scores (r - 1) / d * (r - 1) / (n - 1),
+so that actors in small components do not outscore the well connected ones
+:param x: if given, only the x most central actors are returned
+:param workers: number of worker processes, or None for one per CPU
+:param samples: if given, the distances are estimated from a random sample of this many actors
+:param seed: seed of the random sample
+:return: list of (actor, closeness), most central first
+'''
+def closeness_centrality(graph, x=None, workers=None, samples=None, seed=None):
+    actor_graph = graph if isinstance(graph, ActorGraph) else ActorGraph(graph)
+    n = actor_graph.num_actors
+    sources = _sources(actor_graph, samples, seed)
+    reached, distances, dependencies = _run(actor_graph, sources, False, workers)
+
+    # the sources that could have reached each actor, which excludes the actor itself
+    searched = np.full(n, len(sources), dtype=np.float64)
+    searched[sources] -= 1
+
+    # with every actor as a source, reached and distances are exact and this is the formula above,
+    # otherwise the share of the sample reached stands in for (r - 1) / (n - 1)
+    scores = np.zeros(n)
+    has_distance = distances > 0
+    scores[has_distance] = (reached[has_distance].astype(np.float64) ** 2
+                            / (searched[has_distance] * distances[has_distance]))
+    return _ranked(actor_graph, scores, x)
+
+
+'''
+Betweenness centrality of every actor: the share of the shortest paths between two other actors
+that go through it, computed with Brandes' algorithm
+:param x: if given, only the x most central actors are returned
+:param normalized: if True, scores are divided by the number of pairs of other actors, (n - 1)(n - 2) / 2
+:param workers: number of worker processes, or None for one per CPU
+:param samples: if given, the score is estimated from the shortest paths of a random sample of this many actors
+:param seed: seed of the random sample
+:return: list of (actor, betweenness), most central first
+'''
+def betweenness_centrality(graph, x=None, normalized=True, workers=None, samples=None, seed=None):
+    actor_graph = graph if isinstance(graph, ActorGraph) else ActorGraph(graph)
+    n = actor_graph.num_actors
+    sources = _sources(actor_graph, samples, seed)
+    reached, distances, dependencies = _run(actor_graph, sources, True, workers)
+
+    # every path is found once from each end
+    scores = dependencies / 2
+    if sources and len(sources) < n:
+        scores *= n / len(sources)
+    if normalized and n > 2:
+        scores /= (n - 1) * (n - 2) / 2
+    return _ranked(actor_graph, scores, x)
+
+
+'''
+PageRank of every actor over the co-star graph, by power iteration
+actors without co-stars spread their rank evenly over every actor
+:param damping: probability of following a co-star link rather than jumping to a random actor
+:param tolerance: stop once the ranks change by less than this per actor
+:return: list of (actor, rank), highest first
+'''
+def pagerank(graph, x=None, damping=0.85, tolerance=1e-6, max_iterations=100):
+    actor_graph = graph if isinstance(graph, ActorGraph) else ActorGraph(graph)
+    n = actor_graph.num_actors
+    if n == 0:
+        return []
+
+    degrees = np.diff(actor_graph.offsets)
+    sources = np.repeat(np.arange(n), degrees)
+    targets = actor_graph.targets
+    dangling = degrees == 0
+    share = np.where(dangling, 0, 1 / np.maximum(degrees, 1))
+
+    ranks = np.full(n, 1 / n)
+    for i in range(max_iterations):
+        spread = np.bincount(targets, weights=(ranks * share)[sources], minlength=n)
+        new_ranks = (1 - damping) / n + damping * (spread + ranks[dangling].sum() / n)
+        change = np.abs(new_ranks - ranks).sum()
+        ranks = new_ranks
+        if change < n * tolerance:
+            break
+    return _ranked(actor_graph, ranks, x)
@@ -0,0 +1,429 @@
+"""
+A frozen graph is an immutable, array backed copy of a Graph meant for serving reads.
+Vertex names are interned to integer ids, the type, info and income of each vertex are kept
+in typed arrays, and the edges are stored in compressed sparse row (CSR) form:
+the neighbors of vertex i are targets[offsets[i]:offsets[i + 1]], with the matching edge
+weights at the same positions in weights.
+Vertices are grouped by type, keeping their insertion order within each type,
+so every type occupies one contiguous range of ids.
+A frozen graph answers every read query the api serves (rankings, name searches and pages,
+paths, similar actors and year ranges), building the indexes they need on first use.
+"""
+
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from Leaderboard import Leaderboards
+from LRUCache import LRUCache
+from NameIndex import NameIndex
+from RWLock import RWLock
+from Similarity import SimilarityIndex
+from YearIndex import YearIndex
+
+
+'''
+A read-only view of one vertex of a frozen graph
+exposes the same getters as Vertex so code written against Graph keeps working
+'''
+class FrozenVertex:
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index):
+        self.graph = graph
+        self.index = index
+
+    def __eq__(self, other):
+        return isinstance(other, FrozenVertex) and self.graph is other.graph and self.index == other.index
+
+    def __hash__(self):
+        return self.index
+
+    def __str__(self):
+        return str(self.get_id()) + ' adjacent: ' + str([x.get_id() for x in self.get_neighbors()])
+
+    def get_id(self):
+        return self.graph.names[self.index]
+
+    def get_info(self):
+        return self.graph.info[self.index]
+
+    def get_income(self):
+        return self.graph.income[self.index]
+
+    def set_income(self, income):
+        raise TypeError('a frozen graph is read-only')
+
+    def get_type(self):
+        return self.graph.type_names[self.graph.types[self.index]]
+
+    # returns a list of all the adjacent vertices of the current
+    def get_neighbors(self):
+        g = self.graph
+        return [FrozenVertex(g, g.targets[e]) for e in range(g.offsets[self.index], g.offsets[self.index + 1])]
+
+    # returns the weight of the edge
+    def get_weight(self, neighbor):
+        g = self.graph
+        for e in range(g.offsets[self.index], g.offsets[self.index + 1]):
+            if g.targets[e] == neighbor.index:
+                return g.weights[e]
+        raise KeyError(neighbor.get_id())
+
+
+class FrozenGraph:
+    '''
+    names: sequence of vertex names, indexed by vertex id
+    ids: mapping of vertex name to vertex id
+    type_names: list of the vertex types, indexed by the codes stored in types
+    types, info, income: per vertex typed arrays
+    offsets, targets, weights: CSR adjacency
+    any sequence type supporting integer indexing can back the arrays
+    type_ranges: optional precomputed {type: (start id, end id)}, computed from types if not given
+    materialize_costars: whether the graph stores actor to actor edges, see Graph
+    '''
+    def __init__(self, names, ids, type_names, types, info, income, offsets, targets, weights, type_ranges=None,
+                 materialize_costars=True):
+        self.names = names
+        self.ids = ids
+        self.type_names = list(type_names)
+        self.types = types
+        self.info = info
+        self.income = income
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self.num_vertices = len(types)
+        self.materialize_costars = materialize_costars
+        self.year_index = None
+
+        # the graph never changes, so it stays at one version, which the owner of the graph may set
+        self.version = 0
+        # held by readers like a Graph's lock, so code written against Graph can lock either
+        self.lock = RWLock()
+
+        # indexes built on the first query that needs them
+        # ranking name -> list of (key, score), highest first
+        self.rankings = {}
+        # sorted list of the years that have a movie, and rollup name -> prefix sums over those years
+        self.years = None
+        self.year_totals = None
+        self.name_index = NameIndex()
+        self.similarity = SimilarityIndex()
+        self.path_cache = LRUCache(max_entries=1024)
+        # readers can share the graph, so the builds are serialized
+        self.build_lock = threading.Lock()
+
+        # every type is a contiguous range of ids, store it as type -> (start, end)
+        if type_ranges is None:
+            type_ranges = {}
+            for i in range(self.num_vertices):
+                t = self.type_names[types[i]]
+                type_ranges[t] = (type_ranges[t][0] if t in type_ranges else i, i + 1)
+        self.type_ranges = dict(type_ranges)
+
+    '''
+    Builds a frozen copy of a Graph
+    info and income are stored as 64 bit integers, so they must be integral
+    '''
+    @classmethod
+    def from_graph(cls, graph):
+        type_names = []
+        by_type = {}
+        for v in graph:
+            if v.get_type() not in by_type:
+                type_names.append(v.get_type())
+                by_type[v.get_type()] = []
+            by_type[v.get_type()].append(v)
+
+        vertices = [v for t in type_names for v in by_type[t]]
+        ids = {}
+        for i, v in enumerate(vertices):
+            ids[v.get_id()] = i
+
+        types = array('b')
+        info = array('q')
+        income = array('q')
+        offsets = array('q', [0])
+        targets = array('i')
+        weights = array('q')
+        for code, t in enumerate(type_names):
+            for v in by_type[t]:
+                types.append(code)
+                info.append(int(v.get_info() or 0))
+                income.append(int(v.get_income() or 0))
+                for w in v.get_neighbors():
+                    targets.append(ids[w.get_id()])
+                    weights.append(int(v.get_weight(w) or 0))
+                offsets.append(len(targets))
+
+        names = [v.get_id() for v in vertices]
+        return cls(names, ids, type_names, types, info, income, offsets, targets, weights,
+                   materialize_costars=graph.materialize_costars)
+
+    '''
+    Builds a mutable Graph with the same vertices and edges
+    '''
+    def thaw(self):
+        from Graph import Graph
+        g = Graph(self.materialize_costars)
+        for i in range(self.num_vertices):
+            g.add_vertex(self.names[i], self.info[i], self.income[i], self.type_names[self.types[i]])
+        for i in range(self.num_vertices):
+            v = g.get_vertex(self.names[i])
+            # edges are stored in both directions, link each one once
+            for t, weight in self._edges(i):
+                if t >= i:
+                    g._link(v, g.get_vertex(self.names[t]), weight)
+        return g
+
+    # a frozen graph is its own frozen copy
+    def freeze(self):
+        return self
+
+    def __iter__(self):
+        return (FrozenVertex(self, i) for i in range(self.num_vertices))
+
+    # every vertex is as recent as the graph, see Graph.get_vertex_version
+    def get_vertex_version(self, name):
+        return self.version
+
+    # ids of the vertices of a given type
+    def _ids_of_type(self, type):
+        start, end = self.type_ranges.get(type, (0, 0))
+        return range(start, end)
+
+    # (neighbor id, weight) pairs of a vertex
+    def _edges(self, i):
+        for e in range(self.offsets[i], self.offsets[i + 1]):
+            yield self.targets[e], self.weights[e]
+
+    def _type_of(self, i):
+        return self.type_names[self.types[i]]
+
+    def get_vertex(self, v):
+        i = self.ids.get(v)
+        if i is None:
+            return None
+        return FrozenVertex(self, i)
+
+    def has_vertex(self, name, type=None):
+        i = self.ids.get(name)
+        if i is None:
+            return False
+        return type is None or self._type_of(i) == type
+
+    def get_vertices(self):
+        return [self.names[i] for i in range(self.num_vertices)]
+
+    def get_actors(self):
+        return [self.names[i] for i in self._ids_of_type('Actor')]
+
+    def get_movies(self):
+        return [self.names[i] for i in self._ids_of_type('Movie')]
+
+    def get_gross_income(self, movie):
+        return self.income[self.ids[movie]]
+
+    def get_actors_by_movie(self, movie):
+        return [self.names[t] for t, weight in self._edges(self.ids[movie])]
+
+    def get_movies_by_actor(self, actor):
+        return [self.names[t] for t, weight in self._edges(self.ids[actor]) if weight > 0]
+
+    # year -> ids of the movies released that year
+    # the year index is only needed by year queries, so build it on first use
+    def _year_index(self):
+        if self.year_index is None:
+            year_index = {}
+            for i in self._ids_of_type('Movie'):
+                year_index.setdefault(self.info[i], []).append(i)
+            self.year_index = year_index
+        return self.year_index
+
+    def get_movies_by_year(self, year):
+        return [self.names[i] for i in self._year_index().get(year, ())]
+
+    # sums every rollup of YearIndex per year, stored as prefix sums over the sorted years
+    def _ensure_year_totals(self):
+        if self.year_totals is None:
+            with self.build_lock:
+                if self.year_totals is None:
+                    year_index = self._year_index()
+                    self.years = sorted(year_index)
+                    totals = {rollup: [0] for rollup in YearIndex.ROLLUPS}
+                    for year in self.years:
+                        actors = {}
+                        box_office = 0
+                        for m in year_index[year]:
+                            box_office += self.income[m]
+                            for t, weight in self._edges(m):
+                                if self._type_of(t) == 'Actor':
+                                    actors[t] = None
+                        totals['movies'].append(totals['movies'][-1] + len(year_index[year]))
+                        totals['box_office'].append(totals['box_office'][-1] + box_office)
+                        totals['actors'].append(totals['actors'][-1] + len(actors))
+                    self.year_totals = totals
+
+    # the slice of self.years holding the years from start to end inclusive
+    def _year_bounds(self, start, end):
+        self._ensure_year_totals()
+        first = 0 if start is None else bisect_left(self.years, start)
+        last = len(self.years) if end is None else bisect_right(self.years, end)
+        return first, max(first, last)
+
+    def get_movies_in_range(self, start=None, end=None):
+        first, last = self._year_bounds(start, end)
+        year_index = self._year_index()
+        return [self.names[i] for year in self.years[first:last] for i in year_index[year]]
+
+    def get_year_totals(self, start=None, end=None):
+        first, last = self._year_bounds(start, end)
+        return {rollup: prefix[last] - prefix[first] for rollup, prefix in self.year_totals.items()}
+
+    def get_actors_by_year(self, year):
+        actors = {}
+        for movie in self.get_movies_by_year(year):
+            for t, weight in self._edges(self.ids[movie]):
+                actors[self.names[t]] = None
+        return list(actors)
+
+    def similar_actors(self, name, k=10):
+        return self.similarity.similar(self, name, k)
+
+    def search_names(self, query, type=None, limit=None):
+        return self.name_index.search(self, query, type, limit)
+
+    def page_names(self, type, after=None, limit=None):
+        return self.name_index.page(self, type, after, limit)
+
+    # see Graph.shortest_path, the graph never changes so found paths are cached for good
+    def shortest_path(self, frm, to, movies_only=False, max_depth=None):
+        key = (frm, to, movies_only, max_depth)
+        cached = self.path_cache.get(key)
+        if cached is None:
+            cached = (self._bidirectional_bfs(frm, to, movies_only, max_depth),)
+            self.path_cache.put(key, cached)
+        return None if cached[0] is None else list(cached[0])
+
+    def _bidirectional_bfs(self, frm, to, movies_only, max_depth):
+        start = self.ids.get(frm)
+        goal = self.ids.get(to)
+        if start is None or goal is None:
+            return None
+        if start == goal:
+            return [frm]
+
+        # parents maps each vertex id reached from one end to the id it was reached from
+        parents_start = {start: None}
+        parents_goal = {goal: None}
+        frontier_start = [start]
+        frontier_goal = [goal]
+        depth = 0
+
+        while frontier_start and frontier_goal:
+            if max_depth is not None and depth >= max_depth:
+                return None
+            depth += 1
+
+            # grow the smaller side by one level
+            if len(frontier_start) <= len(frontier_goal):
+                frontier_start, meet = self._expand(frontier_start, parents_start, parents_goal, movies_only)
+            else:
+                frontier_goal, meet = self._expand(frontier_goal, parents_goal, parents_start, movies_only)
+
+            if meet is not None:
+                path = []
+                i = meet
+                while i is not None:
+                    path.append(self.names[i])
+                    i = parents_start[i]
+                path.reverse()
+                i = parents_goal[meet]
+                while i is not None:
+                    path.append(self.names[i])
+                    i = parents_goal[i]
+                return path
+
+        return None
+
+    # visits the neighbors of a frontier, returns the next frontier and
+    # a vertex already reached from the other side, or None if the searches have not met
+    def _expand(self, frontier, parents, other_parents, movies_only):
+        next_frontier = []
+        for i in frontier:
+            for t, weight in self._edges(i):
+                if t in parents:
+                    continue
+                if movies_only and self._type_of(i) != 'Movie' and self._type_of(t) != 'Movie':
+                    continue
+                parents[t] = i
+                if t in other_parents:
+                    return next_frontier, t
+                next_frontier.append(t)
+        return next_frontier, None
+
+    def get_top_x_paid_actors(self, x):
+        incomes = {}
+        for m in self._ids_of_type('Movie'):
+            for t, weight in self._edges(m):
+                incomes[t] = incomes.get(t, 0) + weight
+
+        incomes = sorted(((self.names[t], income) for t, income in incomes.items()),
+                         key=lambda f: (f[1], f[0]), reverse=True)
+        return [item[0] for item in incomes[:x]]
+
+    def get_oldest_x_actors(self, x):
+        ages = [(self.names[i], int(self.info[i])) for i in self._ids_of_type('Actor')]
+        ages.sort(key=lambda f: (f[1], f[0]), reverse=True)
+        return ages[:x]
+
+    # ids of the co-stars of actor i, see Graph.get_costars
+    def _costar_ids(self, i):
+        costars = {}
+        for t, weight in self._edges(i):
+            if self._type_of(t) == 'Actor':
+                costars[t] = None
+            elif self._type_of(t) == 'Movie' and not self.materialize_costars:
+                for costar, costar_weight in self._edges(t):
+                    if costar != i and self._type_of(costar) == 'Actor':
+                        costars[costar] = None
+        return costars
+
+    def get_costars(self, actor):
+        return [self.names[t] for t in self._costar_ids(self.ids[actor])]
+
+    def get_costar_count(self, actor):
+        return len(self._costar_ids(self.ids[actor]))
+
+    def get_hub_actors(self):
+        hub_actors = []
+        for i in self._ids_of_type('Actor'):
+            hub_actors.append((self.names[i], len(self._costar_ids(i))))
+
+        return sorted(hub_actors, key=lambda f: (f[1], f[0]), reverse=True)
+
+    def highest_grossing_ages(self):
+        ages_dict = {}
+        for i in self._ids_of_type('Actor'):
+            age = self.info[i]
+            ages_dict[age] = ages_dict.get(age, 0) + self.income[i]
+
+        return sorted(ages_dict.items(), key=lambda f: (f[1], f[0]), reverse=True)
+
+    # see Graph.get_ranking, the rankings are computed over the arrays by Analytics
+    def get_ranking(self, by, offset=0, limit=None):
+        ranking = self._ranking(by)
+        return ranking[offset:] if limit is None else ranking[offset:offset + limit]
+
+    def get_ranking_size(self, by):
+        return len(self._ranking(by))
+
+    def _ranking(self, by):
+        if by not in Leaderboards.RANKINGS:
+            raise KeyError(by)
+        if by not in self.rankings:
+            with self.build_lock:
+                if by not in self.rankings:
+                    import Analytics
+                    self.rankings[by] = Analytics.get_ranking(self, by)
+        return self.rankings[by]
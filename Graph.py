@@ -3,33 +3,233 @@ The graph is a representation of the Wikipedia scraped data
 where the vertices = movies and actors. There is an edge between an actor an a movie if the actor worked in that movie, with the weight of that edge being the amount the actor made from that movie. There is also an edge from an actor to another actor if they worked on the same movie, with the edge weight being 0.
 """
 
+import logging
 import operator
+from contextlib import contextmanager
 from Vertex import Vertex
+from FrozenGraph import FrozenGraph
+from Leaderboard import Leaderboards
+from LRUCache import LRUCache
+from NameIndex import NameIndex
+from QueryCache import QueryCache
+from RWLock import RWLock
+from Similarity import SimilarityIndex
+from YearIndex import YearIndex
 
 class Graph:
-    def __init__(self):
+    '''
+    :param materialize_costars: if True, actors who worked on the same movie get an actor to actor edge
+    if False, only the actor to movie edges are stored and co-stars are derived from them when asked for,
+    which saves the k^2 edges of every movie with k actors
+    '''
+    def __init__(self, materialize_costars=True):
         self.vertices_dictionary = {}
         self.num_vertices = 0
+        self.materialize_costars = materialize_costars
+
+        # actor name -> number of co-stars, dropped whenever an edge changes the actor's co-stars
+        self.costar_counts = {}
+
+        # secondary indexes, kept up to date by add_vertex and remove_vertex
+        # type_index maps a vertex type to the names of that type
+        # year_index maps a release year to the names of the movies released that year
+        # dicts are used as insertion ordered sets
+        self.type_index = {}
+        self.year_index = {}
+
+        # version is bumped on every change to the graph
+        # vertex_versions maps a vertex name to the graph version it last changed at,
+        # including vertices that have since been removed
+        self.version = 0
+        self.vertex_versions = {}
+
+        # GraphListeners told about every change to the graph
+        self.listeners = []
+        # while a batch is open, name -> Vertex before the batch of every vertex it changed, see batch
+        self.batch_changes = None
+        # the listeners still told about each change while a batch is open
+        self.unbatched_listeners = None
+
+        # recent shortest_path results, stored with the graph version they were found at
+        self.path_cache = LRUCache(max_entries=1024)
+
+        # guards the graph when it is shared between threads
+        # the graph methods do not take it themselves, callers hold lock.read() or lock.write() around them
+        self.lock = RWLock()
+
+        # rankings of the actors, kept up to date as the graph changes
+        self.leaderboards = Leaderboards()
+        self.add_listener(self.leaderboards)
+
+        # n-gram index of the vertex names, for substring searches
+        self.name_index = NameIndex()
+        self.add_listener(self.name_index)
+
+        # memoized results of the per actor, movie and year queries
+        self.query_cache = QueryCache()
+        self.add_listener(self.query_cache)
+
+        # sorted release years with per year rollups, for queries over a range of years
+        self.year_ranges = YearIndex()
+        self.add_listener(self.year_ranges)
+
+        # MinHash signatures of the actors' movie sets, for finding actors with similar filmographies
+        self.similarity = SimilarityIndex()
+        self.add_listener(self.similarity)
 
     def __iter__(self):
         return iter(self.vertices_dictionary.values())
 
+    '''
+    bumps the graph version, and records it as the version of each of the given vertices
+    '''
+    def _touch(self, *names):
+        self.version += 1
+        for name in names:
+            self.vertex_versions[name] = self.version
+
+    '''
+    returns the graph version at which the named vertex last changed, 0 if it never has
+    '''
+    def get_vertex_version(self, name):
+        return self.vertex_versions.get(name, 0)
+
+    '''
+    registers a GraphListener to be told about every change to the graph
+    '''
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    '''
+    Opens a batch of changes: until it closes, the listeners that set BATCHED are not told about each
+    change, they are told once, through batch_changed, about every vertex the batch changed
+    so an index is updated once per vertex, however many changes of the batch touch it
+    a batch opened inside another is part of it
+    '''
+    @contextmanager
+    def batch(self):
+        if self.batch_changes is not None:
+            yield
+            return
+
+        self.batch_changes = {}
+        self.unbatched_listeners = [listener for listener in self.listeners if not listener.BATCHED]
+        try:
+            yield
+        finally:
+            changed = self.batch_changes
+            self.batch_changes = None
+            self.unbatched_listeners = None
+            if changed:
+                for listener in self.listeners:
+                    if listener.BATCHED:
+                        listener.batch_changed(self, changed)
+
+    '''
+    returns the listeners to tell about a change to the given vertices now
+    while a batch is open, the vertices are recorded for the end of the batch instead, each keeping the
+    Vertex it was first recorded with, the one it had before the batch
+    '''
+    def _listeners_for(self, *vertices):
+        if self.batch_changes is None:
+            return self.listeners
+        for v in vertices:
+            self.batch_changes.setdefault(v.get_id(), v)
+        return self.unbatched_listeners
+
+    # _listeners_for a change to the edge between v and w, which may change the co-stars of other actors
+    def _edge_listeners(self, v, w):
+        if self.batch_changes is None:
+            return self.listeners
+        return self._listeners_for(v, w, *self.costars_affected(v, w))
+
+    '''
+    drops the memoized query results: query_cache, path_cache and the co-star counts
+    the indexes kept up to date by the graph events, such as the leaderboards, are kept
+    '''
+    def clear_caches(self):
+        self.query_cache.clear()
+        self.path_cache.clear()
+        self.costar_counts.clear()
+
+    '''
+    returns an immutable, array backed copy of the graph for read-heavy serving
+    the copy answers the same queries as the graph, see FrozenGraph
+    '''
+    def freeze(self):
+        return FrozenGraph.from_graph(self)
+
     '''
     adds vertex to graph
     if vertex is a movie: (movie_title, release year, True)
     if vertex is an actor: (actor name, actor age, False)
+    a vertex that already has the name is removed first, along with its edges
     '''
     def add_vertex(self, name, info=0, income=0, type='None'):
+        if name in self.vertices_dictionary:
+            self.remove_vertex(name)
+
+        if self.batch_changes is not None:
+            # the name had no vertex before the batch, unless remove_vertex recorded it
+            self.batch_changes.setdefault(name, None)
         self.num_vertices = self.num_vertices + 1
         new_vertex = Vertex(name, info, income, type)
+        new_vertex.graph = self
         self.vertices_dictionary[name] = new_vertex
+
+        self.type_index.setdefault(type, {})[name] = None
+        if type == 'Movie':
+            self.year_index.setdefault(info, {})[name] = None
+
+        self._touch(name)
+        for listener in self._listeners_for(new_vertex):
+            listener.vertex_added(self, new_vertex)
         return new_vertex
 
     '''
-    removes vertex from graph
+    removes vertex from graph, along with every edge to it
     '''
     def remove_vertex(self, name):
-        self.vertices_dictionary.pop(name)
+        v = self.vertices_dictionary.pop(name)
+        self.num_vertices = self.num_vertices - 1
+
+        edges = list(v.neighbors.items())
+        v.neighbors = {}
+        for w, weight in edges:
+            w.neighbors.pop(v, None)
+            self._forget_costar_counts(v, w)
+            for listener in self._edge_listeners(v, w):
+                listener.edge_removed(self, v, w, weight)
+
+        self._unindex(self.type_index, v.get_type(), name)
+        if v.get_type() == 'Movie':
+            self._unindex(self.year_index, v.get_info(), name)
+
+        v.graph = None
+        self._touch(name, *[w.get_id() for w, weight in edges])
+        for listener in self._listeners_for(v):
+            listener.vertex_removed(self, v)
+
+    '''
+    called by Vertex.set_income, tells the listeners about the new income
+    '''
+    def income_changed(self, v, old_income):
+        self._touch(v.get_id())
+        for listener in self._listeners_for(v):
+            listener.income_changed(self, v, old_income)
+
+    '''
+    removes name from the bucket stored under key, dropping the bucket once it is empty
+    '''
+    def _unindex(self, index, key, name):
+        bucket = index.get(key)
+        if bucket is not None:
+            bucket.pop(name, None)
+            if not bucket:
+                del index[key]
 
     '''
     :param name
@@ -52,8 +252,189 @@ class Graph:
         if to not in self.vertices_dictionary:
             self.add_vertex(to, to_year, to_income, to_type)
 
-        self.vertices_dictionary[frm].add_neighbor(self.vertices_dictionary[to], weight)
-        self.vertices_dictionary[to].add_neighbor(self.vertices_dictionary[frm], weight)
+        self._link(self.vertices_dictionary[frm], self.vertices_dictionary[to], weight)
+
+    '''
+    removes the edge between two vertices, keeping the vertices
+    :return: True if there was an edge to remove
+    '''
+    def remove_edge(self, frm, to):
+        v = self.vertices_dictionary[frm]
+        w = self.vertices_dictionary[to]
+        if w not in v.neighbors:
+            return False
+
+        weight = v.neighbors.pop(w)
+        w.neighbors.pop(v, None)
+        self._touch(frm, to)
+        self._forget_costar_counts(v, w)
+        for listener in self._edge_listeners(v, w):
+            listener.edge_removed(self, v, w, weight)
+        return True
+
+    '''
+    stores an undirected edge between two vertex objects
+    every edge in the graph is written through here
+    '''
+    def _link(self, v, w, weight):
+        old_weight = v.neighbors.get(w)
+        v.add_neighbor(w, weight)
+        w.add_neighbor(v, weight)
+
+        self._touch(v.get_id(), w.get_id())
+        self._forget_costar_counts(v, w)
+        for listener in self._edge_listeners(v, w):
+            listener.edge_added(self, v, w, old_weight, weight)
+
+    '''
+    returns the actors whose co-stars may have changed because the edge between v and w was added or removed
+    an actor to actor edge changes the co-stars of its two ends
+    without materialized co-stars, an actor to movie edge changes the co-stars of the whole cast of the movie
+    '''
+    def costars_affected(self, v, w):
+        if v.get_type() == 'Actor' and w.get_type() == 'Actor':
+            return [v] if v is w else [v, w]
+        if self.materialize_costars:
+            return []
+
+        if v.get_type() == 'Actor' and w.get_type() == 'Movie':
+            actor, movie = v, w
+        elif v.get_type() == 'Movie' and w.get_type() == 'Actor':
+            actor, movie = w, v
+        else:
+            return []
+
+        affected = {actor: None}
+        for x in movie.get_neighbors():
+            if x.get_type() == 'Actor':
+                affected[x] = None
+        return list(affected)
+
+    def _forget_costar_counts(self, v, w):
+        for actor in self.costars_affected(v, w):
+            self.costar_counts.pop(actor.get_id(), None)
+
+    '''
+    adds a movie and its cast to the graph
+    cast is a list of (actor name, income from the movie, actor age) tuples
+    each actor gets an edge to the movie weighted by their income,
+    and, if co-stars are materialized, each pair of cast members gets a single actor to actor edge of weight 0
+    '''
+    def add_movie_with_cast(self, title, year, box_office, cast):
+        movie = self.add_vertex(title, year, box_office, 'Movie')
+
+        cast_vertices = []
+        for actor, income, age in cast:
+            v = self.vertices_dictionary.get(actor)
+            if v is None:
+                v = self.add_vertex(actor, age, income, 'Actor')
+            self._link(v, movie, income)
+            cast_vertices.append(v)
+
+        if self.materialize_costars:
+            for i in range(len(cast_vertices)):
+                for j in range(i + 1, len(cast_vertices)):
+                    if cast_vertices[i] is not cast_vertices[j]:
+                        self._link(cast_vertices[i], cast_vertices[j], 0)
+
+        return movie
+
+    '''
+    links an actor to a movie, weighted by the actor's income from it
+    an actor new to the cast also gets, if co-stars are materialized, an actor to actor edge of weight 0
+    to every other cast member, as add_movie_with_cast gives them
+    '''
+    def add_cast_member(self, actor, movie, income):
+        v = self.vertices_dictionary[actor]
+        m = self.vertices_dictionary[movie]
+        new = m not in v.neighbors
+        self._link(v, m, income)
+
+        if new and self.materialize_costars:
+            for w in m.get_neighbors():
+                if w.get_type() == 'Actor' and w is not v and w not in v.neighbors:
+                    self._link(v, w, 0)
+
+    '''
+    unlinks an actor from a movie, the reverse of add_cast_member
+    if co-stars are materialized, the actor to actor edges to the cast members the actor no longer
+    shares a movie with are removed too
+    :return: True if the actor was in the cast
+    '''
+    def remove_cast_member(self, actor, movie):
+        v = self.vertices_dictionary[actor]
+        m = self.vertices_dictionary[movie]
+        if m not in v.neighbors:
+            return False
+        cast = [w for w in m.get_neighbors() if w.get_type() == 'Actor' and w is not v]
+        self.remove_edge(actor, movie)
+
+        if self.materialize_costars:
+            for w in cast:
+                if w in v.neighbors and not self.share_a_movie(v, w):
+                    self.remove_edge(actor, w.get_id())
+        return True
+
+    '''
+    removes the co-star edges between the actors of a former cast who no longer share a movie
+    cast is a list of actor names, such as the cast of a movie that was removed or recast
+    '''
+    def unlink_former_costars(self, cast):
+        actors = [self.vertices_dictionary[name] for name in cast if self.has_vertex(name, 'Actor')]
+        for i in range(len(actors)):
+            for j in range(i + 1, len(actors)):
+                v, w = actors[i], actors[j]
+                if w in v.neighbors and not self.share_a_movie(v, w):
+                    self.remove_edge(v.get_id(), w.get_id())
+
+    # whether actors v and w are in the cast of a same movie
+    def share_a_movie(self, v, w):
+        return any(m.get_type() == 'Movie' and v in m.neighbors for m in w.get_neighbors())
+
+    '''
+    Builds a graph in one pass from an iterable of scraped records
+    records are dicts with a json_class of 'Actor' or 'Movie', as yielded by CreateGraph.iter_records
+    actor records must come before the movies that cast them, as they do in data.json
+    only the age and gross of each actor is held back until their movies arrive
+    '''
+    @classmethod
+    def from_records(cls, records, materialize_costars=True):
+        g = cls(materialize_costars)
+        for title, year, box_office, cast in cls.movies_with_casts(records):
+            g.add_movie_with_cast(title, year, box_office, cast)
+        return g
+
+    '''
+    Resolves the casts of the movie records of an iterable of scraped records, see from_records
+    yields (title, year, box office, cast), cast being a list of (actor name, income from that movie, age)
+    '''
+    @staticmethod
+    def movies_with_casts(records):
+        actors = {}
+        for record in records:
+            if record['json_class'] == 'Actor':
+                actors[record['name']] = (record['total_gross'], record['age'])
+                continue
+
+            # like the original scraper, the cast stops at the first unknown actor
+            cast = []
+            for actor in record['actors']:
+                if actor not in actors:
+                    logging.error('actor not found')
+                    break
+                income, age = actors[actor]
+                cast.append((actor, income, age))
+
+            yield record['name'], record['year'], record['box_office'], cast
+
+    '''
+    returns True if the graph has a vertex with the given name
+    if a type is given, the vertex must also be of that type
+    '''
+    def has_vertex(self, name, type=None):
+        if type is None:
+            return name in self.vertices_dictionary
+        return name in self.type_index.get(type, ())
 
     '''
     returns all vertices currently in the graph
@@ -65,25 +446,150 @@ class Graph:
     returns all actors currently in the graph
     '''
     def get_actors(self):
-        actors = []
-        vertices = self.get_vertices()
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Actor':
-                actors.append(v.get_id())
-        return actors
+        return list(self.type_index.get('Actor', ()))
 
     '''
     returns all movies currently in the graph
     '''
     def get_movies(self):
-        movies = []
-        vertices = self.get_vertices()
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Movie':
-                movies.append(v.get_id())
-        return movies
+        return list(self.type_index.get('Movie', ()))
+
+    '''
+    List the actors an actor has worked with
+    these are the actor's actor neighbors, plus, if co-stars are not materialized,
+    the other actors of each of the actor's movies
+    :param: name of actor
+    :return: list of co-star names
+    '''
+    def get_costars(self, actor):
+        return list(self.query_cache.lookup(('costars', actor), (('costars', actor),),
+                                            lambda: self._costars(actor)))
+
+    def _costars(self, actor):
+        v = self.get_vertex(actor)
+        costars = {}
+        for w in v.get_neighbors():
+            if w.get_type() == 'Actor':
+                costars[w] = None
+            elif w.get_type() == 'Movie' and not self.materialize_costars:
+                for costar in w.get_neighbors():
+                    if costar is not v and costar.get_type() == 'Actor':
+                        costars[costar] = None
+        return [w.get_id() for w in costars]
+
+    '''
+    Count the actors an actor has worked with, cached until the actor's co-stars change
+    '''
+    def get_costar_count(self, actor):
+        count = self.costar_counts.get(actor)
+        if count is None:
+            if actor not in self.vertices_dictionary:
+                return 0
+            count = len(self._costars(actor))
+            self.costar_counts[actor] = count
+        return count
+
+    '''
+    Find the actors whose movies are most like the given actor's, see SimilarityIndex
+    approximate: actors are only compared with the candidates their signatures share a bucket with
+    :param k: maximum number of actors
+    :return: list of (actor, Jaccard similarity of their movie sets), most similar first
+    '''
+    def similar_actors(self, name, k=10):
+        return self.similarity.similar(self, name, k)
+
+    '''
+    Find the vertices whose name contains query
+    :param type: 'Actor' or 'Movie' to only search that type, or None for every vertex
+    :param limit: stop after this many matches, or None for all of them
+    :return: list of matching names
+    '''
+    def search_names(self, query, type=None, limit=None):
+        return self.name_index.search(self, query, type, limit)
+
+    '''
+    Page through the names of a type in sorted order
+    :param after: the last name of the previous page, or None for the first page
+    :param limit: maximum number of names, or None for the rest of them
+    :return: list of names
+    '''
+    def page_names(self, type, after=None, limit=None):
+        return self.name_index.page(self, type, after, limit)
+
+    '''
+    Find how two vertices are connected, with the fewest edges
+    searches breadth first from both ends at once, always growing the smaller frontier
+    results are kept in path_cache until the graph changes
+    :param movies_only: only follow actor to movie edges, so actors are linked through the movies they share
+    :param max_depth: give up on paths longer than this many edges, or None for no limit
+    :return: list of vertex names from frm to to, or None if there is no such path
+    '''
+    def shortest_path(self, frm, to, movies_only=False, max_depth=None):
+        key = (frm, to, movies_only, max_depth)
+        cached = self.path_cache.get(key)
+        if cached is not None and cached[0] == self.version:
+            return None if cached[1] is None else list(cached[1])
+
+        path = self._bidirectional_bfs(frm, to, movies_only, max_depth)
+        self.path_cache.put(key, (self.version, path))
+        return None if path is None else list(path)
+
+    def _bidirectional_bfs(self, frm, to, movies_only, max_depth):
+        start = self.get_vertex(frm)
+        goal = self.get_vertex(to)
+        if start is None or goal is None:
+            return None
+        if start is goal:
+            return [frm]
+
+        # parents maps each vertex reached from one end to the vertex it was reached from
+        parents_start = {start: None}
+        parents_goal = {goal: None}
+        frontier_start = [start]
+        frontier_goal = [goal]
+        depth = 0
+
+        while frontier_start and frontier_goal:
+            if max_depth is not None and depth >= max_depth:
+                return None
+            depth += 1
+
+            # grow the smaller side by one level
+            if len(frontier_start) <= len(frontier_goal):
+                frontier_start, meet = self._expand(frontier_start, parents_start, parents_goal, movies_only)
+            else:
+                frontier_goal, meet = self._expand(frontier_goal, parents_goal, parents_start, movies_only)
+
+            if meet is not None:
+                path = []
+                v = meet
+                while v is not None:
+                    path.append(v.get_id())
+                    v = parents_start[v]
+                path.reverse()
+                v = parents_goal[meet]
+                while v is not None:
+                    path.append(v.get_id())
+                    v = parents_goal[v]
+                return path
+
+        return None
+
+    # visits the neighbors of a frontier, returns the next frontier and
+    # a vertex already reached from the other side, or None if the searches have not met
+    def _expand(self, frontier, parents, other_parents, movies_only):
+        next_frontier = []
+        for v in frontier:
+            for w in v.get_neighbors():
+                if w in parents:
+                    continue
+                if movies_only and v.get_type() != 'Movie' and w.get_type() != 'Movie':
+                    continue
+                parents[w] = v
+                if w in other_parents:
+                    return next_frontier, w
+                next_frontier.append(w)
+        return next_frontier, None
 
     '''
     Find how much a movie has grossed
@@ -104,6 +610,10 @@ class Graph:
     :return: list of actors that acted in the given movie
     '''
     def get_actors_by_movie(self, movie):
+        return list(self.query_cache.lookup(('actors_by_movie', movie), (('vertex', movie),),
+                                            lambda: self._actors_by_movie(movie)))
+
+    def _actors_by_movie(self, movie):
         actors = []
         v = self.get_vertex(movie)
         for w in v.get_neighbors():
@@ -117,6 +627,10 @@ class Graph:
     :return: list of all movies the actor acted in
     '''
     def get_movies_by_actor(self, actor):
+        return list(self.query_cache.lookup(('movies_by_actor', actor), (('vertex', actor),),
+                                            lambda: self._movies_by_actor(actor)))
+
+    def _movies_by_actor(self, actor):
         movies = []
         v = self.get_vertex(actor)
         for w in v.get_neighbors():
@@ -132,30 +646,44 @@ class Graph:
     :return: list of all movies released in the given year
     '''
     def get_movies_by_year(self, year):
-        movies = []
-        vertices = self.get_vertices()
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Movie':
-                if v.get_info() == year:
-                    movies.append(vertex)
+        return list(self.year_index.get(year, ()))
 
+    '''
+    List the movies released from start to end, inclusive, earliest year first
+    :param start: first year, or None for the earliest
+    :param end: last year, or None for the latest
+    :return: list of movie names
+    '''
+    def get_movies_in_range(self, start=None, end=None):
+        movies = []
+        for year in self.year_ranges.years_in_range(self, start, end):
+            movies.extend(self.year_index[year])
         return movies
 
+    '''
+    Totals of the movies released from start to end, inclusive, see YearIndex
+    :return: {'movies': number of movies, 'box_office': their summed income,
+              'actors': sum over the years of the distinct actors of each year}
+    '''
+    def get_year_totals(self, start=None, end=None):
+        return self.year_ranges.totals(self, start, end)
+
     '''
     List all the actors for a given year
     :param: string year
     :return: list of all actors who acted in movies released in the given year
     '''
     def get_actors_by_year(self, year):
-        movies = self.get_movies_by_year(year)
-        actors = []
-        for movie in movies:
-            curr_actors = self.get_actors_by_movie(movie)
-            for actor in curr_actors:
-                if actor not in actors:
-                    actors.append(actor)
-        return actors
+        return list(self.query_cache.lookup(('actors_by_year', year), (('year', year),),
+                                            lambda: self._actors_by_year(year)))
+
+    def _actors_by_year(self, year):
+        # dicts are used as insertion ordered sets
+        actors = {}
+        for movie in self.year_index.get(year, ()):
+            for w in self.vertices_dictionary[movie].get_neighbors():
+                actors[w.get_id()] = None
+        return list(actors)
 
     '''
     List the top X actors with the most total grossing value
@@ -163,28 +691,7 @@ class Graph:
     :return: list of highest x grossing income actors
     '''
     def get_top_x_paid_actors(self, x):
-        incomes = {}
-        vertices = self.get_vertices()
-
-        # for each movie, get all actors and add their incomes to the dictionary
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Movie':
-                curr_actors = self.get_actors_by_movie(v.get_id())
-                for c in curr_actors:
-                    actor_vertex = self.get_vertex(c)
-                    if c not in incomes:
-                        incomes[c] = actor_vertex.get_weight(v)
-                    else:
-                        incomes[c] += actor_vertex.get_weight(v)
-
-
-        # sort the dictionary in reverse to get the highest values first
-        incomes = sorted(incomes.items(), key=lambda f: (f[1],f[0]), reverse=True)
-        incomes = [item[0] for item in incomes]
-
-        # return the first x values
-        return incomes[:x]
+        return [name for name, income in self.get_ranking('paid', 0, x)]
 
     '''
     List the oldest X actors
@@ -192,61 +699,31 @@ class Graph:
     :return: list of oldest actors
     '''
     def get_oldest_x_actors(self, x):
-        ages = {}
-        vertices = self.get_vertices()
-
-        # for each movie, get all actors and add their ages to the dictionary
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Actor':
-                c = v.get_id()
-                ages[c] = int(v.get_info())
-
-        # sort the dictionary in reverse to get the highest values first
-        ages = sorted(ages.items(), key=lambda f: (f[1],f[0]), reverse=True)
-
-        # return the first x values
-        return ages[:x]
+        return self.get_ranking('age', 0, x)
 
 
     # returns a dictionary of {actor: # of connections}
     # where # of connections = number of actors they have worked with
     # dictionary is sorted in order of most connections to least
     def get_hub_actors(self):
-        hub_actors = {}
-        vertices = self.get_vertices()
-        connection_count = 0
-
-        # for each actor, find the number of actors in their neighbors list and add to dictionary
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Actor':
-                connection_count = 0
-                connections = v.get_neighbors()
-                for neighbor in connections:
-                    if neighbor.get_type() == 'Actor':
-                        connection_count += 1
-                hub_actors[v.get_id()] = connection_count
-
-        return sorted(hub_actors.items(), key=lambda f: (f[1],f[0]), reverse=True)
+        return self.get_ranking('connections')
 
 
     # returns a dictionary of {age of actor: max income for that age}
     # dictionary is sorted in order of highest income to lowest income
     def highest_grossing_ages(self):
-        ages_dict = {}
-        vertices = self.get_vertices()
-
-        # for each actor, find their grossing income
-        # and then store their age and max income for that age in the dictionary
-        for vertex in vertices:
-            v = self.get_vertex(vertex)
-            if v.get_type() == 'Actor':
-                age = v.get_info()
-                income = v.get_income()
-                if age in ages_dict:
-                    ages_dict[age] += income
-                else:
-                    ages_dict[age] = income
-
-        return sorted(ages_dict.items(), key=lambda f: (f[1], f[0]), reverse=True)
+        return self.get_ranking('age_income')
+
+    '''
+    Page through one of the rankings kept by the graph's Leaderboards
+    :param by: 'paid', 'age', 'connections', 'income' or 'age_income'
+    :param offset: number of entries to skip
+    :param limit: maximum number of entries, or None for the rest of them
+    :return: list of (actor, score) pairs, or (age, total income) for 'age_income', highest first
+    '''
+    def get_ranking(self, by, offset=0, limit=None):
+        return self.leaderboards.page(self, by, offset, limit)
+
+    # number of entries of a ranking, see get_ranking
+    def get_ranking_size(self, by):
+        return self.leaderboards.size(self, by)
@@ -0,0 +1,40 @@
+"""
+A graph listener is told about every change made to a Graph, so that an index or cache
+built from the graph can be kept up to date as the graph changes instead of being rebuilt.
+Listeners are registered with Graph.add_listener and override the events they care about.
+
+A listener that sets BATCHED is not told about the changes made inside Graph.batch as they are
+made: batch_changed is called once, when the batch ends, with every vertex the batch changed.
+"""
+
+class GraphListener:
+    # whether the events of a batch are replaced by one call to batch_changed, see Graph.batch
+    BATCHED = False
+
+    # called after vertex v has been added to the graph
+    def vertex_added(self, graph, v):
+        pass
+
+    # called after vertex v has been removed from the graph
+    # its edges have already been reported through edge_removed
+    def vertex_removed(self, graph, v):
+        pass
+
+    # called after the edge between v and w has been set to weight
+    # old_weight is None if the edge is new, else the weight it replaced
+    def edge_added(self, graph, v, w, old_weight, weight):
+        pass
+
+    # called after the edge between v and w, which had the given weight, has been removed
+    def edge_removed(self, graph, v, w, weight):
+        pass
+
+    # called after the income of vertex v has changed from old_income
+    def income_changed(self, graph, v, old_income):
+        pass
+
+    # called once after a batch, instead of the events above, if BATCHED is set
+    # changed maps the name of every vertex the batch added, removed or changed the edges or income of,
+    # or may have changed the co-stars of, to the Vertex that had the name before the batch, None if none had
+    def batch_changed(self, graph, changed):
+        pass
@@ -0,0 +1,249 @@
+"""
+Hot reload of the scraped data: when data.json changes, the live graph is brought up to date
+by applying what changed in the file, instead of being rebuilt.
+
+The reloader remembers a digest of every movie of the file it last applied (release year, box
+office and resolved cast) and the age and gross of every cast actor. On a reload, the new file is
+streamed and compared with that baseline outside the graph's lock. Only the movies and actors
+that differ are then applied, through add_vertex, add_edge, remove_vertex and remove_edge,
+under the write lock and in one Graph.batch, so readers see the graph either before or after the
+whole reload, and the indexes are updated once per changed vertex.
+The parse costs as much as the file, but the lock is held and the graph changes only in
+proportion to the change. Vertices and edges the file does not mention, such as those added
+through the api, are left alone.
+
+The baseline can be saved and handed to a later reloader (see save_baseline and
+load_baseline), so that a graph restored from elsewhere, such as a GraphStore, catches up
+with the changes made to the file while it was not running.
+
+    reloader = HotReloader(graph, 'data.json')
+    reloader.start()
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import CreateGraph
+import Snapshot
+from Graph import Graph
+
+# seconds between two checks of the source file for changes
+DEFAULT_POLL_INTERVAL = 2.0
+
+
+def _digest(year, box_office, cast):
+    key = json.dumps([year, box_office, [actor for actor, income, age in cast]])
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+
+
+'''
+Reads a baseline saved by HotReloader.save_baseline
+:return: the baseline, to be passed to HotReloader
+'''
+def load_baseline(path):
+    with open(path) as file:
+        saved = json.load(file)
+    return {
+        'checksum': bytes.fromhex(saved['checksum']),
+        'movies': {title: bytes.fromhex(digest) for title, digest in saved['movies'].items()},
+        'actors': {name: tuple(actor) for name, actor in saved['actors'].items()},
+    }
+
+
+'''
+Keeps a graph in step with the data.json style file it was built from
+'''
+class HotReloader:
+    '''
+    :param graph: the Graph, built from path as it is now, or from the file the baseline was read from,
+    None for a reloader only used to read the baseline of the file
+    :param path: the source file
+    :param poll_interval: seconds between two checks of the file, see start
+    :param baseline: what the graph was last brought up to date with, see load_baseline,
+    if None the file as it is now
+    :param on_reload: called with the reloader after each reload, once the baseline is updated
+    '''
+    def __init__(self, graph, path='data.json', poll_interval=DEFAULT_POLL_INTERVAL, baseline=None,
+                 on_reload=None):
+        self.graph = graph
+        self.path = path
+        self.poll_interval = poll_interval
+        self.on_reload = on_reload
+        self.stopped = threading.Event()
+        self.watcher = None
+        # movie title -> digest of the movie, as last applied
+        self.movies = {}
+        # cast actor name -> (gross, age), as last applied
+        self.actors = {}
+        self.stat = self._stat()
+        if baseline is None:
+            baseline = self.diff()
+        # sha256 of the file the baseline was read from
+        self.checksum = baseline['checksum']
+        self.movies, self.actors = baseline['movies'], baseline['actors']
+
+    '''
+    Writes the baseline to path, for load_baseline
+    the file is written next to path and renamed into place
+    '''
+    def save_baseline(self, path):
+        saved = {
+            'checksum': self.checksum.hex(),
+            'movies': {title: digest.hex() for title, digest in self.movies.items()},
+            'actors': {name: list(actor) for name, actor in self.actors.items()},
+        }
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump(saved, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    '''
+    Compares the source file with the baseline
+    :return: dict of
+        'checksum'            sha256 of the file, taken before it is parsed, so a change made meanwhile
+                              is seen again by the next reload
+        'movies', 'actors'    the new baseline
+        'changed_movies'      title -> (year, box office, cast) of the movies added or changed
+        'removed_movies'      titles of the movies no longer in the file
+        'changed_actors'      name -> (gross, age) of the cast actors whose gross or age changed
+        'removed_actors'      names of the actors no longer in any cast
+    '''
+    def diff(self):
+        checksum = Snapshot.file_checksum(self.path)
+        movies = {}
+        actors = {}
+        changed_movies = {}
+        for title, year, box_office, cast in Graph.movies_with_casts(CreateGraph.iter_records(self.path)):
+            digest = _digest(year, box_office, cast)
+            movies[title] = digest
+            if self.movies.get(title) != digest:
+                changed_movies[title] = (year, box_office, cast)
+            for actor, income, age in cast:
+                actors[actor] = (income, age)
+
+        return {
+            'checksum': checksum,
+            'movies': movies,
+            'actors': actors,
+            'changed_movies': changed_movies,
+            'removed_movies': [title for title in self.movies if title not in movies],
+            'changed_actors': {name: actors[name] for name in actors
+                               if name in self.actors and self.actors[name] != actors[name]},
+            'removed_actors': [name for name in self.actors if name not in actors],
+        }
+
+    '''
+    Applies the changes made to the source file since the last reload, if it changed
+    :param force: compare the file with the baseline even if it looks unchanged since the last check
+    :return: number of movies and actors added, changed or removed
+    '''
+    def reload(self, force=False):
+        stat = self._stat()
+        if stat is None or (stat == self.stat and not force):
+            return 0
+        # set first, a file that fails to parse is only read again once it changes
+        self.stat = stat
+        changes = self.diff()
+        with self.graph.lock.write(), self.graph.batch():
+            self.apply(changes)
+        self.checksum, self.movies, self.actors = changes['checksum'], changes['movies'], changes['actors']
+
+        count = sum(len(changes[key]) for key in ('changed_movies', 'removed_movies', 'changed_actors',
+                                                  'removed_actors'))
+        logging.info('Reloaded ' + self.path + ': ' + str(count) + ' movies and actors changed')
+        if self.on_reload is not None:
+            self.on_reload(self)
+        return count
+
+    '''
+    Applies the result of diff to the graph
+    the caller is expected to hold the graph's write lock
+    '''
+    def apply(self, changes):
+        graph = self.graph
+        # casts of the movies removed or recast, whose co-star edges may be stale
+        old_casts = []
+
+        for title in changes['removed_movies']:
+            if graph.has_vertex(title, 'Movie'):
+                old_casts.append(graph.get_actors_by_movie(title))
+                graph.remove_vertex(title)
+
+        for name, (income, age) in changes['changed_actors'].items():
+            if graph.has_vertex(name, 'Actor'):
+                self._update_actor(name, income, age)
+
+        for title, (year, box_office, cast) in changes['changed_movies'].items():
+            v = graph.get_vertex(title) if graph.has_vertex(title, 'Movie') else None
+            if v is not None and v.get_info() == year and \
+                    set(graph.get_actors_by_movie(title)) == {actor for actor, income, age in cast}:
+                if v.get_income() != box_office:
+                    v.set_income(box_office)
+                continue
+            if v is not None:
+                old_casts.append(graph.get_actors_by_movie(title))
+            graph.add_movie_with_cast(title, year, box_office, cast)
+
+        if graph.materialize_costars:
+            for cast in old_casts:
+                graph.unlink_former_costars(cast)
+
+        for name in changes['removed_actors']:
+            if graph.has_vertex(name, 'Actor'):
+                graph.remove_vertex(name)
+
+    '''
+    Gives an actor a new gross and age
+    the edges to the movies that were paid the old gross from the file are paid the new one,
+    a new age re-adds the actor, as the age of a vertex cannot change, and restores its edges
+    '''
+    def _update_actor(self, name, income, age):
+        graph = self.graph
+        v = graph.get_vertex(name)
+        old_income = self.actors[name][0]
+        edges = []
+        for w in v.get_neighbors():
+            weight = v.get_weight(w)
+            if w.get_type() == 'Movie' and weight == old_income:
+                weight = income
+            edges.append((w, weight))
+
+        if v.get_info() != age:
+            graph.add_vertex(name, age, income, 'Actor')
+        else:
+            if v.get_income() != income:
+                v.set_income(income)
+            edges = [(w, weight) for w, weight in edges if weight != v.get_weight(w)]
+        for w, weight in edges:
+            graph.add_edge(name, 0, 0, 'Actor', w.get_id(), 0, 0, 'None', weight)
+
+    '''
+    Starts a thread that reloads the file whenever it changes
+    '''
+    def start(self):
+        self.watcher = threading.Thread(target=self._watch, name='hot-reload', daemon=True)
+        self.watcher.start()
+
+    def _watch(self):
+        while not self.stopped.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception:
+                logging.exception('Reloading ' + self.path + ' failed')
+
+    def close(self):
+        self.stopped.set()
+        if self.watcher is not None:
+            self.watcher.join()
+            self.watcher = None
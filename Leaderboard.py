@@ -0,0 +1,316 @@
+"""
+Leaderboards keep the actor rankings that the graph reports on (top paid, oldest, hub actors,
+income, and total income per age) in sorted order, and update them as the graph changes
+instead of re-ranking every actor on each query.
+Each ranking is a SortedList of (score, key) pairs; the highest ranked entry is the last one,
+which matches the (score, name) reverse order the Graph reports have always used.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from GraphListener import GraphListener
+
+
+'''
+A sorted list split into buckets of at most 2 * LOAD items
+adding or removing an item bisects the bucket maxes and then the bucket, O(log n + LOAD),
+so updates never have to shift the whole list
+'''
+class SortedList:
+    LOAD = 256
+
+    def __init__(self, items=()):
+        items = sorted(items)
+        self.buckets = [items[i:i + self.LOAD] for i in range(0, len(items), self.LOAD)]
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        self.size = len(items)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for bucket in self.buckets:
+            yield from bucket
+
+    def __contains__(self, item):
+        i = bisect_left(self.maxes, item)
+        if i == len(self.maxes):
+            return False
+        bucket = self.buckets[i]
+        j = bisect_left(bucket, item)
+        return j < len(bucket) and bucket[j] == item
+
+    def add(self, item):
+        self.size += 1
+        if not self.buckets:
+            self.buckets.append([item])
+            self.maxes.append(item)
+            return
+
+        i = bisect_left(self.maxes, item)
+        if i == len(self.maxes):
+            i -= 1
+        bucket = self.buckets[i]
+        insort(bucket, item)
+        self.maxes[i] = bucket[-1]
+
+        if len(bucket) > 2 * self.LOAD:
+            self.buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self.maxes[i:i + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+
+    def remove(self, item):
+        i = bisect_left(self.maxes, item)
+        if i < len(self.maxes):
+            bucket = self.buckets[i]
+            j = bisect_left(bucket, item)
+            if j < len(bucket) and bucket[j] == item:
+                del bucket[j]
+                self.size -= 1
+                if bucket:
+                    self.maxes[i] = bucket[-1]
+                else:
+                    del self.buckets[i]
+                    del self.maxes[i]
+                return
+        raise ValueError(repr(item) + ' not in list')
+
+    # number of items less than or equal to item
+    def bisect_right(self, item):
+        i = bisect_right(self.maxes, item)
+        if i == len(self.maxes):
+            return self.size
+        return sum(len(bucket) for bucket in self.buckets[:i]) + bisect_right(self.buckets[i], item)
+
+    '''
+    returns up to limit items starting at position start
+    if reverse, positions count from the largest item and items are returned largest first
+    '''
+    def slice(self, start=0, limit=None, reverse=False):
+        result = []
+        buckets = reversed(self.buckets) if reverse else self.buckets
+        for bucket in buckets:
+            if limit is not None and len(result) >= limit:
+                break
+            if start >= len(bucket):
+                start -= len(bucket)
+                continue
+            items = bucket[::-1] if reverse else bucket
+            end = None if limit is None else start + limit - len(result)
+            result.extend(items[start:end])
+            start = 0
+        return result
+
+
+'''
+The rankings kept for a graph, by name:
+    'paid'        actors by the sum of their movie edge weights, as in get_top_x_paid_actors
+                  only actors with at least one movie are ranked
+    'age'         actors by age, as in get_oldest_x_actors
+    'connections' actors by their number of co-stars (Graph.get_costar_count), as in get_hub_actors
+    'income'      actors by their own income, which PUT /actors/<name> changes
+    'age_income'  ages by the total income of the actors of that age, as in highest_grossing_ages
+The rankings are built from the graph on the first query, then kept up to date by the graph events.
+'''
+class Leaderboards(GraphListener):
+    RANKINGS = ('paid', 'age', 'connections', 'income', 'age_income')
+    BATCHED = True
+
+    def __init__(self):
+        self.rankings = None
+        # readers can share the graph, so the first build is serialized
+        self.build_lock = threading.Lock()
+
+    '''
+    returns (key, score) pairs of a ranking, highest score first
+    :param by: name of the ranking
+    :param offset: number of entries to skip
+    :param limit: maximum number of entries, or None for all of them
+    '''
+    def page(self, graph, by, offset=0, limit=None):
+        if by not in self.RANKINGS:
+            raise KeyError(by)
+        self._ensure_built(graph)
+        return [(key, score) for score, key in self.rankings[by].slice(offset, limit, reverse=True)]
+
+    def size(self, graph, by):
+        self._ensure_built(graph)
+        return len(self.rankings[by])
+
+    def _ensure_built(self, graph):
+        if self.rankings is None:
+            with self.build_lock:
+                if self.rankings is None:
+                    self._build(graph)
+
+    # scans the graph once to compute every ranking from scratch
+    # self.rankings is assigned last, as it marks the rankings as built
+    def _build(self, graph):
+        # name -> [sum of movie edge weights, number of movies]
+        self.paid = {}
+        # name -> number of co-stars
+        self.connections = {}
+        # age -> [total income, number of actors]
+        self.ages = {}
+        # name -> (age, income) the actor is ranked with
+        self.actors = {}
+
+        for name in graph.get_actors():
+            v = graph.get_vertex(name)
+            self.actors[name] = (v.get_info(), v.get_income())
+            for w in v.get_neighbors():
+                if w.get_type() == 'Movie':
+                    paid = self.paid.setdefault(name, [0, 0])
+                    paid[0] += v.get_weight(w)
+                    paid[1] += 1
+            self.connections[name] = graph.get_costar_count(name)
+
+            age = self.ages.setdefault(v.get_info(), [0, 0])
+            age[0] += v.get_income()
+            age[1] += 1
+
+        actors = [graph.get_vertex(name) for name in graph.get_actors()]
+        self.rankings = {
+            'paid': SortedList((paid[0], name) for name, paid in self.paid.items()),
+            'age': SortedList((int(v.get_info()), v.get_id()) for v in actors),
+            'connections': SortedList((count, name) for name, count in self.connections.items()),
+            'income': SortedList((v.get_income(), v.get_id()) for v in actors),
+            'age_income': SortedList((age[0], info) for info, age in self.ages.items()),
+        }
+
+    # moves key from old_score to new_score in a ranking
+    def _rescore(self, by, key, old_score, new_score):
+        ranking = self.rankings[by]
+        if old_score is not None:
+            ranking.remove((old_score, key))
+        if new_score is not None:
+            ranking.add((new_score, key))
+
+    # adds delta actors with delta_income to the total of an age
+    def _update_age(self, info, delta_income, delta_count):
+        age = self.ages.get(info)
+        old_total = None if age is None else age[0]
+        if age is None:
+            age = self.ages[info] = [0, 0]
+        age[0] += delta_income
+        age[1] += delta_count
+
+        new_total = age[0]
+        if age[1] == 0:
+            del self.ages[info]
+            new_total = None
+        self._rescore('age_income', info, old_total, new_total)
+
+    # adds delta to the paid total of an actor, with delta_count movies
+    def _update_paid(self, name, delta, delta_count):
+        paid = self.paid.get(name)
+        old_total = None if paid is None else paid[0]
+        if paid is None:
+            paid = self.paid[name] = [0, 0]
+        paid[0] += delta
+        paid[1] += delta_count
+
+        new_total = paid[0]
+        if paid[1] == 0:
+            del self.paid[name]
+            new_total = None
+        self._rescore('paid', name, old_total, new_total)
+
+    # re-ranks the actors whose co-stars may have changed with the edge between v and w
+    def _update_connections(self, graph, v, w):
+        for actor in graph.costars_affected(v, w):
+            name = actor.get_id()
+            if name in self.connections:
+                old_count = self.connections[name]
+                self.connections[name] = graph.get_costar_count(name)
+                self._rescore('connections', name, old_count, self.connections[name])
+
+    # returns (actor, movie) if the edge joins an actor to a movie, else None
+    def _actor_and_movie(self, v, w):
+        if v.get_type() == 'Actor' and w.get_type() == 'Movie':
+            return v, w
+        if v.get_type() == 'Movie' and w.get_type() == 'Actor':
+            return w, v
+        return None
+
+    def vertex_added(self, graph, v):
+        if self.rankings is None or v.get_type() != 'Actor':
+            return
+        name = v.get_id()
+        self.connections[name] = 0
+        self.rankings['connections'].add((0, name))
+        self._rank_person(name, v.get_info(), v.get_income())
+
+    def vertex_removed(self, graph, v):
+        if self.rankings is None or v.get_type() != 'Actor':
+            return
+        name = v.get_id()
+        self._rescore('connections', name, self.connections.pop(name), None)
+        self._unrank_person(name)
+
+    # ranks an actor by age and income
+    def _rank_person(self, name, age, income):
+        self.actors[name] = (age, income)
+        self.rankings['age'].add((int(age), name))
+        self.rankings['income'].add((income, name))
+        self._update_age(age, income, 1)
+
+    def _unrank_person(self, name):
+        age, income = self.actors.pop(name)
+        self.rankings['age'].remove((int(age), name))
+        self.rankings['income'].remove((income, name))
+        self._update_age(age, -income, -1)
+
+    def edge_added(self, graph, v, w, old_weight, weight):
+        if self.rankings is None:
+            return
+        pair = self._actor_and_movie(v, w)
+        if pair is not None:
+            if old_weight is None:
+                self._update_paid(pair[0].get_id(), weight, 1)
+            else:
+                self._update_paid(pair[0].get_id(), weight - old_weight, 0)
+        if old_weight is None:
+            self._update_connections(graph, v, w)
+
+    def edge_removed(self, graph, v, w, weight):
+        if self.rankings is None:
+            return
+        pair = self._actor_and_movie(v, w)
+        if pair is not None:
+            self._update_paid(pair[0].get_id(), -weight, -1)
+        self._update_connections(graph, v, w)
+
+    def income_changed(self, graph, v, old_income):
+        if self.rankings is None or v.get_type() != 'Actor':
+            return
+        self._rescore('income', v.get_id(), old_income, v.get_income())
+        self._update_age(v.get_info(), v.get_income() - old_income, 0)
+        self.actors[v.get_id()] = (v.get_info(), v.get_income())
+
+    # takes every actor the batch changed out of the rankings, then ranks those still in the graph afresh
+    def batch_changed(self, graph, changed):
+        if self.rankings is None:
+            return
+        for name in changed:
+            if name in self.actors:
+                self._rescore('connections', name, self.connections.pop(name), None)
+                paid = self.paid.pop(name, None)
+                if paid is not None:
+                    self._rescore('paid', name, paid[0], None)
+                self._unrank_person(name)
+
+        for name in changed:
+            v = graph.get_vertex(name)
+            if v is None or v.get_type() != 'Actor':
+                continue
+            paid = [0, 0]
+            for w in v.get_neighbors():
+                if w.get_type() == 'Movie':
+                    paid[0] += v.get_weight(w)
+                    paid[1] += 1
+            if paid[1]:
+                self.paid[name] = paid
+                self._rescore('paid', name, None, paid[0])
+            self.connections[name] = graph.get_costar_count(name)
+            self._rescore('connections', name, None, self.connections[name])
+            self._rank_person(name, v.get_info(), v.get_income())
@@ -0,0 +1,222 @@
+"""
+Opt-in instrumentation of the graph and the api, exposed in the Prometheus text format.
+
+enable() wraps the methods listed in GRAPH_METHODS, on Graph and on FrozenGraph, which the api serves
+reads from, and the snapshot functions listed in SNAPSHOT_FUNCTIONS with timers that record a call count and a latency histogram per method.
+install(app) adds request hooks to a Flask app that record the latency and response size of
+each route, and serves everything recorded at /metrics.
+Until enable() is called nothing is wrapped, so the instrumented code runs exactly as before.
+"""
+
+import functools
+import threading
+import time
+from bisect import bisect_left
+
+# upper bounds of the histogram buckets, in seconds for durations and in bytes for sizes
+DURATION_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Graph and FrozenGraph methods timed once enabled, under the same series for both classes, each class
+# wrapping those it has; the per vertex getters are left out, timing them would cost more than they do
+GRAPH_METHODS = (
+    'from_records', 'add_vertex', 'remove_vertex', 'add_edge', 'add_movie_with_cast', 'freeze', 'thaw',
+    'get_actors_by_movie', 'get_movies_by_actor', 'get_movies_by_year', 'get_actors_by_year',
+    'get_movies_in_range', 'get_year_totals', 'get_top_x_paid_actors', 'get_oldest_x_actors',
+    'get_hub_actors', 'highest_grossing_ages', 'get_ranking', 'get_ranking_size', 'get_costars',
+    'similar_actors', 'search_names', 'page_names', 'shortest_path',
+)
+
+# Snapshot functions timed once enabled, the phases of loading the graph at startup
+SNAPSHOT_FUNCTIONS = ('file_checksum', 'write', 'open_snapshot', 'load_or_build')
+
+
+'''
+A Prometheus style histogram: a count per bucket, the sum of the observed values and their count
+'''
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        # counts[i] is the number of values in bucket i, the last one being +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    # callers hold the registry lock
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+'''
+The metrics recorded in this process
+histograms maps a metric name to (help text, buckets, {label values: Histogram})
+gauges maps a metric name to (help text, function returning the current value)
+'''
+class Registry:
+    def __init__(self):
+        self.histograms = {}
+        self.gauges = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, name, help, buckets):
+        with self.lock:
+            self.histograms.setdefault(name, (help, buckets, {}))
+
+    def gauge(self, name, help, value):
+        with self.lock:
+            self.gauges[name] = (help, value)
+
+    '''
+    Records a value of a histogram
+    :param labels: tuple of (label name, label value) pairs
+    '''
+    def observe(self, name, labels, value):
+        with self.lock:
+            help, buckets, series = self.histograms[name]
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram(buckets)
+            histogram.observe(value)
+
+    def clear(self):
+        with self.lock:
+            for help, buckets, series in self.histograms.values():
+                series.clear()
+
+    '''
+    Returns every metric in the Prometheus text exposition format
+    '''
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (help, buckets, series) in sorted(self.histograms.items()):
+                lines.append('# HELP ' + name + ' ' + help)
+                lines.append('# TYPE ' + name + ' histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(buckets + ('+Inf',), histogram.counts):
+                        cumulative += count
+                        lines.append(name + '_bucket' + _labels(labels + (('le', _number(bound)),)) + ' ' + str(cumulative))
+                    lines.append(name + '_sum' + _labels(labels) + ' ' + _number(histogram.sum))
+                    lines.append(name + '_count' + _labels(labels) + ' ' + str(histogram.count))
+            gauges = sorted(self.gauges.items())
+
+        # gauges are read outside the lock, their functions may take locks of their own
+        for name, (help, value) in gauges:
+            lines.append('# HELP ' + name + ' ' + help)
+            lines.append('# TYPE ' + name + ' gauge')
+            lines.append(name + ' ' + _number(value()))
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    if isinstance(value, str):
+        return value
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+registry = Registry()
+registry.histogram('graph_method_duration_seconds', 'Time spent in Graph and FrozenGraph methods.', DURATION_BUCKETS)
+registry.histogram('snapshot_duration_seconds', 'Time spent loading and writing graph snapshots.', DURATION_BUCKETS)
+registry.histogram('http_request_duration_seconds', 'Time spent handling requests, until the response '
+                   'is returned; streamed bodies are not included.', DURATION_BUCKETS)
+registry.histogram('http_response_size_bytes', 'Size of response bodies, streamed bodies excluded.', SIZE_BUCKETS)
+
+# (owner, attribute name, original attribute) of everything enable() wrapped
+_wrapped = []
+_wrapped_lock = threading.Lock()
+
+
+'''
+Returns fn wrapped to record its duration in a histogram under the label ('method', label)
+'''
+def timed(fn, metric, label):
+    labels = (('method', label),)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            registry.observe(metric, labels, time.perf_counter() - start)
+    return wrapper
+
+
+def _wrap(owner, name, metric):
+    original = owner.__dict__[name]
+    if isinstance(original, classmethod):
+        wrapped = classmethod(timed(original.__func__, metric, name))
+    else:
+        wrapped = timed(original, metric, name)
+    setattr(owner, name, wrapped)
+    _wrapped.append((owner, name, original))
+
+
+def enabled():
+    return bool(_wrapped)
+
+
+'''
+Starts timing the Graph and FrozenGraph methods and the snapshot functions
+'''
+def enable():
+    from FrozenGraph import FrozenGraph
+    from Graph import Graph
+    import Snapshot
+
+    with _wrapped_lock:
+        if _wrapped:
+            return
+        for owner in (Graph, FrozenGraph):
+            for name in GRAPH_METHODS:
+                if name in owner.__dict__:
+                    _wrap(owner, name, 'graph_method_duration_seconds')
+        for name in SNAPSHOT_FUNCTIONS:
+            _wrap(Snapshot, name, 'snapshot_duration_seconds')
+
+
+'''
+Restores the methods and functions enable() wrapped, what was recorded is kept
+'''
+def disable():
+    with _wrapped_lock:
+        while _wrapped:
+            owner, name, original = _wrapped.pop()
+            setattr(owner, name, original)
+
+
+'''
+Records the latency and response size of every request to a Flask app, and serves the metrics at /metrics
+'''
+def install(app):
+    from flask import Response, g, request
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        start = g.pop('metrics_start', None)
+        if start is not None:
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            labels = (('method', request.method), ('route', route), ('status', str(response.status_code)))
+            registry.observe('http_request_duration_seconds', labels, time.perf_counter() - start)
+            if not response.is_streamed and response.content_length is not None:
+                registry.observe('http_response_size_bytes', labels[:2], response.content_length)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
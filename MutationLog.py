@@ -0,0 +1,431 @@
+"""
+A write-ahead log of the changes made to a graph, so that edits survive a restart.
+
+A GraphStore keeps a directory holding a snapshot of the graph (see Snapshot) and the log
+segments of every change made since that snapshot. The MutationLog listens to the graph
+and appends each change as one JSON line, in the operation format of Batch, so the log is
+replayed with Batch.apply_batch. Each edge is logged on its own, so replaying applies exactly
+the changes that were logged. Appends are only written to the OS; a background thread
+fsyncs the log every sync_interval seconds, so writers never wait on the disk and a crash
+loses at most the last sync_interval of edits.
+
+Once a log has grown past compact_after records, it is folded into a new snapshot in the
+background and a new segment is started. Loading maps the last snapshot, as a FrozenGraph, and
+reads the log segments made since. Replaying needs a Graph, and thawing one costs as much as
+building the graph, so the snapshot is only thawed when there is something to replay, or on the
+first write (see mutable): a store loaded right after a compaction starts in the time of a mapping.
+
+The manifest file names the current snapshot and log segments, and the checksum and stat of the
+source file the store last caught up with. It is replaced atomically, and a segment is listed
+before anything is written to it, so the files it names always hold every change.
+
+The store also keeps the HotReload baseline of that source file. When the source has changed
+since, loading applies the difference to the graph, as a hot reload would, so edits made to
+data.json are not hidden by the store and edits made through the api are not lost. The source is
+only read when its stat differs from the one in the manifest.
+
+Only one process may use a store at a time: the directory is locked while the store is loaded.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+import Batch
+import HotReload
+import Snapshot
+from FrozenGraph import FrozenGraph
+from GraphListener import GraphListener
+
+try:
+    import fcntl
+except ImportError:
+    # not on Windows, where the single process rule is not enforced
+    fcntl = None
+
+MANIFEST = 'manifest.json'
+BASELINE = 'baseline.json'
+LOCK = 'lock'
+
+# seconds between two fsyncs of the log
+DEFAULT_SYNC_INTERVAL = 0.05
+
+# log records after which the log is folded into a new snapshot
+DEFAULT_COMPACT_AFTER = 100000
+
+
+class StoreLockedError(Exception):
+    pass
+
+
+def _fsync_directory(directory):
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+'''
+Appends the changes made to a graph to a log file, one Batch operation per line
+every record also carries a 'seq' number, counting up across segments
+the edges removed along with a vertex are not logged, replaying the vertex's delete removes them,
+only the edges removed on their own are logged, as unlink operations
+edges are logged with costars false, the co-star edges a change made are logged as edges of their own
+'''
+class MutationLog(GraphListener):
+    def __init__(self, path, sequence=0):
+        self.path = path
+        self.file = open(path, 'a', encoding='utf-8')
+        self.sequence = sequence
+        self.records = 0
+        self.dirty = False
+        # guards the file and sequence, held briefly by each append
+        self.lock = threading.Lock()
+        # held while the file is fsynced or swapped, so that neither happens on a closed file
+        self.sync_lock = threading.Lock()
+
+    def append(self, operation):
+        with self.lock:
+            self.sequence += 1
+            operation['seq'] = self.sequence
+            self.file.write(json.dumps(operation) + '\n')
+            self.records += 1
+            self.dirty = True
+
+    '''
+    Makes every record appended so far durable
+    the records are handed to the OS under the append lock, and fsynced outside it
+    '''
+    def sync(self):
+        with self.sync_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                self.file.flush()
+                self.dirty = False
+            os.fsync(self.file.fileno())
+
+    '''
+    Syncs the current file, then appends to the file at path from now on
+    '''
+    def rotate(self, path):
+        with self.sync_lock:
+            with self.lock:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
+                self.path = path
+                self.file = open(path, 'a', encoding='utf-8')
+                self.records = 0
+                self.dirty = False
+
+    def close(self):
+        self.sync()
+        with self.sync_lock:
+            self.file.close()
+
+    def vertex_added(self, graph, v):
+        self.append({'op': 'upsert', 'type': v.get_type(), 'name': v.get_id(),
+                     'info': int(v.get_info() or 0), 'income': int(v.get_income() or 0)})
+
+    def vertex_removed(self, graph, v):
+        self.append({'op': 'delete', 'name': v.get_id()})
+
+    def edge_added(self, graph, v, w, old_weight, weight):
+        self.append({'op': 'edge', 'from': v.get_id(), 'to': w.get_id(), 'weight': int(weight or 0),
+                     'costars': False})
+
+    def edge_removed(self, graph, v, w, weight):
+        # remove_vertex takes the vertex out of the graph before reporting its edges
+        if graph.has_vertex(v.get_id()) and graph.has_vertex(w.get_id()):
+            self.append({'op': 'unlink', 'from': v.get_id(), 'to': w.get_id(), 'costars': False})
+
+    def income_changed(self, graph, v, old_income):
+        self.append({'op': 'income', 'name': v.get_id(), 'income': int(v.get_income() or 0)})
+
+
+'''
+Reads the records of a log segment
+a crash can leave the last line half written, reading stops at the first line that is not complete
+:return: (list of records, byte length of the complete lines)
+'''
+def read_log(path):
+    records = []
+    length = 0
+    try:
+        with open(path, 'rb') as file:
+            for line in file:
+                try:
+                    if not line.endswith(b'\n'):
+                        raise ValueError('no line end')
+                    records.append(json.loads(line))
+                except ValueError:
+                    logging.warning('Ignoring the torn end of mutation log ' + path)
+                    break
+                length += len(line)
+    except FileNotFoundError:
+        pass
+    return records, length
+
+
+class GraphStore:
+    '''
+    :param directory: where the snapshots, log segments and manifest are kept, created if missing
+    :param source: data.json style file the first snapshot is built from
+    :param source_snapshot: snapshot of source, see Snapshot.load_or_build
+    '''
+    def __init__(self, directory, source='data.json', source_snapshot='data.snapshot',
+                 sync_interval=DEFAULT_SYNC_INTERVAL, compact_after=DEFAULT_COMPACT_AFTER):
+        self.directory = directory
+        self.source = source
+        self.source_snapshot = source_snapshot
+        self.sync_interval = sync_interval
+        self.compact_after = compact_after
+        # the FrozenGraph of the snapshot until the first write or replay, then the thawed Graph
+        self.graph = None
+        self.log = None
+        self.manifest = None
+        # the HotReloader holding the baseline of source, made by get_reloader
+        self.reloader = None
+        self.compacting = False
+        self.stopped = threading.Event()
+        self.flusher = None
+        self.compaction = None
+        self.lock_file = None
+        # serializes the changes to the manifest made by compactions and reloads
+        self.manifest_lock = threading.Lock()
+        # serializes thawing the snapshot
+        self.thaw_lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    # takes the lock on the directory, creating it if missing
+    def _lock_directory(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock_file = open(self._path(LOCK), 'a')
+        if fcntl is None:
+            return
+        try:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            raise StoreLockedError(self.directory + ' is used by another process')
+
+    def _write_manifest(self, manifest):
+        tmp_path = self._path(MANIFEST + '.tmp')
+        with open(tmp_path, 'w') as file:
+            json.dump(manifest, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self._path(MANIFEST))
+        _fsync_directory(self.directory)
+        self.manifest = manifest
+
+    # writes the manifest with some of its entries changed
+    def _update_manifest(self, **changes):
+        with self.manifest_lock:
+            self._write_manifest(dict(self.manifest, **changes))
+
+    # the manifest of the directory, creating its first snapshot and baseline if needed
+    def _read_manifest(self):
+        try:
+            with open(self._path(MANIFEST)) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            pass
+
+        while True:
+            baseline = HotReload.HotReloader(None, self.source)
+            Snapshot.load_or_build(self.source, self.source_snapshot)
+            # the snapshot must be of the file the baseline was read from, which could have changed meanwhile
+            if Snapshot.read_checksum(self.source_snapshot) == baseline.checksum:
+                break
+        shutil.copyfile(self.source_snapshot, self._path('snapshot-0'))
+        baseline.save_baseline(self._path(BASELINE))
+        manifest = {'sequence': 0, 'snapshot': 'snapshot-0', 'logs': ['log-0.jsonl'],
+                    'source_checksum': baseline.checksum.hex(), 'source_stat': list(baseline.stat)}
+        self._write_manifest(manifest)
+        return manifest
+
+    '''
+    Loads the graph: maps the last snapshot, replays the log segments made since, and starts
+    logging the changes made to the graph from now on
+    then applies the changes made to source since the store last caught up with it, see HotReload
+    the snapshot is only thawed if there is something to replay or apply, see mutable
+    :param start: start the thread that syncs the log, else start has to be called, such as by a
+    process that forks before starting threads
+    :return: the FrozenGraph of the snapshot, or the Graph it was thawed into
+    :raises StoreLockedError: if another process has loaded the store
+    '''
+    def load(self, start=True):
+        self._lock_directory()
+        manifest = self._read_manifest()
+        self.manifest = manifest
+        self.graph = Snapshot.open_snapshot(self._path(manifest['snapshot']))
+
+        sequence = manifest['sequence']
+        replay = []
+        for name in manifest['logs']:
+            records, length = read_log(self._path(name))
+            if os.path.exists(self._path(name)) and os.path.getsize(self._path(name)) > length:
+                # drop a torn last line, so that new records start on a line of their own
+                os.truncate(self._path(name), length)
+            replay.extend(r for r in records if r.get('seq', 0) > sequence)
+        if replay:
+            sequence = replay[-1]['seq']
+
+        self.log = MutationLog(self._path(manifest['logs'][-1]), sequence)
+        self.log.records = len(replay)
+        if replay:
+            self.mutable(replay)
+        logging.info('Replayed ' + str(len(replay)) + ' mutations over ' + manifest['snapshot'])
+
+        self._catch_up_with_source()
+        if start:
+            self.start()
+        return self.graph
+
+    '''
+    Returns the graph as a mutable Graph, thawing the snapshot on the first call
+    the Graph keeps the snapshot's lock, and the changes made to it from then on are logged
+    the caller is expected to hold the graph's write lock, or to be the only user of the graph
+    :param replay: log records applied to the thawed Graph before its changes are logged
+    '''
+    def mutable(self, replay=()):
+        with self.thaw_lock:
+            if isinstance(self.graph, FrozenGraph):
+                graph = self.graph.thaw()
+                graph.lock = self.graph.lock
+                for result in Batch.apply_batch(graph, replay):
+                    if result['status'] == 'error':
+                        logging.error('Could not replay ' + json.dumps(replay[result['index']]) + ': ' +
+                                      result['error'])
+                graph.add_listener(self.log)
+                self.graph = graph
+        return self.graph
+
+    '''
+    Starts the thread that syncs the log every sync_interval and starts compactions, see load
+    until then, changes are only made durable by close
+    '''
+    def start(self):
+        self.flusher = threading.Thread(target=self._flush_loop, name='mutation-log-flusher', daemon=True)
+        self.flusher.start()
+
+    '''
+    Returns the HotReloader that keeps the graph in step with source and the baseline of the store saved,
+    making it, and thawing the graph, on the first call
+    '''
+    def get_reloader(self):
+        if self.reloader is None:
+            graph = self.mutable()
+            if os.path.exists(self._path(BASELINE)):
+                self.reloader = HotReload.HotReloader(graph, self.source,
+                                                      baseline=HotReload.load_baseline(self._path(BASELINE)),
+                                                      on_reload=self._source_reloaded)
+            else:
+                # a store made before baselines were kept, the source as it is now is taken as applied
+                logging.warning('No baseline of ' + self.source + ' in ' + self.directory + ', starting one')
+                self.reloader = HotReload.HotReloader(graph, self.source, on_reload=self._source_reloaded)
+                self._source_reloaded(self.reloader)
+        return self.reloader
+
+    # applies the changes made to source since the store last caught up with it, logging them like any other
+    # the file is only read if its stat changed, and only applied if its checksum changed too
+    def _catch_up_with_source(self):
+        try:
+            stat = os.stat(self.source)
+        except FileNotFoundError:
+            return
+        stat = [stat.st_mtime_ns, stat.st_size]
+        if stat == self.manifest.get('source_stat'):
+            return
+        if not os.path.exists(self._path(BASELINE)):
+            self.get_reloader()
+        elif Snapshot.file_checksum(self.source).hex() == self.manifest.get('source_checksum'):
+            # touched, not changed
+            self._update_manifest(source_stat=stat)
+        else:
+            self.get_reloader().reload(force=True)
+
+    '''
+    Records that the graph caught up with the source file, after a reload applied its changes
+    the changes are made durable first, then the baseline, then the checksum in the manifest,
+    so a crash in between only makes the next load compare the file with the baseline again
+    '''
+    def _source_reloaded(self, reloader):
+        self.log.sync()
+        reloader.save_baseline(self._path(BASELINE))
+        self._update_manifest(source_checksum=reloader.checksum.hex(), source_stat=list(reloader.stat))
+
+    def _flush_loop(self):
+        while not self.stopped.wait(self.sync_interval):
+            try:
+                self.log.sync()
+                if self.log.records >= self.compact_after and not self.compacting:
+                    self.compacting = True
+                    self.compaction = threading.Thread(target=self.compact, name='mutation-log-compaction',
+                                                       daemon=True)
+                    self.compaction.start()
+            except Exception:
+                logging.exception('Mutation log flusher failed')
+
+    '''
+    Folds the log into a new snapshot
+    the graph is frozen under its read lock, which also starts the new log segment at exactly that state;
+    the snapshot is written and the old files removed after the lock is released
+    '''
+    def compact(self):
+        try:
+            old = self.manifest
+            with self.graph.lock.read():
+                # readers hold off writers, so no change is logged while the graph is frozen
+                frozen = self.graph.freeze()
+                sequence = self.log.sequence
+                snapshot = 'snapshot-' + str(sequence)
+                log = 'log-' + str(sequence) + '.jsonl'
+                # list the new segment before writing to it, a crash now replays both segments
+                self._update_manifest(logs=old['logs'] + [log])
+                self.log.rotate(self._path(log))
+
+            Snapshot.write(frozen, self._path(snapshot))
+            _fsync_directory(self.directory)
+            self._update_manifest(sequence=sequence, snapshot=snapshot, logs=[log])
+
+            for name in [old['snapshot']] + old['logs']:
+                if name != snapshot and name != log:
+                    try:
+                        os.remove(self._path(name))
+                    except FileNotFoundError:
+                        pass
+            logging.info('Compacted the mutation log into ' + snapshot)
+        finally:
+            self.compacting = False
+
+    '''
+    Stops the background sync and makes every logged change durable, changes made after are not logged
+    then releases the directory
+    '''
+    def close(self):
+        if self.reloader is not None:
+            self.reloader.close()
+        self.stopped.set()
+        if self.flusher is not None:
+            self.flusher.join()
+            self.flusher = None
+        if self.compaction is not None:
+            self.compaction.join()
+            self.compaction = None
+        if self.log is not None:
+            if not isinstance(self.graph, FrozenGraph):
+                self.graph.remove_listener(self.log)
+            self.log.close()
+            self.log = None
+        if self.lock_file is not None:
+            # closing the file releases the lock
+            self.lock_file.close()
+            self.lock_file = None
@@ -0,0 +1,150 @@
+"""
+The name index answers substring searches over vertex names without scanning every vertex.
+Every name is indexed under each distinct substring of up to 3 characters (its n-grams).
+A query of up to 3 characters is a single posting lookup. A longer query intersects the
+postings of its trigrams, starting from the smallest, and checks each candidate really
+contains the query.
+The names of each type are also kept in sorted order, so that listings can be paged by name.
+"""
+
+import threading
+from GraphListener import GraphListener
+from Leaderboard import SortedList
+
+GRAM_SIZE = 3
+
+
+'''
+returns the distinct substrings of name of length 1 to GRAM_SIZE
+'''
+def ngrams(name):
+    grams = set()
+    for size in range(1, GRAM_SIZE + 1):
+        for i in range(len(name) - size + 1):
+            grams.add(name[i:i + size])
+    return grams
+
+
+class NameIndex(GraphListener):
+    BATCHED = True
+
+    def __init__(self):
+        # type -> gram -> names containing that gram, dicts are used as insertion ordered sets
+        self.postings = None
+        # type -> names of that type
+        self.names = None
+        # type -> SortedList of the names of that type, for paging in name order
+        self.sorted_names = None
+        # readers can share the graph, so the first build is serialized
+        self.build_lock = threading.Lock()
+
+    def _ensure_built(self, graph):
+        if self.postings is None:
+            with self.build_lock:
+                if self.postings is None:
+                    self._build(graph)
+
+    # indexes every vertex of the graph
+    # self.postings is assigned last, as it marks the index as built
+    def _build(self, graph):
+        postings = {}
+        self.names = {}
+        for v in graph:
+            self._add(v.get_type(), v.get_id(), postings)
+        self.sorted_names = {type: SortedList(names) for type, names in self.names.items()}
+        self.postings = postings
+
+    def _add(self, type, name, postings=None):
+        if postings is None:
+            postings = self.postings
+        self.names.setdefault(type, {})[name] = None
+        postings = postings.setdefault(type, {})
+        for gram in ngrams(name):
+            postings.setdefault(gram, {})[name] = None
+
+    def _remove(self, type, name):
+        self.names.get(type, {}).pop(name, None)
+        postings = self.postings.get(type, {})
+        for gram in ngrams(name):
+            names = postings.get(gram)
+            if names is not None:
+                names.pop(name, None)
+                if not names:
+                    del postings[gram]
+
+    '''
+    Finds the names containing query
+    :param type: only search vertices of this type, or every type if None
+    :param limit: stop after this many matches, or None for all of them
+    :return: list of matching names
+    '''
+    def search(self, graph, query, type=None, limit=None):
+        self._ensure_built(graph)
+
+        types = list(self.postings) if type is None else [type]
+        matches = []
+        for t in types:
+            if limit is not None and len(matches) >= limit:
+                break
+            matches.extend(self._search_type(t, query, None if limit is None else limit - len(matches)))
+        return matches
+
+    def _search_type(self, type, query, limit):
+        postings = self.postings.get(type, {})
+        if not query:
+            # every name contains the empty string
+            candidates = [self.names.get(type, {})]
+        elif len(query) <= GRAM_SIZE:
+            candidates = [postings.get(query, {})]
+        else:
+            grams = {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}
+            candidates = sorted((postings.get(gram, {}) for gram in grams), key=len)
+        others = candidates[1:]
+
+        matches = []
+        for name in candidates[0]:
+            if limit is not None and len(matches) >= limit:
+                break
+            if all(name in names for names in others) and query in name:
+                matches.append(name)
+        return matches
+
+    '''
+    Returns the names of a type in sorted order, starting after a given name
+    :param after: only names greater than this are returned, or None to start at the first name
+    :param limit: maximum number of names, or None for the rest of them
+    '''
+    def page(self, graph, type, after=None, limit=None):
+        self._ensure_built(graph)
+
+        names = self.sorted_names.get(type)
+        if names is None:
+            return []
+        start = 0 if after is None else names.bisect_right(after)
+        return names.slice(start, limit)
+
+    def vertex_added(self, graph, v):
+        if self.postings is not None:
+            self._add(v.get_type(), v.get_id())
+            self.sorted_names.setdefault(v.get_type(), SortedList()).add(v.get_id())
+
+    def vertex_removed(self, graph, v):
+        if self.postings is not None:
+            self._remove(v.get_type(), v.get_id())
+            self.sorted_names[v.get_type()].remove(v.get_id())
+
+    # only the names and types of the vertices are indexed, so a name is only reindexed if the batch
+    # added or removed it, or gave it to a vertex of another type
+    def batch_changed(self, graph, changed):
+        if self.postings is None:
+            return
+        for name in changed:
+            v = graph.get_vertex(name)
+            new_type = None if v is None else v.get_type()
+            for type, names in list(self.names.items()):
+                if type != new_type and name in names:
+                    self._remove(type, name)
+                    self.sorted_names[type].remove(name)
+            if new_type is not None and name not in self.names.get(new_type, {}):
+                self._add(new_type, name)
+                self.sorted_names.setdefault(new_type, SortedList()).add(name)
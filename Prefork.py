@@ -0,0 +1,307 @@
+"""
+Pre-forked serving: the graph is loaded once, by a master process, and N forked workers
+answer requests on a shared listening socket.
+
+The master imports api, so it alone builds or loads the mutable Graph, and it serves api.app on a
+private local port as the owner of the graph. Before forking, it publishes the graph as a
+snapshot file (see Snapshot), indexes included. Each worker maps the snapshot read-only, so every
+worker reads the same page cache pages, for the graph and for its name postings, rankings,
+similarity bands and year totals alike. Those pages hold flat arrays rather than Python objects,
+so reading them never writes reference counts and never copies a page, and no worker builds an index.
+
+api is imported with GRAPH_DEFER_THREADS set, so no thread runs when the master forks: the mutation
+log flusher and the hot reloader, like the owner's server and the publisher, are started once
+every worker is forked. A worker forked while another thread held a lock would inherit it held.
+
+Workers answer every GET and HEAD request with api.app, serving the FrozenGraph of the snapshot,
+and forward every other request, writes included, to the owner. Publishing a generation costs
+O(graph): the owner freezes a copy of the whole graph, builds its indexes and writes them all.
+So writes are coalesced: the owner publishes once the graph has gone a whole PUBLISH_INTERVAL
+without changing, or once the oldest unpublished write is PUBLISH_MAX_DELAY old, and a burst of
+writes costs a single generation. Workers switch to the new generation on their next request,
+so a read served by a worker can be up to PUBLISH_MAX_DELAY plus PUBLISH_INTERVAL behind a write.
+
+    python Prefork.py --workers 4 --port 5000
+
+Needs os.fork, so it only runs on Unix.
+"""
+
+import argparse
+import gc
+import http.client
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from urllib.parse import quote
+from flask import Flask, Response, request
+from werkzeug.serving import make_server
+import Snapshot
+
+# seconds between two checks of the owner's graph for changes to publish
+PUBLISH_INTERVAL = 0.5
+
+# seconds a change waits at most for the writes after it to stop before it is published anyway
+PUBLISH_MAX_DELAY = 5
+
+# seconds a worker waits for the owner to answer a forwarded request
+FORWARD_TIMEOUT = 60
+
+# request and response headers passed along when forwarding to the owner
+FORWARDED_HEADERS = ('Content-Type', 'Content-Disposition', 'Cache-Control', 'ETag', 'If-None-Match',
+                     'If-Match')
+
+
+'''
+Writes the snapshots of the owner's graph that the workers read, with their indexes
+every snapshot gets a new generation number, stored in shared memory for the workers to poll
+the previous generation's file is kept, as a worker may still be opening it
+each publish is O(graph), see run for how writes are coalesced
+'''
+class Publisher:
+    '''
+    :param directory: where the snapshot files are written, created if missing
+    :param generation: multiprocessing.Value shared with the workers
+    '''
+    def __init__(self, directory, generation):
+        self.directory = directory
+        self.generation = generation
+        # (graph, version) of the last published graph
+        self.published = None
+        # (graph, version) at the last check of run, and when the oldest unpublished change was seen
+        self.seen = None
+        self.pending_since = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, generation):
+        return os.path.join(self.directory, 'serving-' + str(generation) + '.snapshot')
+
+    '''
+    Publishes the graph if it changed since the last publish
+    freezes a copy of the graph under its read lock, then builds and writes the copy's indexes,
+    O(V + E) plus the names' n-grams, whatever the change
+    :return: True if a new generation was published
+    '''
+    def publish(self, graph):
+        with graph.lock.read():
+            if self.published == (graph, graph.version):
+                return False
+            frozen = graph.freeze()
+            self.published = (graph, graph.version)
+
+        generation = self.generation.value + 1
+        Snapshot.write(frozen, self.path(generation), indexes=True)
+        self.generation.value = generation
+        try:
+            os.remove(self.path(generation - 2))
+        except FileNotFoundError:
+            pass
+        return True
+
+    '''
+    Returns whether the changes to the graph are due to be published at time now
+    a change is due once the graph has not changed since the previous check, or once the
+    oldest unpublished change was seen PUBLISH_MAX_DELAY ago, so steady writes are still published
+    '''
+    def due(self, graph, now):
+        state = (graph, graph.version)
+        settled = state == self.seen
+        self.seen = state
+        if state == self.published:
+            self.pending_since = None
+            return False
+        if self.pending_since is None:
+            self.pending_since = now
+        return settled or now - self.pending_since >= PUBLISH_MAX_DELAY
+
+    # checks the graph returned by get_graph every PUBLISH_INTERVAL and publishes its due changes,
+    # until stopped is set
+    def run(self, get_graph, stopped):
+        while not stopped.wait(PUBLISH_INTERVAL):
+            try:
+                graph = get_graph()
+                if self.due(graph, time.monotonic()):
+                    self.publish(graph)
+                    self.pending_since = None
+            except Exception:
+                logging.exception('Publishing the graph failed')
+
+
+'''
+The FrozenGraph of a worker, reopened whenever the owner publishes a new generation
+the graph reads its indexes from the snapshot, so reopening only maps the new file
+the generation is the version of the FrozenGraph, so responses cached for a generation are not
+served once the next is opened
+'''
+class SnapshotReader:
+    def __init__(self, publisher):
+        self.publisher = publisher
+        self.graph = None
+        self.loaded = None
+        # threads of a worker share the reader, so reopening is serialized
+        self.lock = threading.Lock()
+
+    def current(self):
+        generation = self.publisher.generation.value
+        if generation != self.loaded:
+            with self.lock:
+                while self.loaded != generation:
+                    try:
+                        graph = Snapshot.open_snapshot(self.publisher.path(generation))
+                        graph.version = generation
+                        self.graph = graph
+                        self.loaded = generation
+                    except FileNotFoundError:
+                        # two newer generations were published meanwhile, open the latest
+                        generation = self.publisher.generation.value
+        return self.graph
+
+
+# header names are case insensitive
+_forwarded = {key.lower() for key in FORWARDED_HEADERS}
+
+
+'''
+Sends the current request to the owner and returns its response
+'''
+def forward(owner):
+    connection = http.client.HTTPConnection(*owner, timeout=FORWARD_TIMEOUT)
+    try:
+        url = quote(request.path)
+        if request.query_string:
+            url += '?' + request.query_string.decode('ascii')
+        headers = {key: value for key, value in request.headers.items() if key.lower() in _forwarded}
+        connection.request(request.method, url, body=request.get_data(), headers=headers)
+        response = connection.getresponse()
+        headers = [(key, value) for key, value in response.getheaders() if key.lower() in _forwarded]
+        return Response(response.read(), status=response.status, headers=headers)
+    finally:
+        connection.close()
+
+
+'''
+The app run by the workers
+answers the GET and HEAD requests with api.app, serving the reader's current FrozenGraph, and
+forwards the rest to the owner at address (host, port)
+'''
+def worker_app(reader, owner):
+    # the master imported api before forking, so this does not load the graph again
+    import api
+
+    forwarder = Flask('graph-worker')
+
+    @forwarder.route('/', defaults={'path': ''}, methods=['POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+    @forwarder.route('/<path:path>', methods=['POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'])
+    def owner_route(path):
+        return forward(owner)
+
+    def app(environ, start_response):
+        if environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return forwarder(environ, start_response)
+        frozen = reader.current()
+        if api.graph is not frozen:
+            # the worker never writes, so its api only ever serves the published snapshots
+            api.set_graph(frozen)
+        return api.app(environ, start_response)
+
+    return app
+
+
+# runs a worker process, never returns
+def _run_worker(listener, publisher, owner):
+    status = 0
+    try:
+        reader = SnapshotReader(publisher)
+        reader.current()
+        server = make_server(*listener.getsockname()[:2], worker_app(reader, owner), threaded=True,
+                             fd=listener.fileno())
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    except BaseException:
+        logging.exception('Worker ' + str(os.getpid()) + ' failed')
+        status = 1
+    finally:
+        # skip the atexit handlers of the master, such as closing its mutation log
+        os._exit(status)
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+'''
+Loads the graph in this process and serves it with the given number of forked workers
+returns once every worker has exited, or stops the workers on KeyboardInterrupt or SIGTERM
+:param directory: where the published snapshots are written
+'''
+def serve(host='127.0.0.1', port=5000, workers=None, directory='serving'):
+    os.environ['GRAPH_DEFER_THREADS'] = '1'
+    import api
+
+    workers = workers or multiprocessing.cpu_count()
+    listener = socket.create_server((host, port))
+    listener.set_inheritable(True)
+    owner_server = make_server('127.0.0.1', 0, api.app, threaded=True)
+    owner = ('127.0.0.1', owner_server.server_port)
+
+    publisher = Publisher(directory, multiprocessing.Value('q', 0, lock=False))
+    publisher.publish(api.graph)
+
+    # keep the collector away from the objects inherited from the master,
+    # so that collections in the workers do not write to, and so copy, their pages
+    gc.freeze()
+    pids = []
+    for i in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            owner_server.socket.close()
+            _run_worker(listener, publisher, owner)
+        pids.append(pid)
+    listener.close()
+    logging.info('Serving on ' + host + ':' + str(port) + ' with ' + str(workers) + ' workers')
+
+    # stop the workers too when the master is terminated, the workers keep the default handler
+    signal.signal(signal.SIGTERM, _terminate)
+
+    # threads are only started once every worker is forked
+    stopped = threading.Event()
+    api.start_threads()
+    threading.Thread(target=owner_server.serve_forever, name='graph-owner', daemon=True).start()
+    threading.Thread(target=publisher.run, args=(lambda: api.graph, stopped), name='graph-publisher',
+                     daemon=True).start()
+    try:
+        while pids:
+            pid, status = os.wait()
+            pids.remove(pid)
+            logging.warning('Worker ' + str(pid) + ' exited with status ' + str(status))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        stopped.set()
+        owner_server.shutdown()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, one per core by default')
+    parser.add_argument('--directory', default='serving', help='where the published snapshots are written')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.workers, args.directory)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Memoized results of Graph queries, invalidated by generation tags.
+
+Every cached result is stored with the tags of the data it was computed from, such as
+('vertex', name) for the edges and income of one vertex or ('year', year) for the movies of a year,
+and the generation each tag was at when the result was computed.
+The cache listens to the graph and bumps the generation of every tag a change touches,
+so a result is served only while none of its tags has moved on. Stale entries are never
+looked for, they simply fail the check and age out of the LRU.
+"""
+
+from GraphListener import GraphListener
+from LRUCache import LRUCache
+
+
+class QueryCache(GraphListener):
+    BATCHED = True
+
+    def __init__(self, max_entries=4096):
+        self.entries = LRUCache(max_entries)
+        # tag -> generation, a tag missing from it is at generation 0
+        self.generations = {}
+
+    '''
+    Returns the cached result of a query, or computes and caches it
+    :param key: the query and its arguments
+    :param tags: the tags of the data the result depends on
+    :param compute: function computing the result
+    '''
+    def lookup(self, key, tags, compute):
+        generations = tuple(self.generations.get(tag, 0) for tag in tags)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == tags and entry[1] == generations:
+            return entry[2]
+
+        result = compute()
+        self.entries.put(key, (tags, generations, result))
+        return result
+
+    def clear(self):
+        self.entries.clear()
+
+    # while nothing is cached there is nothing to invalidate, results cached later
+    # are stored with the generations of that time, so bulk loads skip the bookkeeping
+    def _bump(self, *tags):
+        if not len(self.entries):
+            return
+        for tag in tags:
+            self.generations[tag] = self.generations.get(tag, 0) + 1
+
+    # bumps the tags of a vertex, and of the year it is released in if it is a movie
+    def _bump_vertex(self, v):
+        self._bump(('vertex', v.get_id()))
+        if v.get_type() == 'Movie':
+            self._bump(('year', v.get_info()))
+
+    def vertex_added(self, graph, v):
+        self._bump_vertex(v)
+
+    def vertex_removed(self, graph, v):
+        self._bump_vertex(v)
+
+    def _edge_changed(self, graph, v, w):
+        if not len(self.entries):
+            return
+        self._bump_vertex(v)
+        self._bump_vertex(w)
+        # co-stars can change for actors that are not an endpoint, see Graph.costars_affected
+        for actor in graph.costars_affected(v, w):
+            self._bump(('costars', actor.get_id()))
+
+    def edge_added(self, graph, v, w, old_weight, weight):
+        self._edge_changed(graph, v, w)
+
+    def edge_removed(self, graph, v, w, weight):
+        self._edge_changed(graph, v, w)
+
+    def income_changed(self, graph, v, old_income):
+        self._bump(('vertex', v.get_id()))
+
+    # bumps the tags of every vertex the batch changed, its co-stars, and the years of the movies
+    # it changed, as they were before the batch and as they are now
+    def batch_changed(self, graph, changed):
+        if not len(self.entries):
+            return
+        for name, old in changed.items():
+            self._bump(('vertex', name), ('costars', name))
+            for v in (old, graph.get_vertex(name)):
+                if v is not None and v.get_type() == 'Movie':
+                    self._bump(('year', v.get_info()))
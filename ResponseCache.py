@@ -0,0 +1,49 @@
+"""
+An in-process LRU cache of serialized HTTP responses.
+Entries are keyed by the route, its arguments and the version of the graph data the response was
+built from, so an entry is never stale: once the data changes, requests look up a new key and
+the old entry ages out of the cache.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    '''
+    returns the (body, status, mimetype, etag) stored under key, or None
+    '''
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    '''
+    stores a serialized response under key, evicting the least recently used entries if full
+    :return the stored (body, status, mimetype, etag) entry
+    '''
+    def put(self, key, body, status, mimetype):
+        entry = (body, status, mimetype, hashlib.sha1(body).hexdigest())
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
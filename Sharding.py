@@ -0,0 +1,367 @@
+"""
+A sharded graph splits the movies across worker processes by release year, so that the graph
+can outgrow the memory of one interpreter and queries can use more than one core.
+
+Every movie lives on shard year % number of shards, along with its actor edges. An actor
+who worked in movies of several shards has a vertex on each of them, holding the edges to
+that shard's movies. The coordinator keeps no graph of its own: it resolves the casts of the
+records, sends each movie to its shard, and answers queries by sending them to the shards
+that can hold the answer and merging what they send back.
+
+Every actor also has an owner shard, picked by a hash of the name. Queries that need all of an
+actor's edges at once, such as counting co-stars, have each shard send what it holds of an actor
+straight to the actor's owner, over pipes between the shards, so that only the owners' results
+reach the coordinator.
+
+    with ShardedGraph.from_file('data.json', num_shards=4) as graph:
+        graph.get_hub_actors()
+
+The shards are local processes, talking to the coordinator and to each other over pipes.
+"""
+
+import heapq
+import multiprocessing
+import threading
+import zlib
+from Graph import Graph
+
+# number of movies sent to a shard per message while loading
+LOAD_BATCH_SIZE = 1000
+
+# batches a shard may be sent before the coordinator waits for it to catch up
+MAX_PENDING_BATCHES = 16
+
+# Graph queries a coordinator may send to its shards as they are
+SHARD_QUERIES = ('get_actors_by_year', 'get_movies_by_year', 'get_ranking', 'search_names', 'has_vertex')
+
+
+class ShardError(Exception):
+    pass
+
+
+def _load(graph, movies):
+    for title, year, box_office, cast in movies:
+        graph.add_movie_with_cast(title, year, box_office, cast)
+    return graph.num_vertices
+
+
+# the shard that owns an actor, the same in every process, unlike hash()
+def _owner(name, num_shards):
+    return zlib.crc32(name.encode('utf-8')) % num_shards
+
+
+# actor name -> summed weights of the actor's movie edges on the shard, for those of names on the shard
+def _paid(graph, names):
+    totals = {}
+    for name in names:
+        if graph.has_vertex(name, 'Actor'):
+            v = graph.get_vertex(name)
+            totals[name] = sum(v.get_weight(w) for w in v.get_neighbors() if w.get_type() == 'Movie')
+    return totals
+
+
+# the movies of an actor on the shard, none if the actor has no movie there
+def _movies_by_actor(graph, actor):
+    if not graph.has_vertex(actor, 'Actor'):
+        return []
+    return graph.get_movies_by_actor(actor)
+
+
+_HANDLERS = {'load': _load, 'paid': _paid, 'movies_by_actor': _movies_by_actor}
+
+
+'''
+Counts the co-stars of the actors this shard owns
+each shard sends the co-stars it holds of every actor to the actor's owner, and receives
+those of its own actors from every other shard, so two actors who share movies on several
+shards are counted once
+every shard must be sent this at the same time, as each waits for all the others
+:return: list of (actor, # of connections) of the owned actors, most connections first
+'''
+def _hub_counts(graph, shard, peers):
+    num_shards = len(peers) + 1
+    outgoing = [{} for i in range(num_shards)]
+    error = None
+    try:
+        for actor in graph.get_actors():
+            outgoing[_owner(actor, num_shards)][actor] = graph.get_costars(actor)
+    except Exception as e:
+        # still take part in the exchange, so that the other shards are not left waiting
+        error = e
+        outgoing = [{} for i in range(num_shards)]
+
+    # every shard sends before it receives, so the sends run on a thread of their own
+    # to keep full pipes from blocking all the shards at once
+    def send():
+        for peer, connection in peers.items():
+            connection.send(outgoing[peer])
+
+    sender = threading.Thread(target=send)
+    sender.start()
+    costars = {}
+    for lists in [outgoing[shard]] + [connection.recv() for connection in peers.values()]:
+        for actor, names in lists.items():
+            costars.setdefault(actor, set()).update(names)
+    sender.join()
+
+    if error is not None:
+        raise error
+    hub_actors = [(actor, len(names)) for actor, names in costars.items()]
+    return sorted(hub_actors, key=lambda f: (f[1], f[0]), reverse=True)
+
+
+# handlers that exchange data with the other shards, called with the shard number and the peer pipes
+_EXCHANGES = {'hub_counts': _hub_counts}
+
+
+'''
+Runs a shard: builds a Graph from the movies it is sent and answers queries about it,
+until the coordinator sends None or closes the pipe
+every message is answered with (True, result) or (False, the exception raised)
+:param shard: number of this shard
+:param peers: dict of shard number -> pipe to that shard, for every other shard
+'''
+def _serve(connection, shard, peers, materialize_costars):
+    graph = Graph(materialize_costars)
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        method, args = message
+        try:
+            if method in _HANDLERS:
+                reply = (True, _HANDLERS[method](graph, *args))
+            elif method in _EXCHANGES:
+                reply = (True, _EXCHANGES[method](graph, shard, peers, *args))
+            elif method in SHARD_QUERIES:
+                reply = (True, getattr(graph, method)(*args))
+            else:
+                reply = (False, ShardError('unknown shard method ' + repr(method)))
+        except Exception as error:
+            reply = (False, error)
+        connection.send(reply)
+    connection.close()
+    for peer in peers.values():
+        peer.close()
+
+
+class ShardedGraph:
+    '''
+    Starts num_shards worker processes, each with an empty graph
+    :param materialize_costars: passed on to the Graph of every shard
+    '''
+    def __init__(self, num_shards=None, materialize_costars=True):
+        self.num_shards = num_shards or multiprocessing.cpu_count()
+        self.materialize_costars = materialize_costars
+        self.connections = []
+        self.processes = []
+
+        # a pipe between every two shards, peers[i][j] being shard i's end of the one to shard j
+        peers = [{} for i in range(self.num_shards)]
+        for i in range(self.num_shards):
+            for j in range(i + 1, self.num_shards):
+                peers[i][j], peers[j][i] = multiprocessing.Pipe()
+
+        for i in range(self.num_shards):
+            connection, shard_connection = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=_serve, args=(shard_connection, i, peers[i], materialize_costars),
+                                              name='graph-shard-' + str(i), daemon=True)
+            process.start()
+            shard_connection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+        # the shards hold the pipes between them now
+        for ends in peers:
+            for end in ends.values():
+                end.close()
+
+    '''
+    Builds a sharded graph from a data.json style file, see Graph.from_records
+    '''
+    @classmethod
+    def from_file(cls, path='data.json', num_shards=None, materialize_costars=True):
+        import CreateGraph
+
+        graph = cls(num_shards, materialize_costars)
+        try:
+            graph.load(CreateGraph.iter_records(path))
+        except BaseException:
+            graph.close()
+            raise
+        return graph
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    '''
+    Stops the shard processes
+    '''
+    def close(self):
+        for connection in self.connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    # the shard a movie of a given year is kept on
+    def shard_of_year(self, year):
+        return int(year) % self.num_shards
+
+    '''
+    Sends a message to each of the given shards, then collects their replies in the same order
+    the shards work on the message at the same time
+    :param shards: shard numbers, every shard if None
+    '''
+    def _scatter(self, method, args=(), shards=None):
+        if shards is None:
+            shards = range(self.num_shards)
+        for shard in shards:
+            self.connections[shard].send((method, args))
+
+        results = []
+        error = None
+        for shard in shards:
+            ok, result = self.connections[shard].recv()
+            if ok:
+                results.append(result)
+            elif error is None:
+                # keep reading, so that every reply is collected before raising
+                error = result
+        if error is not None:
+            raise error
+        return results
+
+    '''
+    Adds scraped records to the shards, see Graph.from_records
+    movies are sent to their shards in batches without waiting for each batch to be added,
+    so the shards build their graphs while the coordinator keeps reading
+    :return: number of vertices on each shard
+    '''
+    def load(self, records):
+        batches = [[] for i in range(self.num_shards)]
+        pending = [0] * self.num_shards
+        for movie in Graph.movies_with_casts(records):
+            shard = self.shard_of_year(movie[1])
+            batches[shard].append(movie)
+            if len(batches[shard]) >= LOAD_BATCH_SIZE:
+                self.connections[shard].send(('load', (batches[shard],)))
+                batches[shard] = []
+                pending[shard] += 1
+                # bound the replies waiting in the pipe
+                if pending[shard] > MAX_PENDING_BATCHES:
+                    self._receive(shard)
+                    pending[shard] -= 1
+
+        counts = []
+        for shard in range(self.num_shards):
+            self.connections[shard].send(('load', (batches[shard],)))
+            pending[shard] += 1
+        for shard in range(self.num_shards):
+            for i in range(pending[shard]):
+                count = self._receive(shard)
+            counts.append(count)
+        return counts
+
+    def _receive(self, shard):
+        ok, result = self.connections[shard].recv()
+        if not ok:
+            raise result
+        return result
+
+    '''
+    List all the movies for a given year, answered by the year's shard
+    '''
+    def get_movies_by_year(self, year):
+        return self._scatter('get_movies_by_year', (year,), [self.shard_of_year(year)])[0]
+
+    '''
+    List all the actors for a given year, answered by the year's shard
+    '''
+    def get_actors_by_year(self, year):
+        return self._scatter('get_actors_by_year', (year,), [self.shard_of_year(year)])[0]
+
+    '''
+    List the movies of an actor, from every shard the actor worked on
+    '''
+    def get_movies_by_actor(self, actor):
+        movies = []
+        for shard_movies in self._scatter('movies_by_actor', (actor,)):
+            movies.extend(shard_movies)
+        return movies
+
+    '''
+    List the top X actors with the most total grossing value
+    an actor's total is spread over the shards of their movies, so the shards' paid rankings are
+    read a page at a time, the page doubling each round, with the threshold algorithm:
+    the totals of the actors seen so far are looked up on every shard, and an actor no shard
+    has sent yet earns at most the sum of the last paid amount each shard sent, so the reading
+    stops once x totals are above that sum
+    '''
+    def get_top_x_paid_actors(self, x):
+        if x <= 0:
+            return []
+
+        totals = {}
+        exhausted = [False] * self.num_shards
+        offset = 0
+        page_size = x
+        while True:
+            bounds = []
+            new = {}
+            for shard, page in enumerate(self._scatter('get_ranking', ('paid', offset, page_size))):
+                if len(page) < page_size:
+                    exhausted[shard] = True
+                # a shard that sent its whole ranking has sent every actor it holds
+                bounds.append(0 if exhausted[shard] else page[-1][1])
+                for name, paid in page:
+                    if name not in totals:
+                        new[name] = None
+            offset += page_size
+            page_size *= 2
+
+            if new:
+                for name in new:
+                    totals[name] = 0
+                for paid in self._scatter('paid', (list(new),)):
+                    for name, amount in paid.items():
+                        totals[name] += amount
+
+            ranked = heapq.nlargest(x, totals.items(), key=lambda f: (f[1], f[0]))
+            # ties are broken by name, so an unseen actor at exactly the threshold could still rank higher
+            if all(exhausted) or (len(ranked) == x and ranked[-1][1] > sum(bounds)):
+                return [name for name, paid in ranked]
+
+    '''
+    Counts the co-stars of every actor
+    each actor's co-stars are merged on its owner shard, see _hub_counts, and the coordinator
+    only merges the owners' sorted counts
+    :return: list of (actor, # of connections), most connections first
+    '''
+    def get_hub_actors(self):
+        return list(heapq.merge(*self._scatter('hub_counts'), key=lambda f: (f[1], f[0]), reverse=True))
+
+    '''
+    Find the vertices whose name contains query, see Graph.search_names
+    actors are on several shards, so the matches are merged without repeats,
+    shard by shard and in each shard's order
+    '''
+    def search_names(self, query, type=None, limit=None):
+        matches = {}
+        for names in self._scatter('search_names', (query, type, limit)):
+            for name in names:
+                matches[name] = None
+        names = list(matches)
+        return names if limit is None else names[:limit]
@@ -0,0 +1,187 @@
+"""
+The similarity index finds actors with similar filmographies without comparing an actor to every other.
+Each actor's set of movies is summarized by a MinHash signature: the minimum of each of NUM_HASHES
+hash functions over the movies. Two actors agree on any one position of their signatures with
+probability equal to the Jaccard similarity of their movie sets.
+The signatures are cut into BANDS bands, and every band is hashed into a bucket (locality
+sensitive hashing), so actors that agree on a whole band share a bucket. The candidates for an
+actor are the others in its buckets, and only those are ranked, by the exact Jaccard similarity.
+With 16 bands of 4 rows, actors with a similarity of 0.5 share a bucket 64% of the time, and
+actors with a similarity of 0.2 only 2.5% of the time.
+"""
+
+import hashlib
+import random
+import threading
+from GraphListener import GraphListener
+
+NUM_HASHES = 64
+BANDS = 16
+ROWS = NUM_HASHES // BANDS
+
+# the hash functions are (a * x + b) mod PRIME, a Mersenne prime above every 64 bit movie hash
+PRIME = (1 << 61) - 1
+
+
+# a hash of a movie name that is the same in every process, unlike hash()
+def _movie_hash(name):
+    return int.from_bytes(hashlib.blake2b(name.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def jaccard(a, b):
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+'''
+The MinHash signatures of the actors, bucketed by band
+The index is built from the graph on the first query, then kept up to date by the graph events.
+Adding a movie to an actor lowers its signature in place; removing one recomputes the
+signature from the actor's remaining movies.
+'''
+class SimilarityIndex(GraphListener):
+    BATCHED = True
+
+    def __init__(self, seed=0):
+        r = random.Random(seed)
+        self.hashes = [(r.randrange(1, PRIME), r.randrange(PRIME)) for i in range(NUM_HASHES)]
+        # actor name -> signature, a list of NUM_HASHES minimums, for actors with at least one movie
+        self.signatures = None
+        # one dict per band, band of a signature -> names of the actors with that band
+        # dicts are used as insertion ordered sets
+        self.buckets = None
+        # readers can share the graph, so the first build is serialized
+        self.build_lock = threading.Lock()
+
+    def _ensure_built(self, graph):
+        if self.signatures is None:
+            with self.build_lock:
+                if self.signatures is None:
+                    self._build(graph)
+
+    # signs every actor of the graph
+    # self.signatures is assigned last, as it marks the index as built
+    def _build(self, graph):
+        signatures = {}
+        self.buckets = [{} for i in range(BANDS)]
+        # movies are shared by their cast, so each movie is hashed once
+        movie_hashes = {}
+        for v in graph:
+            if v.get_type() == 'Actor':
+                signature = self._signature(v, movie_hashes)
+                if signature is not None:
+                    signatures[v.get_id()] = signature
+                    self._bucket(v.get_id(), signature)
+        self.signatures = signatures
+
+    # the hashes of a movie under every hash function
+    def _movie_hashes(self, movie):
+        x = _movie_hash(movie.get_id())
+        return [(a * x + b) % PRIME for a, b in self.hashes]
+
+    # the signature of an actor's movies, None if the actor has none
+    # movie_hashes, if given, caches the hashes of the movies by name
+    def _signature(self, actor, movie_hashes=None):
+        signature = None
+        for w in actor.get_neighbors():
+            if w.get_type() == 'Movie':
+                if movie_hashes is None:
+                    hashes = self._movie_hashes(w)
+                else:
+                    hashes = movie_hashes.get(w.get_id())
+                    if hashes is None:
+                        hashes = movie_hashes[w.get_id()] = self._movie_hashes(w)
+                signature = hashes if signature is None else list(map(min, signature, hashes))
+        return signature
+
+    def _bands(self, signature):
+        return [tuple(signature[i * ROWS:(i + 1) * ROWS]) for i in range(BANDS)]
+
+    def _bucket(self, name, signature):
+        for band, key in zip(self.buckets, self._bands(signature)):
+            band.setdefault(key, {})[name] = None
+
+    def _unbucket(self, name, signature):
+        for band, key in zip(self.buckets, self._bands(signature)):
+            bucket = band.get(key)
+            if bucket is not None:
+                bucket.pop(name, None)
+                if not bucket:
+                    del band[key]
+
+    # replaces the signature of an actor, moving it between buckets
+    def _resign(self, name, signature):
+        old = self.signatures.get(name)
+        if old == signature:
+            return
+        if old is not None:
+            del self.signatures[name]
+            self._unbucket(name, old)
+        if signature is not None:
+            self.signatures[name] = signature
+            self._bucket(name, signature)
+
+    '''
+    returns the actors whose filmography is most like the given actor's
+    :param k: maximum number of actors returned
+    :return: list of (actor, Jaccard similarity of their movie sets), most similar first
+    actors that never share a bucket with the given actor are not found, so fewer than k may be returned
+    '''
+    def similar(self, graph, name, k=10):
+        self._ensure_built(graph)
+        signature = self.signatures.get(name)
+        if signature is None:
+            return []
+
+        candidates = {}
+        for band, key in zip(self.buckets, self._bands(signature)):
+            candidates.update(band[key])
+        candidates.pop(name, None)
+
+        movies = self._movies(graph, name)
+        scores = [(jaccard(movies, self._movies(graph, other)), other) for other in candidates]
+        scores.sort(reverse=True)
+        return [(other, score) for score, other in scores[:k]]
+
+    def _movies(self, graph, name):
+        return {w.get_id() for w in graph.get_vertex(name).get_neighbors() if w.get_type() == 'Movie'}
+
+    # returns (actor, movie) if the edge joins an actor to a movie, else None
+    def _actor_and_movie(self, v, w):
+        if v.get_type() == 'Actor' and w.get_type() == 'Movie':
+            return v, w
+        if v.get_type() == 'Movie' and w.get_type() == 'Actor':
+            return w, v
+        return None
+
+    def vertex_removed(self, graph, v):
+        if self.signatures is None or v.get_type() != 'Actor':
+            return
+        self._resign(v.get_id(), None)
+
+    def edge_added(self, graph, v, w, old_weight, weight):
+        if self.signatures is None or old_weight is not None:
+            return
+        pair = self._actor_and_movie(v, w)
+        if pair is not None:
+            actor, movie = pair
+            old = self.signatures.get(actor.get_id())
+            hashes = self._movie_hashes(movie)
+            self._resign(actor.get_id(), hashes if old is None else list(map(min, old, hashes)))
+
+    def edge_removed(self, graph, v, w, weight):
+        if self.signatures is None:
+            return
+        pair = self._actor_and_movie(v, w)
+        if pair is not None:
+            # the edge is already gone, so the signature is computed from the remaining movies
+            self._resign(pair[0].get_id(), self._signature(pair[0]))
+
+    # signs every actor the batch changed again, from the movies it has now
+    def batch_changed(self, graph, changed):
+        if self.signatures is None:
+            return
+        for name in changed:
+            v = graph.get_vertex(name)
+            self._resign(name, self._signature(v) if v is not None and v.get_type() == 'Actor' else None)
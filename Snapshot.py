@@ -0,0 +1,542 @@
+"""
+A snapshot is a versioned binary file holding a built, frozen graph so that a server can start
+without re-parsing data.json. The file is opened with mmap and the FrozenGraph reads its arrays
+straight out of the mapped pages, so opening a snapshot does not build any per vertex objects.
+
+Layout, all integers little endian and every section aligned to 8 bytes:
+    header          magic, format version, flags, source checksum, counts (see HEADER)
+    type table      JSON list of [type name, start id, end id]
+    name offsets    int64[n + 1], byte offsets of each name in the name blob
+    sorted ids      int32[n], vertex ids ordered by name, for binary search lookups
+    types           int8[n]
+    info            int64[n]
+    income          int64[n]
+    offsets         int64[n + 1]
+    targets         int32[m]
+    weights         int64[m]
+    name blob       UTF-8 names, concatenated
+
+A snapshot written with indexes (the INDEXED flag) goes on with the indexes a FrozenGraph would
+otherwise build on first use, so that every process mapping the snapshot shares one copy of them:
+    index table     int64 size, then a JSON object with the lengths of the sections below
+    rankings        int64[k] keys and int64[k] scores of each ranking of Leaderboards.RANKINGS, highest
+                    first, keys being vertex ids except for the ages of 'age_income'
+    names by type   int32[n], the ids of each type ordered by name, at the ids of that type
+    gram offsets    int64[g + 1], byte offsets of each n-gram (see NameIndex) in the gram blob
+    posting offsets int64[g + 1], where the ids of the names holding each n-gram start in postings
+    postings        int32[p], ascending ids per n-gram
+    gram blob       UTF-8 n-grams in sorted order, concatenated
+    years           int64[y], the years that have a movie, ascending
+    year offsets    int64[y + 1], where the movies of each year start in year movies
+    year movies     int32[movies]
+    year totals     int64[y + 1] prefix sums of each rollup of YearIndex.ROLLUPS
+    signed ids      int32[s], ascending ids of the actors with a MinHash signature (see Similarity)
+    signatures      int64[s * NUM_HASHES]
+    bands           int32[BANDS * s], positions in signed ids, ordered by each band of their signatures
+"""
+
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from bisect import bisect_left
+from FrozenGraph import FrozenGraph
+from Leaderboard import Leaderboards
+from NameIndex import GRAM_SIZE, ngrams
+from Similarity import BANDS, NUM_HASHES, ROWS, jaccard
+from YearIndex import YearIndex
+
+MAGIC = b'GRAPHSNP'
+FORMAT_VERSION = 2
+
+# magic, format version, flags, sha256 of the source file, vertices, edge entries, type table bytes, name blob bytes
+HEADER = struct.Struct('<8sII32sQQQQ')
+
+# flag bits
+MATERIALIZED_COSTARS = 1
+INDEXED = 2
+
+
+'''
+Returns the sha256 digest of a file, read in chunks
+'''
+def file_checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _padding(size):
+    return -size % 8
+
+
+'''
+Returns the first position in ids whose name is not less than key, or greater than key if right
+names: _StringTable, ids: ids ordered by name, key: encoded name
+'''
+def _bisect(names, ids, key, right=False):
+    lo = 0
+    hi = len(ids)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        name = names.encoded(ids[mid])
+        if name < key or (right and name == key):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+'''
+Names of a snapshot, decoded from the mapped name blob on access
+'''
+class _StringTable:
+    def __init__(self, blob, name_offsets):
+        self.blob = blob
+        self.name_offsets = name_offsets
+
+    def __len__(self):
+        return len(self.name_offsets) - 1
+
+    def __getitem__(self, i):
+        return self.encoded(i).decode('utf-8')
+
+    def encoded(self, i):
+        return bytes(self.blob[self.name_offsets[i]:self.name_offsets[i + 1]])
+
+
+'''
+Name -> vertex id lookups by binary search over the snapshot's sorted ids
+UTF-8 byte order matches code point order, so names are compared as bytes
+'''
+class _NameIndex:
+    def __init__(self, names, sorted_ids):
+        self.names = names
+        self.sorted_ids = sorted_ids
+
+    def get(self, name, default=None):
+        if not isinstance(name, str):
+            return default
+        key = name.encode('utf-8')
+        lo = _bisect(self.names, self.sorted_ids, key)
+        if lo < len(self.sorted_ids) and self.names.encoded(self.sorted_ids[lo]) == key:
+            return self.sorted_ids[lo]
+        return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __getitem__(self, name):
+        i = self.get(name)
+        if i is None:
+            raise KeyError(name)
+        return i
+
+
+'''
+A ranking of an indexed snapshot, a sequence of (key, score) pairs, highest first
+names: the snapshot's names, to turn the vertex ids of keys into names, or None if keys are ages
+'''
+class _Ranking:
+    def __init__(self, names, keys, scores):
+        self.names = names
+        self.keys = keys
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        key = self.keys[i]
+        return (key if self.names is None else self.names[key], self.scores[i])
+
+
+# whether the ascending ids hold i
+def _contains(ids, i):
+    j = bisect_left(ids, i)
+    return j < len(ids) and ids[j] == i
+
+
+'''
+The NameIndex of an indexed snapshot, answering the same searches and pages from the mapped postings
+every type is a contiguous range of ids, so the postings of one type are a slice of each posting list
+'''
+class _MappedNameIndex:
+    def __init__(self, grams, posting_offsets, postings, names_by_type):
+        # gram -> its position, by binary search over the sorted grams
+        self.grams = _NameIndex(grams, range(len(grams)))
+        self.posting_offsets = posting_offsets
+        self.postings = postings
+        self.names_by_type = names_by_type
+
+    # ascending ids of the names of the type range holding gram
+    def _posting(self, gram, start, end):
+        g = self.grams.get(gram)
+        if g is None:
+            return ()
+        ids = self.postings[self.posting_offsets[g]:self.posting_offsets[g + 1]]
+        return ids[bisect_left(ids, start):bisect_left(ids, end)]
+
+    # see NameIndex.search
+    def search(self, graph, query, type=None, limit=None):
+        types = list(graph.type_ranges) if type is None else [type]
+        matches = []
+        for t in types:
+            if limit is not None and len(matches) >= limit:
+                break
+            matches.extend(self._search_type(graph, t, query, None if limit is None else limit - len(matches)))
+        return matches
+
+    def _search_type(self, graph, type, query, limit):
+        start, end = graph.type_ranges.get(type, (0, 0))
+        if not query:
+            candidates = [range(start, end)]
+        elif len(query) <= GRAM_SIZE:
+            candidates = [self._posting(query, start, end)]
+        else:
+            grams = {query[i:i + GRAM_SIZE] for i in range(len(query) - GRAM_SIZE + 1)}
+            candidates = sorted((self._posting(gram, start, end) for gram in grams), key=len)
+        others = candidates[1:]
+
+        matches = []
+        for i in candidates[0]:
+            if limit is not None and len(matches) >= limit:
+                break
+            name = graph.names[i]
+            if all(_contains(ids, i) for ids in others) and query in name:
+                matches.append(name)
+        return matches
+
+    # see NameIndex.page
+    def page(self, graph, type, after=None, limit=None):
+        start, end = graph.type_ranges.get(type, (0, 0))
+        ids = self.names_by_type[start:end]
+        first = 0 if after is None else _bisect(graph.names, ids, after.encode('utf-8'), right=True)
+        last = len(ids) if limit is None else min(len(ids), first + limit)
+        return [graph.names[i] for i in ids[first:last]]
+
+
+'''
+The movies of each year of an indexed snapshot, read like the year -> movie ids dict of FrozenGraph
+'''
+class _YearMovies:
+    def __init__(self, years, year_offsets, movies):
+        self.years = years
+        self.year_offsets = year_offsets
+        self.movies = movies
+
+    def get(self, year, default=None):
+        i = bisect_left(self.years, year)
+        if i == len(self.years) or self.years[i] != year:
+            return default
+        return self.movies[self.year_offsets[i]:self.year_offsets[i + 1]]
+
+    def __getitem__(self, year):
+        movies = self.get(year)
+        if movies is None:
+            raise KeyError(year)
+        return movies
+
+
+'''
+The SimilarityIndex of an indexed snapshot, finding the same candidates in the mapped bands
+instead of in per process buckets
+'''
+class _MappedSimilarity:
+    def __init__(self, signed, signatures, bands):
+        self.signed = signed
+        self.signatures = signatures
+        self.bands = bands
+
+    # band b of the signature at position p of signed
+    def _band(self, p, b):
+        start = p * NUM_HASHES + b * ROWS
+        return self.signatures[start:start + ROWS].tolist()
+
+    # see SimilarityIndex.similar
+    def similar(self, graph, name, k=10):
+        i = graph.ids.get(name)
+        if i is None or not _contains(self.signed, i):
+            return []
+        p = bisect_left(self.signed, i)
+
+        s = len(self.signed)
+        candidates = {}
+        for b in range(BANDS):
+            order = self.bands[b * s:(b + 1) * s]
+            key = self._band(p, b)
+            lo = 0
+            hi = s
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if self._band(order[mid], b) < key:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            while lo < s and self._band(order[lo], b) == key:
+                candidates[self.signed[order[lo]]] = None
+                lo += 1
+        candidates.pop(i, None)
+
+        movies = self._movies(graph, i)
+        scores = [(jaccard(movies, self._movies(graph, other)), graph.names[other]) for other in candidates]
+        scores.sort(reverse=True)
+        return [(other, score) for score, other in scores[:k]]
+
+    def _movies(self, graph, i):
+        return {t for t, weight in graph._edges(i) if graph._type_of(t) == 'Movie'}
+
+
+'''
+Returns the index table and sections of an indexed snapshot of frozen, see the module docstring
+the indexes are built on frozen as its own queries would build them
+'''
+def _index_sections(frozen):
+    n = frozen.num_vertices
+    table = {'rankings': {}}
+    sections = []
+
+    for by in Leaderboards.RANKINGS:
+        ranking = frozen._ranking(by)
+        keys = [key if by == 'age_income' else frozen.ids[key] for key, score in ranking]
+        table['rankings'][by] = len(ranking)
+        sections += [array('q', keys).tobytes(), array('q', [score for key, score in ranking]).tobytes()]
+
+    encoded = [frozen.names[i].encode('utf-8') for i in range(n)]
+    names_by_type = array('i', range(n))
+    for start, end in frozen.type_ranges.values():
+        names_by_type[start:end] = array('i', sorted(range(start, end), key=lambda i: encoded[i]))
+    sections.append(names_by_type.tobytes())
+
+    # ids are visited in ascending order, so every posting list is ascending
+    postings_by_gram = {}
+    for i in range(n):
+        for gram in ngrams(frozen.names[i]):
+            postings_by_gram.setdefault(gram.encode('utf-8'), []).append(i)
+    grams = sorted(postings_by_gram)
+    gram_offsets = array('q', [0])
+    posting_offsets = array('q', [0])
+    postings = array('i')
+    for gram in grams:
+        gram_offsets.append(gram_offsets[-1] + len(gram))
+        postings.extend(postings_by_gram[gram])
+        posting_offsets.append(len(postings))
+    gram_blob = b''.join(grams)
+    table.update(grams=len(grams), gram_bytes=len(gram_blob), postings=len(postings))
+    sections += [gram_offsets.tobytes(), posting_offsets.tobytes(), postings.tobytes(), gram_blob]
+
+    frozen._ensure_year_totals()
+    year_index = frozen._year_index()
+    year_offsets = array('q', [0])
+    year_movies = array('i')
+    for year in frozen.years:
+        year_movies.extend(year_index[year])
+        year_offsets.append(len(year_movies))
+    table.update(years=len(frozen.years), year_movies=len(year_movies))
+    sections += [array('q', frozen.years).tobytes(), year_offsets.tobytes(), year_movies.tobytes()]
+    sections += [array('q', frozen.year_totals[rollup]).tobytes() for rollup in YearIndex.ROLLUPS]
+
+    frozen.similarity._ensure_built(frozen)
+    signatures = frozen.similarity.signatures
+    signed = sorted(frozen.ids[name] for name in signatures)
+    rows = [signatures[frozen.names[i]] for i in signed]
+    bands = array('i')
+    for b in range(BANDS):
+        bands.extend(sorted(range(len(signed)), key=lambda p: rows[p][b * ROWS:(b + 1) * ROWS]))
+    table['signed'] = len(signed)
+    sections += [array('i', signed).tobytes(), array('q', [x for row in rows for x in row]).tobytes(),
+                 bands.tobytes()]
+
+    table = json.dumps(table).encode('utf-8')
+    return [array('q', [len(table)]).tobytes(), table] + sections
+
+
+'''
+Gives frozen the indexes of an indexed snapshot, so that its queries never build them
+section: returns the next section of the snapshot, see open_snapshot
+'''
+def _map_indexes(frozen, section):
+    n = frozen.num_vertices
+    table = json.loads(bytes(section(section(8, 'q')[0])).decode('utf-8'))
+
+    rankings = {}
+    for by in Leaderboards.RANKINGS:
+        k = table['rankings'][by]
+        keys = section(8 * k, 'q')
+        rankings[by] = _Ranking(None if by == 'age_income' else frozen.names, keys, section(8 * k, 'q'))
+
+    names_by_type = section(4 * n, 'i')
+    gram_offsets = section(8 * (table['grams'] + 1), 'q')
+    posting_offsets = section(8 * (table['grams'] + 1), 'q')
+    postings = section(4 * table['postings'], 'i')
+    grams = _StringTable(section(table['gram_bytes']), gram_offsets)
+
+    y = table['years']
+    years = section(8 * y, 'q')
+    year_offsets = section(8 * (y + 1), 'q')
+    year_movies = section(4 * table['year_movies'], 'i')
+    year_totals = {rollup: section(8 * (y + 1), 'q') for rollup in YearIndex.ROLLUPS}
+
+    s = table['signed']
+    signed = section(4 * s, 'i')
+    signatures = section(8 * s * NUM_HASHES, 'q')
+    bands = section(4 * BANDS * s, 'i')
+
+    frozen.rankings = rankings
+    frozen.name_index = _MappedNameIndex(grams, posting_offsets, postings, names_by_type)
+    frozen.year_index = _YearMovies(years, year_offsets, year_movies)
+    frozen.years = years
+    frozen.year_totals = year_totals
+    frozen.similarity = _MappedSimilarity(signed, signatures, bands)
+
+
+'''
+Writes a frozen graph to path
+the file is written next to path and renamed into place, so readers never see a partial snapshot
+:param checksum: sha256 digest of the source the graph was built from
+:param indexes: whether to build the indexes of the graph and write them too
+'''
+def write(frozen, path, checksum=b'', indexes=False):
+    n = frozen.num_vertices
+    encoded = [frozen.names[i].encode('utf-8') for i in range(n)]
+
+    name_offsets = array('q', [0])
+    for name in encoded:
+        name_offsets.append(name_offsets[-1] + len(name))
+    sorted_ids = array('i', sorted(range(n), key=lambda i: encoded[i]))
+    type_table = json.dumps([[t, start, end] for t, (start, end) in frozen.type_ranges.items()]).encode('utf-8')
+    blob = b''.join(encoded)
+
+    sections = [
+        type_table,
+        array('q', name_offsets).tobytes(),
+        sorted_ids.tobytes(),
+        array('b', frozen.types).tobytes(),
+        array('q', frozen.info).tobytes(),
+        array('q', frozen.income).tobytes(),
+        array('q', frozen.offsets).tobytes(),
+        array('i', frozen.targets).tobytes(),
+        array('q', frozen.weights).tobytes(),
+        blob,
+    ]
+    if indexes:
+        sections += _index_sections(frozen)
+
+    # a unique name, so that two writers of the same path never write to the same file
+    fd, tmp_path = tempfile.mkstemp(prefix=os.path.basename(path) + '.', suffix='.tmp',
+                                    dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            flags = (MATERIALIZED_COSTARS if frozen.materialize_costars else 0) | (INDEXED if indexes else 0)
+            header = HEADER.pack(MAGIC, FORMAT_VERSION, flags, checksum.ljust(32, b'\0'), n,
+                                 len(frozen.targets), len(type_table), len(blob))
+            file.write(header + b'\0' * _padding(len(header)))
+            for section in sections:
+                file.write(section + b'\0' * _padding(len(section)))
+            # make the new file durable before it replaces the old one
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+'''
+Returns the source checksum stored in a snapshot, or None if the file is missing
+or is not a snapshot this version can read
+'''
+def read_checksum(path):
+    try:
+        with open(path, 'rb') as file:
+            header = file.read(HEADER.size)
+    except OSError:
+        return None
+    if len(header) < HEADER.size:
+        return None
+    magic, version, flags, checksum = HEADER.unpack(header)[:4]
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    return checksum
+
+
+'''
+Opens a snapshot as a FrozenGraph backed by a read-only memory map
+the indexes of an indexed snapshot are read from the map too, rather than built by the graph
+'''
+def open_snapshot(path):
+    # the arrays are read in place, which needs a little endian machine
+    if sys.byteorder != 'little':
+        raise ValueError('snapshots can only be mapped on little endian machines')
+
+    with open(path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, flags, checksum, n, m, type_table_size, blob_size = HEADER.unpack_from(mapped, 0)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(path + ' is not a version ' + str(FORMAT_VERSION) + ' graph snapshot')
+
+    view = memoryview(mapped)
+    pos = HEADER.size + _padding(HEADER.size)
+
+    # returns the next section of the file, cast to the given array type code
+    def section(size, format=None):
+        nonlocal pos
+        data = view[pos:pos + size]
+        pos += size + _padding(size)
+        return data.cast(format) if format else data
+
+    type_table = json.loads(bytes(section(type_table_size)).decode('utf-8'))
+    name_offsets = section(8 * (n + 1), 'q')
+    sorted_ids = section(4 * n, 'i')
+    types = section(n, 'b')
+    info = section(8 * n, 'q')
+    income = section(8 * n, 'q')
+    offsets = section(8 * (n + 1), 'q')
+    targets = section(4 * m, 'i')
+    weights = section(8 * m, 'q')
+    blob = section(blob_size)
+
+    type_names = [None] * len(type_table)
+    type_ranges = {}
+    for t, start, end in type_table:
+        type_names[types[start]] = t
+        type_ranges[t] = (start, end)
+
+    names = _StringTable(blob, name_offsets)
+    ids = _NameIndex(names, sorted_ids)
+    frozen = FrozenGraph(names, ids, type_names, types, info, income, offsets, targets, weights, type_ranges,
+                         materialize_costars=bool(flags & MATERIALIZED_COSTARS))
+    if flags & INDEXED:
+        _map_indexes(frozen, section)
+    # keep the mapping alive for as long as the graph is
+    frozen.mapped = mapped
+    return frozen
+
+
+'''
+Opens the snapshot of source at path, rebuilding it from source first
+if it is missing, unreadable or was built from a different version of source
+telling the versions apart reads the whole source, to checksum it
+:return FrozenGraph of source
+'''
+def load_or_build(source='data.json', path='data.snapshot'):
+    checksum = file_checksum(source)
+    if read_checksum(path) != checksum:
+        logging.info('Rebuilding graph snapshot ' + path + ' from ' + source)
+        # only pay for the JSON loader when the snapshot is stale
+        import CreateGraph
+        write(CreateGraph.createGraph(source).freeze(), path, checksum)
+    return open_snapshot(path)
@@ -1,5 +1,28 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
 import unittest
 from CreateGraph import *
+from FrozenGraph import FrozenGraph
+from GraphListener import GraphListener
+from NameIndex import NameIndex
+from Visualization import *
+import matplotlib.pyplot as plt
+import Analytics
+import Batch
+import Benchmark
+import Centrality
+import HotReload
+import Metrics
+import MutationLog
+import Prefork
+import RWLock
+import Sharding
+import Snapshot
 
 
 class TestStringMethods(unittest.TestCase):
@@ -40,6 +63,528 @@ class TestStringMethods(unittest.TestCase):
         self.assertEquals(highest_grossing_ages[0][0], 61)
 
 
+    def test_type_and_year_indexes(self):
+        g = Graph()
+        g.add_edge('Actor A', 40, 10, 'Actor', 'Movie A', 1999, 100, 'Movie', 10)
+        g.add_edge('Actor B', 50, 20, 'Actor', 'Movie A', 1999, 100, 'Movie', 20)
+        g.add_vertex('Movie B', 2001, 50, 'Movie')
+
+        self.assertEqual(g.get_actors(), ['Actor A', 'Actor B'])
+        self.assertEqual(g.get_movies_by_year(1999), ['Movie A'])
+        self.assertTrue(g.has_vertex('Movie B', 'Movie'))
+        self.assertFalse(g.has_vertex('Movie B', 'Actor'))
+
+        g.remove_vertex('Movie A')
+        self.assertEqual(g.get_movies(), ['Movie B'])
+        self.assertEqual(g.get_movies_by_year(1999), [])
+        self.assertEqual(g.get_movies_by_actor('Actor A'), [])
+
+
+    def test_from_records(self):
+        records = [
+            {'json_class': 'Actor', 'name': 'Actor A', 'age': 40, 'total_gross': 10},
+            {'json_class': 'Actor', 'name': 'Actor B', 'age': 50, 'total_gross': 20},
+            {'json_class': 'Movie', 'name': 'Movie A', 'year': 1999, 'box_office': 100,
+             'actors': ['Actor A', 'Actor B']},
+        ]
+        g = Graph.from_records(records)
+
+        self.assertEqual(g.get_actors_by_movie('Movie A'), ['Actor A', 'Actor B'])
+        self.assertEqual(g.get_movies_by_actor('Actor B'), ['Movie A'])
+        self.assertEqual(g.get_hub_actors(), [('Actor B', 1), ('Actor A', 1)])
+
+
+    def test_frozen_graph_queries(self):
+        frozen = self.graph.freeze()
+
+        self.assertEqual(frozen.get_actors(), self.graph.get_actors())
+        self.assertEqual(frozen.get_hub_actors(), self.graph.get_hub_actors())
+        self.assertEqual(frozen.highest_grossing_ages(), self.graph.highest_grossing_ages())
+        self.assertEqual(frozen.get_top_x_paid_actors(25), self.graph.get_top_x_paid_actors(25))
+        self.assertEqual(frozen.get_movies_by_actor('Bruce Willis'), self.graph.get_movies_by_actor('Bruce Willis'))
+        self.assertEqual(frozen.thaw().get_hub_actors(), self.graph.get_hub_actors())
+
+
+    def test_snapshot_round_trip(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.snapshot')
+            Snapshot.write(self.graph.freeze(), path)
+            snapshot = Snapshot.open_snapshot(path)
+
+            self.assertEqual(snapshot.get_actors(), self.graph.get_actors())
+            self.assertEqual(snapshot.get_hub_actors(), self.graph.get_hub_actors())
+            self.assertEqual(snapshot.get_vertex('Bruce Willis').get_info(), 61)
+            self.assertIsNone(snapshot.get_vertex('Not An Actor'))
+            # only the snapshot is left, the temporary file was renamed into place
+            self.assertEqual(os.listdir(directory), ['test.snapshot'])
+
+            # the snapshot answers the read queries the api serves
+            for by in ('paid', 'age', 'connections', 'income', 'age_income'):
+                self.assertEqual(snapshot.get_ranking(by, 2, 10), self.graph.get_ranking(by, 2, 10))
+                self.assertEqual(snapshot.get_ranking_size(by), self.graph.get_ranking_size(by))
+            self.assertEqual(snapshot.search_names('Will', 'Actor', 5), self.graph.search_names('Will', 'Actor', 5))
+            self.assertEqual(snapshot.page_names('Movie', 'M', 5), self.graph.page_names('Movie', 'M', 5))
+            self.assertEqual(snapshot.get_movies_in_range(1990, 1995), self.graph.get_movies_in_range(1990, 1995))
+            self.assertEqual(snapshot.get_year_totals(1990, 1995), self.graph.get_year_totals(1990, 1995))
+            self.assertEqual(len(snapshot.shortest_path('Bruce Willis', 'Tom Hanks', True)),
+                             len(self.graph.shortest_path('Bruce Willis', 'Tom Hanks', True)))
+
+            # an indexed snapshot answers them from the indexes it maps
+            Snapshot.write(self.graph.freeze(), path, indexes=True)
+            indexed = Snapshot.open_snapshot(path)
+            for by in ('paid', 'age', 'connections', 'income', 'age_income'):
+                self.assertEqual(indexed.get_ranking(by, 2, 10), self.graph.get_ranking(by, 2, 10))
+                self.assertEqual(indexed.get_ranking_size(by), self.graph.get_ranking_size(by))
+            for query in ('', 'a', 'Will', 'bruce'):
+                self.assertEqual(indexed.search_names(query, None, 5), snapshot.search_names(query, None, 5))
+            self.assertEqual(indexed.page_names('Movie', 'M', 5), self.graph.page_names('Movie', 'M', 5))
+            self.assertEqual(indexed.get_movies_in_range(1990, 1995), self.graph.get_movies_in_range(1990, 1995))
+            self.assertEqual(indexed.get_year_totals(1990, 1995), self.graph.get_year_totals(1990, 1995))
+            for actor in self.graph.get_actors()[:50]:
+                self.assertEqual(indexed.similar_actors(actor, 5), snapshot.similar_actors(actor, 5))
+            self.assertNotIsInstance(indexed.name_index, NameIndex)
+
+
+    def test_vectorized_analytics(self):
+        frozen = self.graph.freeze()
+
+        self.assertEqual(Analytics.get_top_x_paid_actors(frozen, 25), self.graph.get_top_x_paid_actors(25))
+        self.assertEqual(Analytics.get_oldest_x_actors(frozen, 25), self.graph.get_oldest_x_actors(25))
+        self.assertEqual(Analytics.get_hub_actors(frozen), self.graph.get_hub_actors())
+        self.assertEqual(Analytics.get_hub_actors(frozen, 25), self.graph.get_hub_actors()[:25])
+        self.assertEqual(Analytics.highest_grossing_ages(frozen), self.graph.highest_grossing_ages())
+
+        # a Graph is frozen once, and again only after it changes
+        g = createGraph()
+        self.assertIs(Analytics._arrays(g), Analytics._arrays(g))
+        g.get_vertex('Bruce Willis').set_income(0)
+        self.assertEqual(Analytics.get_ranking(g, 'income'), g.get_ranking('income'))
+
+
+    def test_implicit_costars(self):
+        implicit = createGraph(materialize_costars=False)
+        self.assertEqual(implicit.get_hub_actors(), self.graph.get_hub_actors())
+        self.assertEqual(Analytics.get_hub_actors(implicit.freeze()), self.graph.get_hub_actors())
+        self.assertEqual(sorted(implicit.get_costars('Bruce Willis')), sorted(self.graph.get_costars('Bruce Willis')))
+
+        # the rankings follow co-stars gained through a shared movie
+        g = Graph(materialize_costars=False)
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+        self.assertEqual(g.get_hub_actors(), [('Actor B', 1), ('Actor A', 1)])
+        g.add_edge('Actor C', 30, 5, 'Actor', 'Movie A', 1999, 100, 'Movie', 5)
+        self.assertEqual(g.get_costar_count('Actor A'), 2)
+        self.assertEqual(g.get_hub_actors(), [('Actor C', 2), ('Actor B', 2), ('Actor A', 2)])
+
+
+    def test_centrality(self):
+        # Actor A and Actor C are only connected through Actor B
+        g = Graph()
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+        g.add_movie_with_cast('Movie B', 2001, 100, [('Actor B', 20, 50), ('Actor C', 30, 60)])
+
+        for workers in (1, 2):
+            self.assertEqual(Centrality.betweenness_centrality(g, workers=workers),
+                             [('Actor B', 1.0), ('Actor C', 0.0), ('Actor A', 0.0)])
+            closeness = Centrality.closeness_centrality(g, workers=workers)
+            self.assertEqual(closeness[0], ('Actor B', 1.0))
+            self.assertAlmostEqual(dict(closeness)['Actor A'], 2 / 3)
+
+        pagerank = Centrality.pagerank(g)
+        self.assertEqual(pagerank[0][0], 'Actor B')
+        self.assertAlmostEqual(sum(rank for actor, rank in pagerank), 1.0)
+        self.assertEqual(Centrality.betweenness_centrality(self.graph, 1, samples=100, seed=1)[0][0], 'Bruce Willis')
+
+
+    def test_benchmark_dataset(self):
+        actors, movies = Benchmark.generate(scale=2, seed=1)
+        self.assertEqual((len(actors), len(movies)), (2 * Benchmark.BASE_ACTORS, 2 * Benchmark.BASE_MOVIES))
+        self.assertEqual(Benchmark.generate(scale=2, seed=1), [actors, movies])
+
+        path = os.path.join(tempfile.mkdtemp(), 'data.json')
+        Benchmark.write_dataset(path, scale=2, seed=1)
+        g = createGraph(path)
+        self.assertEqual(len(g.get_movies()), len(movies))
+        for name, movie in movies.items():
+            self.assertEqual(sorted(g.get_actors_by_movie(name)), sorted(movie['actors']))
+
+        # every cold call is preceded by a reset, the warm calls are not
+        calls = []
+        timing = Benchmark.time_calls(lambda: calls.append('call'), 3, lambda: calls.append('reset'))
+        self.assertEqual(calls, ['call', 'reset', 'call', 'reset', 'call', 'call', 'call', 'call'])
+        self.assertLessEqual(timing['cold_best'], timing['cold_mean'])
+
+
+    def test_metrics(self):
+        original = Graph.shortest_path
+        Metrics.enable()
+        try:
+            self.graph.shortest_path('Bruce Willis', 'Tim Roth')
+            self.graph.shortest_path('Bruce Willis', 'Tim Roth')
+        finally:
+            Metrics.disable()
+        self.assertIs(Graph.shortest_path, original)
+
+        text = Metrics.registry.render()
+        self.assertIn('# TYPE graph_method_duration_seconds histogram', text)
+        self.assertIn('graph_method_duration_seconds_bucket{method="shortest_path",le="+Inf"} 2', text)
+        self.assertIn('graph_method_duration_seconds_count{method="shortest_path"} 2', text)
+
+
+    def test_query_cache(self):
+        g = Graph()
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+        self.assertEqual(g.get_actors_by_year(1999), ['Actor A', 'Actor B'])
+        self.assertEqual(g.get_movies_by_actor('Actor A'), ['Movie A'])
+
+        # a change to another year or vertex keeps the cached results
+        g.add_movie_with_cast('Movie B', 2001, 100, [('Actor B', 20, 50), ('Actor C', 30, 60)])
+        cached = g.query_cache.entries.get(('movies_by_actor', 'Actor A'))
+        self.assertEqual(g.get_movies_by_actor('Actor A'), ['Movie A'])
+        self.assertIs(g.query_cache.entries.get(('movies_by_actor', 'Actor A')), cached)
+
+        g.add_edge('Actor C', 60, 30, 'Actor', 'Movie A', 1999, 100, 'Movie', 5)
+        self.assertEqual(g.get_actors_by_year(1999), ['Actor A', 'Actor B', 'Actor C'])
+        g.remove_vertex('Movie A')
+        self.assertEqual(g.get_actors_by_year(1999), [])
+        self.assertEqual(g.get_movies_by_actor('Actor A'), [])
+
+
+    def test_sharded_graph(self):
+        with Sharding.ShardedGraph.from_file('data.json', num_shards=3) as sharded:
+            self.assertEqual(sharded.get_hub_actors(), self.graph.get_hub_actors())
+            for x in (1, 25, 1000):
+                self.assertEqual(sharded.get_top_x_paid_actors(x), self.graph.get_top_x_paid_actors(x))
+            self.assertEqual(sharded.get_actors_by_year(1999), self.graph.get_actors_by_year(1999))
+            self.assertEqual(sorted(sharded.get_movies_by_actor('Bruce Willis')),
+                             sorted(self.graph.get_movies_by_actor('Bruce Willis')))
+            self.assertEqual(sorted(sharded.search_names('Will', 'Actor')),
+                             sorted(self.graph.search_names('Will', 'Actor')))
+            with self.assertRaises(KeyError):
+                sharded._scatter('get_ranking', ('height',))
+
+
+    def test_mutation_log(self):
+        directory = tempfile.mkdtemp()
+        store = MutationLog.GraphStore(directory)
+        # nothing to replay, the snapshot is served as it is mapped until the first write
+        g = store.load()
+        self.assertIsInstance(g, FrozenGraph)
+        with g.lock.write():
+            g = store.mutable()
+            g.get_vertex('Bruce Willis').set_income(5)
+            g.add_edge('New Actor', 30, 1, 'Actor', 'Die Hard', 1988, 0, 'Movie', 7)
+            g.remove_vertex('Tim Roth')
+        edges = sum(len(v.get_neighbors()) for v in g)
+        self.assertEqual(g.get_costars('New Actor'), [])
+        store.close()
+
+        # the replay makes exactly the logged changes, the new actor gets no co-star edges
+        store = MutationLog.GraphStore(directory)
+        g = store.load()
+        self.assertEqual(g.get_vertex('Bruce Willis').get_income(), 5)
+        self.assertIn('New Actor', g.get_actors_by_movie('Die Hard'))
+        self.assertFalse(g.has_vertex('Tim Roth'))
+        self.assertEqual(g.get_costars('New Actor'), [])
+        self.assertEqual(sum(len(v.get_neighbors()) for v in g), edges)
+
+        with g.lock.write():
+            for i in range(20):
+                g.add_vertex('Actor ' + str(i), 30, i, 'Actor')
+        store.compact()
+        g.get_vertex('Actor 0').set_income(99)
+        store.close()
+        self.assertEqual(len(store.manifest['logs']), 1)
+        self.assertNotEqual(store.manifest['snapshot'], 'snapshot-0')
+
+        store = MutationLog.GraphStore(directory)
+        g = store.load()
+        self.assertEqual(g.get_vertex('Actor 0').get_income(), 99)
+        self.assertEqual(g.get_vertex('Actor 19').get_income(), 19)
+        self.assertFalse(g.has_vertex('Tim Roth'))
+        store.close()
+
+
+    def test_mutation_log_follows_source(self):
+        directory = tempfile.mkdtemp()
+        source = os.path.join(directory, 'data.json')
+        actors = {'Actor A': {'age': 40, 'total_gross': 10}, 'Actor B': {'age': 50, 'total_gross': 20}}
+        movies = {'Movie A': {'year': 1999, 'box_office': 100, 'actors': ['Actor A', 'Actor B']}}
+        with open(source, 'w') as file:
+            json.dump([actors, movies], file)
+
+        def open_store():
+            return MutationLog.GraphStore(os.path.join(directory, 'store'), source,
+                                          os.path.join(directory, 'data.snapshot'))
+
+        store = open_store()
+        store.load()
+        with self.assertRaises(MutationLog.StoreLockedError):
+            open_store().load()
+        store.mutable().add_vertex('Actor C', 30, 5, 'Actor')
+        store.close()
+
+        movies['Movie A']['box_office'] = 75
+        movies['Movie B'] = {'year': 2005, 'box_office': 10, 'actors': ['Actor B']}
+        with open(source, 'w') as file:
+            json.dump([actors, movies], file)
+
+        store = open_store()
+        g = store.load()
+        self.assertEqual(g.get_vertex('Movie A').get_income(), 75)
+        self.assertEqual(g.get_movies_by_actor('Actor B'), ['Movie A', 'Movie B'])
+        self.assertTrue(g.has_vertex('Actor C'))
+        store.close()
+
+        # the changes were logged and the new file recorded, the next load has nothing to apply
+        store = open_store()
+        g = store.load()
+        self.assertEqual(store.manifest['source_checksum'], Snapshot.file_checksum(source).hex())
+        self.assertEqual(sorted(g.get_movies()), ['Movie A', 'Movie B'])
+        store.close()
+
+        # a source touched but not changed is not reloaded, its new stat is recorded
+        os.utime(source, ns=(0, 0))
+        store = open_store()
+        store.load()
+        self.assertIsNone(store.reloader)
+        self.assertEqual(store.manifest['source_stat'], [0, os.path.getsize(source)])
+        store.close()
+
+
+    def test_year_ranges(self):
+        nineties = [m for m in self.graph.get_movies() if 1990 <= self.graph.get_vertex(m).get_info() <= 1999]
+        self.assertEqual(sorted(self.graph.get_movies_in_range(1990, 1999)), sorted(nineties))
+        self.assertEqual(len(self.graph.get_movies_in_range()), len(self.graph.get_movies()))
+
+        g = Graph()
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+        g.add_movie_with_cast('Movie B', 2001, 50, [('Actor A', 30, 40)])
+        self.assertEqual(g.get_year_totals(1990, 2010), {'movies': 2, 'box_office': 150, 'actors': 3})
+
+        g.add_movie_with_cast('Movie C', 1995, 25, [('Actor B', 5, 50)])
+        g.get_vertex('Movie A').set_income(200)
+        g.remove_vertex('Movie B')
+        self.assertEqual(g.get_movies_in_range(1990, 2000), ['Movie C', 'Movie A'])
+        self.assertEqual(g.get_year_totals(1996), {'movies': 1, 'box_office': 200, 'actors': 2})
+        self.assertEqual(g.get_year_totals(2000, 2010), {'movies': 0, 'box_office': 0, 'actors': 0})
+
+
+    def test_similar_actors(self):
+        g = Graph()
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50), ('Actor C', 5, 30)])
+        g.add_movie_with_cast('Movie B', 2001, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+        g.add_movie_with_cast('Movie C', 2003, 100, [('Actor D', 10, 40)])
+        self.assertEqual(g.similar_actors('Actor A', 1), [('Actor B', 1.0)])
+        self.assertEqual(g.similar_actors('Actor D'), [])
+
+        g.add_edge('Actor D', 40, 10, 'Actor', 'Movie A', 1999, 100, 'Movie', 5)
+        g.add_edge('Actor D', 40, 10, 'Actor', 'Movie B', 2001, 100, 'Movie', 5)
+        g.remove_vertex('Movie C')
+        g.remove_vertex('Actor B')
+        self.assertEqual(g.similar_actors('Actor A', 1), [('Actor D', 1.0)])
+
+
+    def test_prefork_publisher(self):
+        g = Graph()
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40)])
+        publisher = Prefork.Publisher(tempfile.mkdtemp(), multiprocessing.Value('q', 0, lock=False))
+        reader = Prefork.SnapshotReader(publisher)
+
+        self.assertTrue(publisher.publish(g))
+        self.assertFalse(publisher.publish(g))
+        self.assertEqual(reader.current().get_movies_by_actor('Actor A'), ['Movie A'])
+
+        g.get_vertex('Actor A').set_income(20)
+        publisher.publish(g)
+        g.add_vertex('Actor B', 30, 5, 'Actor')
+        publisher.publish(g)
+        self.assertEqual(reader.current().get_vertex('Actor A').get_income(), 20)
+        self.assertTrue(reader.current().has_vertex('Actor B'))
+        self.assertEqual(len(os.listdir(publisher.directory)), 2)
+        self.assertEqual(reader.current().get_ranking('income'), [('Actor A', 20), ('Actor B', 5)])
+
+        # a burst of writes is published once it settles, or once it has waited PUBLISH_MAX_DELAY
+        self.assertFalse(publisher.due(g, 0))
+        g.add_vertex('Actor C', 30, 5, 'Actor')
+        self.assertFalse(publisher.due(g, 0))
+        g.add_vertex('Actor D', 30, 5, 'Actor')
+        self.assertFalse(publisher.due(g, 1))
+        self.assertTrue(publisher.due(g, 2))
+        g.add_vertex('Actor E', 30, 5, 'Actor')
+        self.assertTrue(publisher.due(g, Prefork.PUBLISH_MAX_DELAY))
+
+
+    def test_hot_reload(self):
+        path = os.path.join(tempfile.mkdtemp(), 'data.json')
+        actors = {name: {'age': age, 'total_gross': gross} for name, age, gross in
+                  [('Actor A', 40, 10), ('Actor B', 50, 20), ('Actor C', 30, 5)]}
+        movies = {'Movie A': {'year': 1999, 'box_office': 100, 'actors': ['Actor A', 'Actor B']},
+                  'Movie B': {'year': 2001, 'box_office': 50, 'actors': ['Actor B', 'Actor C']}}
+        with open(path, 'w') as file:
+            json.dump([actors, movies], file)
+        g = Graph.from_records(iter_records(path))
+        reloader = HotReload.HotReloader(g, path)
+
+        actors['Actor A']['age'] = 41
+        movies['Movie A']['actors'] = ['Actor A']
+        movies['Movie B']['box_office'] = 75
+        movies['Movie C'] = {'year': 2005, 'box_office': 10, 'actors': ['Actor C']}
+        with open(path, 'w') as file:
+            json.dump([actors, movies], file)
+        os.utime(path, ns=(0, 0))
+
+        self.assertEqual(reloader.reload(), 4)
+        self.assertEqual(reloader.reload(), 0)
+        expected = Graph.from_records(iter_records(path))
+        for v in expected:
+            w = g.get_vertex(v.get_id())
+            self.assertEqual((w.get_info(), w.get_income()), (v.get_info(), v.get_income()))
+            self.assertEqual(sorted(g.get_costars(v.get_id()) if v.get_type() == 'Actor' else []),
+                             sorted(expected.get_costars(v.get_id()) if v.get_type() == 'Actor' else []))
+        self.assertEqual(sorted(g.get_vertices()), sorted(expected.get_vertices()))
+
+
+    def test_leaderboards_follow_mutations(self):
+        g = Graph()
+        g.add_edge('Actor A', 40, 10, 'Actor', 'Movie A', 1999, 100, 'Movie', 10)
+        g.add_edge('Actor B', 50, 20, 'Actor', 'Movie A', 1999, 100, 'Movie', 20)
+        self.assertEqual(g.get_top_x_paid_actors(2), ['Actor B', 'Actor A'])
+
+        g.add_edge('Actor A', 40, 10, 'Actor', 'Movie B', 2001, 100, 'Movie', 30)
+        g.get_vertex('Actor B').set_income(5)
+        self.assertEqual(g.get_ranking('paid'), [('Actor A', 40), ('Actor B', 20)])
+        self.assertEqual(g.get_ranking('income', 0, 1), [('Actor A', 10)])
+
+        g.remove_vertex('Movie B')
+        self.assertEqual(g.get_ranking('paid', 1), [('Actor A', 10)])
+        self.assertEqual(g.highest_grossing_ages(), [(40, 10), (50, 5)])
+
+
+    def test_name_search(self):
+        expected = [x for x in self.graph.get_movies() if 'Die Hard' in x]
+        self.assertEqual(sorted(self.graph.search_names('Die Hard', 'Movie')), sorted(expected))
+        self.assertEqual(len(self.graph.search_names('Die', 'Movie', limit=1)), 1)
+        self.assertEqual(self.graph.search_names('Willis', 'Movie'), [])
+        self.assertIn('Bruce Willis', self.graph.search_names('Wil', 'Actor'))
+
+
+    def test_page_names(self):
+        movies = sorted(self.graph.get_movies())
+        first = self.graph.page_names('Movie', limit=10)
+        second = self.graph.page_names('Movie', after=first[-1], limit=10)
+
+        self.assertEqual(first + second, movies[:20])
+        self.assertEqual(self.graph.page_names('Movie', after=movies[-1]), [])
+
+
+    def test_versions(self):
+        g = Graph()
+        g.add_edge('Actor A', 40, 10, 'Actor', 'Movie A', 1999, 100, 'Movie', 10)
+        g.add_vertex('Actor B', 50, 20, 'Actor')
+        version = g.version
+        movie_version = g.get_vertex_version('Movie A')
+
+        g.get_vertex('Actor B').set_income(30)
+        self.assertGreater(g.version, version)
+        self.assertEqual(g.get_vertex_version('Movie A'), movie_version)
+
+        g.remove_vertex('Actor A')
+        self.assertGreater(g.get_vertex_version('Movie A'), movie_version)
+        self.assertEqual(g.get_vertex_version('Actor A'), g.version)
+
+
+    def test_apply_batch(self):
+        g = Graph()
+        results = Batch.apply_batch(g, [
+            {'op': 'upsert', 'type': 'Actor', 'name': 'Actor A', 'info': 40, 'income': 10},
+            {'op': 'upsert', 'type': 'Movie', 'name': 'Movie A', 'info': 1999, 'income': 100},
+            {'op': 'edge', 'from': 'Actor A', 'to': 'Movie A', 'weight': 10},
+            {'op': 'income', 'name': 'Actor A', 'income': 20},
+            {'op': 'delete', 'name': 'Movie B'},
+            {'op': 'income', 'name': 'Actor A'},
+        ])
+
+        self.assertEqual([r['status'] for r in results], ['created', 'created', 'linked', 'updated', 'not found', 'error'])
+        self.assertEqual(g.get_movies_by_actor('Actor A'), ['Movie A'])
+        self.assertEqual(g.get_vertex('Actor A').get_income(), 20)
+
+        # linking an actor to a movie makes them a co-star of its cast, as a fresh build would
+        for materialize_costars in (True, False):
+            g = Graph(materialize_costars)
+            g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+            before = g.get_hub_actors()
+            results = Batch.apply_batch(g, [
+                {'op': 'upsert', 'type': 'Actor', 'name': 'Actor C', 'info': 30, 'income': 5},
+                {'op': 'edge', 'from': 'Actor C', 'to': 'Movie A', 'weight': 5},
+                {'op': 'upsert', 'type': 'Actor', 'name': 'Actor A', 'info': 99},
+            ])
+            self.assertEqual([r['status'] for r in results], ['created', 'linked', 'error'])
+            self.assertEqual(g.get_hub_actors(), [('Actor C', 2), ('Actor B', 2), ('Actor A', 2)])
+            self.assertEqual(g.get_vertex('Actor A').get_info(), 40)
+
+            # unlinking undoes the link, co-stars included
+            results = Batch.apply_batch(g, [{'op': 'unlink', 'from': 'Movie A', 'to': 'Actor C'},
+                                            {'op': 'delete', 'name': 'Actor C'}])
+            self.assertEqual([r['status'] for r in results], ['unlinked', 'deleted'])
+            self.assertEqual(g.get_hub_actors(), before)
+            self.assertEqual(sum(len(v.get_neighbors()) for v in g), 6 if materialize_costars else 4)
+
+        # the indexes are told about a batch once, with every vertex it changed
+        class Recorder(GraphListener):
+            BATCHED = True
+
+            def __init__(self):
+                self.calls = []
+
+            def batch_changed(self, graph, changed):
+                self.calls.append(sorted(changed))
+
+            def edge_added(self, graph, v, w, old_weight, weight):
+                self.calls.append('edge')
+
+        recorder = Recorder()
+        g.add_listener(recorder)
+        Batch.apply_batch(g, [{'op': 'upsert', 'type': 'Actor', 'name': 'Actor D', 'info': 30, 'income': 5},
+                              {'op': 'edge', 'from': 'Actor D', 'to': 'Movie A', 'weight': 5},
+                              {'op': 'income', 'name': 'Movie A', 'income': 1}])
+        self.assertEqual(recorder.calls, [['Actor A', 'Actor B', 'Actor D', 'Movie A']])
+
+
+    def test_shortest_path(self):
+        path = self.graph.shortest_path('Bruce Willis', 'Paul Newman', movies_only=True)
+
+        self.assertEqual(path[0], 'Bruce Willis')
+        self.assertEqual(path[-1], 'Paul Newman')
+        self.assertEqual(len(path), 5)
+        for actor, movie in zip(path, path[1:]):
+            self.assertIn('Movie', (self.graph.get_vertex(actor).get_type(), self.graph.get_vertex(movie).get_type()))
+        self.assertIsNone(self.graph.shortest_path('Bruce Willis', 'Paul Newman', movies_only=True, max_depth=3))
+
+
+    def test_ego_network(self):
+        levels, edges = ego_network(self.graph, 'Die Hard', hops=2, max_nodes=10, rank_by='degree')
+        self.assertEqual(len(levels), 10)
+        self.assertEqual(levels['Die Hard'], 0)
+        self.assertEqual(levels['Bruce Willis'], 1)
+        self.assertTrue(all(a in levels and b in levels for a, b in edges))
+
+        g = Graph()
+        g.add_movie_with_cast('Movie A', 1999, 100, [('Actor A', 10, 40), ('Actor B', 20, 50)])
+        layout = ego_layout(g, 'Movie A')
+        self.assertIs(ego_layout(g, 'Movie A'), layout)
+        g.add_edge('Actor C', 30, 5, 'Actor', 'Movie A', 1999, 100, 'Movie', 5)
+        self.assertEqual(len(ego_layout(g, 'Movie A')[0]), 4)
+
+        # a graph that replaces a collected one, at the same version, does not get its layouts
+        version = g.version
+        del g, layout
+        for i in range(100):
+            other = Graph()
+            other.add_vertex('Movie A', 1999, 100, 'Movie')
+            other.version = version
+            self.assertEqual(len(ego_layout(other, 'Movie A')[0]), 1)
+
+
     def test_graph_visualization(self):
         # clear previous plt graphs
         plt.clf()
@@ -51,6 +596,226 @@ class TestStringMethods(unittest.TestCase):
         plt3.savefig('outputs/visualization.pdf')
 
 
+    def test_rwlock(self):
+        lock = RWLock.RWLock()
+        events = []
+
+        def read(name):
+            with lock.read():
+                events.append(name)
+
+        def write(name):
+            with lock.write():
+                events.append(name)
+
+        # a writer excludes readers
+        with lock.write():
+            reader = threading.Thread(target=read, args=('reader',))
+            reader.start()
+            reader.join(0.1)
+            self.assertTrue(reader.is_alive())
+            self.assertEqual(events, [])
+        reader.join()
+        self.assertEqual(events, ['reader'])
+
+        # readers share the lock, and a waiting writer goes before readers that come after it
+        del events[:]
+        with lock.read():
+            read('shared')
+            writer = threading.Thread(target=write, args=('writer',))
+            writer.start()
+            while not lock.waiting_writers:
+                time.sleep(0.01)
+            reader = threading.Thread(target=read, args=('late reader',))
+            reader.start()
+            reader.join(0.1)
+            self.assertTrue(reader.is_alive())
+        writer.join()
+        reader.join()
+        self.assertEqual(events, ['shared', 'writer', 'late reader'])
+
+
+
+class TestApi(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        # keep the api from logging to, or replaying, a mutation log
+        os.environ['GRAPH_DATA_DIR'] = ''
+        import api
+        cls.api = api
+
+    def setUp(self):
+        self.api.set_graph(createGraph())
+        self.client = self.api.app.test_client()
+
+
+    def test_etag(self):
+        response = self.client.get('/actors/Bruce_Willis')
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers['ETag']
+
+        response = self.client.get('/actors/Bruce_Willis', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+
+        # a change to the actor gives it a new tag
+        self.client.put('/actors/Bruce_Willis?total_gross=5')
+        response = self.client.get('/actors/Bruce_Willis', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['gross income'], 5)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+
+    def test_listings(self):
+        # whole listings are streamed, and not cached
+        response = self.client.get('/actors')
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(response.get_json()['actors'], self.api.graph.get_actors())
+
+        first = self.client.get('/actors?limit=2').get_json()
+        second = self.client.get('/actors?limit=2&cursor=' + first['next_cursor']).get_json()
+        self.assertEqual(first['actors'] + second['actors'], self.api.graph.page_names('Actor', None, 4))
+        self.assertEqual(self.client.get('/actors?cursor=a').status_code, 400)
+
+
+    def test_read_routes(self):
+        top = self.client.get('/actors/top?by=paid&limit=3').get_json()
+        self.assertEqual([entry['name'] for entry in top['actors']], self.api.graph.get_top_x_paid_actors(3))
+        self.assertEqual(self.client.get('/actors/top?by=height').status_code, 400)
+
+        years = self.client.get('/movies?from=1990&to=1995').get_json()
+        self.assertEqual(years['movies'], self.api.graph.get_movies_in_range(1990, 1995))
+        self.assertEqual(self.client.get('/movies?from=soon').status_code, 400)
+
+        path = self.client.get('/path?from=Bruce_Willis&to=Tom_Hanks').get_json()
+        self.assertEqual(path['path'][0], 'Bruce Willis')
+        self.assertEqual(path['degrees'], len(path['path']) - 1)
+        self.assertEqual(self.client.get('/path?from=Bruce_Willis&to=Nobody').status_code, 404)
+
+        self.assertEqual(self.client.get('/actors/Bruce_Willis/similar?k=3').status_code, 200)
+        self.assertEqual(self.client.get('/actors/Nobody/similar').status_code, 404)
+
+        image = self.client.get('/ego/Bruce_Willis.png?max_nodes=10')
+        self.assertEqual(image.mimetype, 'image/png')
+        self.assertTrue(image.data.startswith(b'\x89PNG'))
+
+
+    def test_write_routes(self):
+        results = self.client.post('/batch', json=[
+            {'op': 'upsert', 'type': 'Actor', 'name': 'Actor A', 'info': 40, 'income': 10},
+            {'op': 'edge', 'from': 'Actor A', 'to': 'Die Hard', 'weight': 10},
+            {'op': 'income', 'name': 'Nobody', 'income': 1},
+        ]).get_json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'linked', 'not found'])
+        self.assertIn('Die Hard', self.api.graph.get_movies_by_actor('Actor A'))
+        self.assertEqual(self.client.post('/batch', json={}).status_code, 400)
+
+        # a movie cannot take the name of an actor
+        self.assertEqual(self.client.post('/movies/Bruce_Willis').status_code, 409)
+        self.assertTrue(self.api.graph.has_vertex('Bruce Willis', 'Actor'))
+
+
+    def test_metrics_of_frozen_reads(self):
+        # the api as it starts by default, serving reads from the snapshot
+        self.api.set_graph(Snapshot.load_or_build('data.json', 'data.snapshot'))
+        Metrics.registry.clear()
+        Metrics.enable()
+        try:
+            for url in ('/actors/top?by=paid', '/path?from=Bruce_Willis&to=Tom_Hanks', '/actors?name=bruce',
+                        '/movies?from=1990&to=1995'):
+                self.assertEqual(self.client.get(url).status_code, 200)
+        finally:
+            Metrics.disable()
+        self.assertIsInstance(self.api.graph, FrozenGraph)
+
+        text = Metrics.registry.render()
+        for method in ('get_ranking', 'shortest_path', 'search_names', 'get_movies_in_range'):
+            self.assertIn('graph_method_duration_seconds_count{method="' + method + '"} 1', text)
+
+
+    def test_writes_take_the_write_lock(self):
+        graph = self.api.graph
+        with graph.lock.read():
+            writer = threading.Thread(target=self.client.put, args=('/actors/Bruce_Willis?total_gross=5',))
+            writer.start()
+            writer.join(0.1)
+            self.assertTrue(writer.is_alive())
+            self.assertNotEqual(graph.get_vertex('Bruce Willis').get_income(), 5)
+        writer.join()
+        self.assertEqual(graph.get_vertex('Bruce Willis').get_income(), 5)
+
+
+    def test_prefork_worker(self):
+        from flask import Flask, request
+        from werkzeug.serving import make_server
+        from werkzeug.test import Client
+
+        # an owner that echoes the conditional header it was forwarded
+        owner = Flask('owner')
+
+        @owner.route('/<path:path>', methods=['PUT'])
+        def echo(path):
+            return {'if-none-match': request.headers.get('If-None-Match')}, 201, {'ETag': '"tag"'}
+
+        server = make_server('127.0.0.1', 0, owner, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+
+        g = createGraph()
+        publisher = Prefork.Publisher(tempfile.mkdtemp(), multiprocessing.Value('q', 0, lock=False))
+        publisher.publish(g)
+        client = Client(Prefork.worker_app(Prefork.SnapshotReader(publisher), ('127.0.0.1', server.server_port)))
+
+        # reads are answered from the snapshot, indexes included
+        top = client.get('/actors/top?by=paid&limit=3').get_json()
+        self.assertEqual([entry['name'] for entry in top['actors']], g.get_top_x_paid_actors(3))
+        self.assertEqual(client.get('/actors?name=bruce').get_json()['movies'], g.search_names('bruce', 'Actor'))
+        self.assertEqual(client.get('/movies?from=1990&to=1995').get_json()['movies'], g.get_movies_in_range(1990, 1995))
+        self.assertEqual(client.get('/path?from=Bruce_Willis&to=Tom_Hanks').status_code, 200)
+        self.assertEqual(client.get('/actors/Bruce_Willis/similar').status_code, 200)
+        self.assertIsInstance(self.api.graph, FrozenGraph)
+
+        etag = client.get('/actors/Bruce_Willis').headers['ETag']
+        self.assertEqual(client.get('/actors/Bruce_Willis', headers={'If-None-Match': etag}).status_code, 304)
+
+        # a new generation is served on the next request
+        g.get_vertex('Bruce Willis').set_income(5)
+        publisher.publish(g)
+        response = client.get('/actors/Bruce_Willis', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['gross income'], 5)
+
+        # writes go to the owner, with their conditional headers
+        response = client.put('/actors/Bruce_Willis', headers={'If-None-Match': '"old"'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.get_json(), {'if-none-match': '"old"'})
+        self.assertEqual(response.headers['ETag'], '"tag"')
+
+
+    def test_asgi(self):
+        try:
+            import asgi
+        except ImportError:
+            self.skipTest('asgiref is not installed')
+
+        scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                 'scheme': 'http', 'path': '/actors/Bruce_Willis', 'raw_path': b'/actors/Bruce_Willis',
+                 'query_string': b'', 'root_path': '', 'headers': [], 'server': ('testserver', 80)}
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        asyncio.run(asgi.app(scope, receive, send))
+        self.assertEqual(messages[0]['status'], 200)
+        body = b''.join(message.get('body', b'') for message in messages[1:])
+        self.assertEqual(json.loads(body)['name'], 'Bruce Willis')
+
+
 
 
 if __name__ == '__main__':
@@ -17,6 +17,9 @@ class Vertex:
         self.income = income
         self.neighbors = {}
 
+        # graph the vertex belongs to, told when the income changes
+        self.graph = None
+
     def __str__(self):
         return str(self.id) + ' adjacent: ' + str([x.id for x in self.neighbors])
 
@@ -48,7 +51,10 @@ class Vertex:
         return self.income
 
     def set_income(self,income):
+        old_income = self.income
         self.income = income
+        if self.graph is not None:
+            self.graph.income_changed(self, old_income)
 
     # returns True if type movie
     # returns False if type actor
@@ -0,0 +1,240 @@
+"""
+Charts of the graph reports, and a drawing of part of the graph.
+matplotlib, networkx and numpy are only imported when a chart is drawn, so that loading
+the graph does not pay for the plotting libraries.
+
+Ego networks draw the neighborhood of one actor or movie, capped to a number of vertices, and
+their layouts are cached until the graph changes, so they can be served interactively.
+"""
+
+import weakref
+from LRUCache import LRUCache
+
+# returns Pearson correlation given a dictionary
+# where x's = the keys and y's = the values of the dictionary
+def get_correlation_from_dict(d):
+    import numpy as np
+
+    x = [x[0] for x in d]
+    y = [y[1] for y in d]
+    return np.corrcoef(x,y)[0][1]
+
+def graph_hub_actors(d):
+    import matplotlib.pyplot as plt
+
+    x_names = [x[0] for x in d]
+    x = range(len(d))
+    y = [int(y[1]) for y in d]
+
+    plt.scatter(x, y)
+    plt.xticks(x, x_names, rotation='vertical')
+    plt.title('Hub Actors')
+    plt.xlabel('Actors')
+    plt.ylabel('Number of Connections')
+
+    # Tweak spacing to prevent clipping of tick-labels
+    plt.subplots_adjust(bottom=0.15)
+    plt.tight_layout()
+
+
+    return plt
+
+
+def graph_highest_grossing_ages(d):
+    import matplotlib.pyplot as plt
+
+    x = [x[0] for x in d]
+    y = [y[1] for y in d]
+
+    correlation = get_correlation_from_dict(d)
+
+    plt.scatter(x, y)
+    plt.title('Actor Age vs Grossing Income')
+    plt.xlabel('Actors')
+    plt.ylabel('Grossing Income')
+    plt.text(2, 6, correlation, fontsize=15)
+
+    return plt
+
+
+'''
+Takes in the graph created and displays the nodes and edges
+'''
+def visualize_graph(graph):
+    import matplotlib.pyplot as plt
+    import networkx as nx
+
+    out = nx.Graph()
+
+    edges = []
+    val_map = {}
+    nodes = list(graph.get_vertices())[:10]
+    for g in nodes:
+        v = graph.get_vertex(g)
+        if v.get_type() == "Actor":
+            temp = v.get_id()
+            out.add_node(temp)
+        else:
+            temp = v.get_id()
+            out.add_node(temp)
+            val_map[temp] = "magenta"
+        for a in v.get_neighbors():
+            if a.get_type() == "Actor":
+                temp = a.get_id()
+                out.add_node(temp)
+            else:
+                temp = a.get_id()
+                out.add_node(temp)
+                val_map[temp] = "goldenrod"
+            edges.append((v.get_id(), temp))
+    out.add_edges_from(edges)
+    values = [val_map.get(node,"darkmagenta") for node in out.nodes()]
+
+    pos = nx.spring_layout(out, scale=10)
+    nx.draw_networkx(out, pos=pos, node_color = values, font_size = 5, node_size = 500, linewidths=2.0)
+
+    return plt
+
+
+# layouts of ego networks, keyed by graph, graph version and the ego network's parameters
+layout_cache = LRUCache(max_entries=256)
+
+# scores ego network vertices are ranked by when there are more than fit
+RANKINGS = {
+    'degree': lambda v: len(v.get_neighbors()),
+    'income': lambda v: v.get_income() or 0,
+}
+
+COLORS = {'Actor': 'darkmagenta', 'Movie': 'magenta'}
+CENTER_COLOR = 'goldenrod'
+
+
+'''
+Collects the ego network of a vertex: the vertex and its neighbors up to hops links away
+when a hop has more new vertices than still fit under max_nodes, the highest ranked ones are kept
+:param rank_by: 'degree' or 'income'
+:return: (hop of each vertex, as an ordered dict of name -> hop, and the edges between those vertices)
+'''
+def ego_network(graph, center, hops=1, max_nodes=50, rank_by='degree'):
+    score = RANKINGS[rank_by]
+    v = graph.get_vertex(center)
+    if v is None:
+        raise KeyError(center)
+
+    levels = {center: 0}
+    frontier = [v]
+    for hop in range(1, hops + 1):
+        if len(levels) >= max_nodes or not frontier:
+            break
+        candidates = {}
+        for u in frontier:
+            for w in u.get_neighbors():
+                if w.get_id() not in levels:
+                    candidates[w.get_id()] = w
+        ranked = sorted(candidates.values(), key=lambda w: (score(w), w.get_id()), reverse=True)
+        frontier = ranked[:max_nodes - len(levels)]
+        for w in frontier:
+            levels[w.get_id()] = hop
+
+    edges = []
+    for name in levels:
+        for w in graph.get_vertex(name).get_neighbors():
+            # each edge once, from its endpoint that comes first
+            if w.get_id() in levels and name < w.get_id():
+                edges.append((name, w.get_id()))
+    return levels, edges
+
+
+'''
+Places the vertices of an ego network on concentric circles, one per hop, with the center in the middle
+each ring is ordered by the mean angle of the vertices of the previous ring it is linked to,
+which keeps neighbors close and edges short; the sort makes this O(n log n) in the vertices,
+where a force directed layout iterates over every pair
+:return: dict of name -> (x, y)
+'''
+def shell_layout(levels, edges):
+    import math
+
+    adjacent = {name: [] for name in levels}
+    for a, b in edges:
+        adjacent[a].append(b)
+        adjacent[b].append(a)
+
+    rings = {}
+    for name, hop in levels.items():
+        rings.setdefault(hop, []).append(name)
+
+    angles = {}
+    positions = {}
+    for hop in sorted(rings):
+        ring = rings[hop]
+
+        def parent_angle(name):
+            parents = [angles[p] for p in adjacent[name] if levels[p] == hop - 1 and p in angles]
+            return sum(parents) / len(parents) if parents else 0
+
+        ring.sort(key=lambda name: (parent_angle(name), name))
+        for i, name in enumerate(ring):
+            angle = 2 * math.pi * i / len(ring) if hop else 0
+            angles[name] = angle
+            positions[name] = (hop * math.cos(angle), hop * math.sin(angle))
+    return positions
+
+
+'''
+Returns the ego network and layout of a vertex, (levels, edges, positions), see ego_network
+layouts are cached until the graph changes
+'''
+def ego_layout(graph, center, hops=1, max_nodes=50, rank_by='degree'):
+    # a weak reference only equals one to the same live graph, unlike an id, which a new graph can reuse
+    key = (weakref.ref(graph), getattr(graph, 'version', 0), center, hops, max_nodes, rank_by)
+    layout = layout_cache.get(key)
+    if layout is None:
+        levels, edges = ego_network(graph, center, hops, max_nodes, rank_by)
+        layout = (levels, edges, shell_layout(levels, edges))
+        layout_cache.put(key, layout)
+    return layout
+
+
+'''
+Draws the ego network of a vertex, see ego_network
+a new Figure is drawn on each call rather than pyplot's shared one, so that server threads can draw at once
+:param labels: label vertices with their names, left out when there are more than 100 vertices
+:return: matplotlib Figure
+'''
+def draw_ego_network(graph, center, hops=1, max_nodes=50, rank_by='degree', labels=True):
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+
+    levels, edges, positions = ego_layout(graph, center, hops, max_nodes, rank_by)
+    names = list(levels)
+
+    figure = Figure(figsize=(8, 8))
+    axes = figure.add_subplot()
+    axes.add_collection(LineCollection([(positions[a], positions[b]) for a, b in edges],
+                                       colors='lightgray', linewidths=0.5, zorder=1))
+    colors = [CENTER_COLOR if name == center else COLORS.get(graph.get_vertex(name).get_type(), 'gray')
+              for name in names]
+    axes.scatter([positions[name][0] for name in names], [positions[name][1] for name in names],
+                 c=colors, s=60, zorder=2)
+    if labels and len(names) <= 100:
+        for name in names:
+            axes.annotate(name, positions[name], fontsize=5, ha='center', va='bottom')
+
+    axes.set_title(center)
+    axes.set_aspect('equal')
+    axes.axis('off')
+    return figure
+
+
+'''
+Draws the ego network of a vertex to an image
+:param format: image format, as accepted by matplotlib's savefig
+:return: bytes of the image
+'''
+def render_ego_network(graph, center, hops=1, max_nodes=50, rank_by='degree', format='png'):
+    import io
+
+    buffer = io.BytesIO()
+    draw_ego_network(graph, center, hops, max_nodes, rank_by).savefig(buffer, format=format, dpi=100)
+    return buffer.getvalue()
@@ -0,0 +1,219 @@
+"""
+The year index answers queries over a range of release years without visiting every year.
+The years that have movies are kept sorted, so the years of a range are found by binary search.
+Each year also has rollups (number of movies, summed box office, distinct actors) stored in
+Fenwick trees, so the total of a rollup over any range is two prefix sums, O(log years),
+and adding, removing or re-pricing a movie updates one year of each tree.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from GraphListener import GraphListener
+
+
+'''
+A Fenwick (binary indexed) tree over a list of numbers
+adds to one number and sums a prefix of the list in O(log n)
+'''
+class FenwickTree:
+    def __init__(self, values=()):
+        self.tree = [0] + list(values)
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    # adds delta to the number at position i, counting from 0
+    def add(self, i, delta):
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    # sum of the first n numbers
+    def prefix(self, n):
+        total = 0
+        while n > 0:
+            total += self.tree[n]
+            n -= n & -n
+        return total
+
+
+'''
+The rollups kept for each release year, by name:
+    'movies'      number of movies released that year
+    'box_office'  summed income of those movies
+    'actors'      number of distinct actors in those movies
+summed over a range, 'actors' counts an actor once for every year of the range they worked in
+The index is built from the graph on the first query, then kept up to date by the graph events.
+'''
+class YearIndex(GraphListener):
+    ROLLUPS = ('movies', 'box_office', 'actors')
+    BATCHED = True
+
+    def __init__(self):
+        # sorted list of the years that have, or had, a movie
+        self.years = None
+        # year -> its position in self.years
+        self.positions = None
+        # rollup name -> FenwickTree over self.years
+        self.trees = None
+        # year -> actor name -> number of the year's movies the actor worked in
+        self.actor_movies = None
+        # movie name -> [year, box office, cast] it is counted with, cast being a dict of actor names
+        self.movies = None
+        # readers can share the graph, so the first build is serialized
+        self.build_lock = threading.Lock()
+
+    def _ensure_built(self, graph):
+        if self.trees is None:
+            with self.build_lock:
+                if self.trees is None:
+                    self._build(graph)
+
+    # scans the movies once to compute every rollup from scratch
+    # self.trees is assigned last, as it marks the index as built
+    def _build(self, graph):
+        self.years = sorted(graph.year_index)
+        self.actor_movies = {}
+        self.movies = {}
+        totals = {rollup: [0] * len(self.years) for rollup in self.ROLLUPS}
+        for i, year in enumerate(self.years):
+            actors = self.actor_movies[year] = {}
+            for movie in graph.year_index[year]:
+                v = graph.get_vertex(movie)
+                cast = self._cast(v)
+                self.movies[movie] = [year, v.get_income(), cast]
+                totals['movies'][i] += 1
+                totals['box_office'][i] += v.get_income()
+                for actor in cast:
+                    actors[actor] = actors.get(actor, 0) + 1
+            totals['actors'][i] = len(actors)
+
+        self.positions = {year: i for i, year in enumerate(self.years)}
+        self.trees = {rollup: FenwickTree(values) for rollup, values in totals.items()}
+
+    '''
+    returns the years that have a movie, from start to end inclusive
+    :param start: first year, or None for the earliest
+    :param end: last year, or None for the latest
+    '''
+    def years_in_range(self, graph, start=None, end=None):
+        self._ensure_built(graph)
+        first, last = self._bounds(start, end)
+        return [year for year in self.years[first:last] if year in graph.year_index]
+
+    '''
+    returns {rollup name: total over the years from start to end inclusive}
+    '''
+    def totals(self, graph, start=None, end=None):
+        self._ensure_built(graph)
+        first, last = self._bounds(start, end)
+        return {rollup: tree.prefix(last) - tree.prefix(first) for rollup, tree in self.trees.items()}
+
+    # the slice of self.years holding the years from start to end inclusive
+    def _bounds(self, start, end):
+        first = 0 if start is None else bisect_left(self.years, start)
+        last = len(self.years) if end is None else bisect_right(self.years, end)
+        return first, max(first, last)
+
+    # adds delta to a rollup of a year, giving the year a position first if it is new
+    def _update(self, year, rollup, delta):
+        if year not in self.positions:
+            self._add_year(year)
+        self.trees[rollup].add(self.positions[year], delta)
+
+    # a new year shifts the positions of the later years, so the trees are rebuilt, O(years)
+    # years are never removed, a year left without movies keeps rollups of 0
+    def _add_year(self, year):
+        values = {rollup: [tree.prefix(i + 1) - tree.prefix(i) for i in range(len(tree))]
+                  for rollup, tree in self.trees.items()}
+        i = bisect_left(self.years, year)
+        insort(self.years, year)
+        for rollup in self.ROLLUPS:
+            values[rollup].insert(i, 0)
+        self.positions = {year: i for i, year in enumerate(self.years)}
+        self.trees = {rollup: FenwickTree(values[rollup]) for rollup in self.ROLLUPS}
+
+    # returns (actor, movie) if the edge joins an actor to a movie, else None
+    def _actor_and_movie(self, v, w):
+        if v.get_type() == 'Actor' and w.get_type() == 'Movie':
+            return v, w
+        if v.get_type() == 'Movie' and w.get_type() == 'Actor':
+            return w, v
+        return None
+
+    def _cast(self, movie):
+        return {w.get_id(): None for w in movie.get_neighbors() if w.get_type() == 'Actor'}
+
+    # counts an actor in one more (delta 1) or one less (delta -1) movie of a year
+    def _update_actor(self, year, name, delta):
+        actors = self.actor_movies.setdefault(year, {})
+        count = actors.get(name, 0) + delta
+        if count:
+            actors[name] = count
+        else:
+            actors.pop(name, None)
+        if count == 0 or (count == 1 and delta == 1):
+            self._update(year, 'actors', delta)
+
+    def vertex_added(self, graph, v):
+        if self.trees is None or v.get_type() != 'Movie':
+            return
+        self.movies[v.get_id()] = [v.get_info(), v.get_income(), {}]
+        self._update(v.get_info(), 'movies', 1)
+        self._update(v.get_info(), 'box_office', v.get_income())
+
+    def vertex_removed(self, graph, v):
+        if self.trees is None or v.get_type() != 'Movie':
+            return
+        del self.movies[v.get_id()]
+        self._update(v.get_info(), 'movies', -1)
+        self._update(v.get_info(), 'box_office', -v.get_income())
+
+    def edge_added(self, graph, v, w, old_weight, weight):
+        if self.trees is None or old_weight is not None:
+            return
+        pair = self._actor_and_movie(v, w)
+        if pair is not None:
+            self.movies[pair[1].get_id()][2][pair[0].get_id()] = None
+            self._update_actor(pair[1].get_info(), pair[0].get_id(), 1)
+
+    def edge_removed(self, graph, v, w, weight):
+        if self.trees is None:
+            return
+        pair = self._actor_and_movie(v, w)
+        if pair is not None:
+            self.movies[pair[1].get_id()][2].pop(pair[0].get_id(), None)
+            self._update_actor(pair[1].get_info(), pair[0].get_id(), -1)
+
+    def income_changed(self, graph, v, old_income):
+        if self.trees is None or v.get_type() != 'Movie':
+            return
+        self.movies[v.get_id()][1] = v.get_income()
+        self._update(v.get_info(), 'box_office', v.get_income() - old_income)
+
+    # uncounts every movie the batch changed as it was counted, then counts those still in the graph
+    # a movie is changed by a change to its cast, so actors need no counting of their own
+    def batch_changed(self, graph, changed):
+        if self.trees is None:
+            return
+        for name in changed:
+            movie = self.movies.pop(name, None)
+            if movie is not None:
+                self._count_movie(movie, -1)
+            v = graph.get_vertex(name)
+            if v is not None and v.get_type() == 'Movie':
+                movie = self.movies[name] = [v.get_info(), v.get_income(), self._cast(v)]
+                self._count_movie(movie, 1)
+
+    # adds (delta 1) or takes away (delta -1) a movie from the rollups of its year
+    def _count_movie(self, movie, delta):
+        year, box_office, cast = movie
+        self._update(year, 'movies', delta)
+        self._update(year, 'box_office', delta * box_office)
+        for actor in cast:
+            self._update_actor(year, actor, delta)
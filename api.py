@@ -1,82 +1,358 @@
-from flask import Flask, jsonify, request
-import CreateGraph
+from flask import Flask, Response, jsonify, make_response, request
+from FrozenGraph import FrozenGraph
+from Leaderboard import Leaderboards
+from ResponseCache import ResponseCache
+import Batch
+import HotReload
+import Metrics
+import MutationLog
+import Snapshot
+import Visualization
+import atexit
+import base64
+import binascii
+import functools
 import json
+import os
 
 app = Flask(__name__)
 
+# set GRAPH_METRICS=1 to time the graph methods and the routes, and serve the timings at /metrics
+# enabled before the graph is loaded, so that the startup is timed too
+if os.environ.get('GRAPH_METRICS', '').lower() in ('1', 'true', 'yes'):
+    Metrics.enable()
+
+'''
+Returns g as a mutable Graph, thawing it if it is a FrozenGraph
+thawing builds every vertex and edge, so it costs as much as building the graph from data.json
+the Graph keeps the frozen graph's lock, so requests that waited on the lock still exclude each other
+'''
+def mutable(g):
+    if isinstance(g, FrozenGraph) and store is not None and g is store.graph:
+        # thawed by the store, which logs the changes made to the Graph
+        return store.mutable()
+    if isinstance(g, FrozenGraph):
+        thawed = g.thaw()
+        thawed.lock = g.lock
+        return thawed
+    return g
+
 # initialize data and graph
-graph = CreateGraph.createGraph()
+# the graph is loaded from the binary snapshot of data.json, which is only rebuilt when data.json changes
+# reads are served straight from the mapped snapshot, a FrozenGraph, and the first write thaws it
+# into a mutable Graph, see writes
+# set GRAPH_DATA_DIR to a directory to keep the edits made through the api: they are logged there and
+# replayed over the snapshot on the next start, see MutationLog; the store thaws its snapshot at startup
+# only if there are edits to replay, else on the first write too
+# a store is used by one process at a time, run the api in a single process, or with Prefork, whose
+# owner alone loads the store
+data_dir = os.environ.get('GRAPH_DATA_DIR', '')
+if data_dir:
+    store = MutationLog.GraphStore(data_dir, 'data.json', 'data.snapshot')
+    graph = store.load(start=False)
+    atexit.register(store.close)
+else:
+    store = None
+    graph = Snapshot.load_or_build('data.json', 'data.snapshot')
+
+# set GRAPH_RELOAD=1 to apply the changes made to data.json to the live graph as they are made, see HotReload
+# the store already brought the graph up to date with data.json, and its reloader keeps its baseline saved
+reloader = None
+if os.environ.get('GRAPH_RELOAD', '').lower() in ('1', 'true', 'yes'):
+    if store is not None:
+        reloader = store.get_reloader()
+        graph = store.graph
+    else:
+        graph = mutable(graph)
+        reloader = HotReload.HotReloader(graph, 'data.json')
+    atexit.register(reloader.close)
+
+threads_started = False
+
+'''
+Starts the threads that sync the mutation log and reload data.json, if enabled
+called on import, unless GRAPH_DEFER_THREADS is set, as Prefork does to fork its workers before any
+thread runs, and then calls it itself; later calls do nothing
+'''
+def start_threads():
+    global threads_started
+    if threads_started:
+        return
+    threads_started = True
+    if store is not None:
+        store.start()
+    if reloader is not None:
+        reloader.start()
+
+if os.environ.get('GRAPH_DEFER_THREADS', '').lower() not in ('1', 'true', 'yes'):
+    start_threads()
+
+# largest page a list endpoint will return, and the page size when only a cursor is given
+MAX_PAGE_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+
+# number of names serialized per chunk of a streamed list
+STREAM_CHUNK_SIZE = 1000
+
+# limits of the ego network images
+MAX_EGO_HOPS = 3
+MAX_EGO_NODES = 500
+
+# most actors returned by /actors/<name>/similar
+MAX_SIMILAR = 100
+
+# serialized GET responses, keyed by route, arguments and graph version
+response_cache = ResponseCache(max_entries=1024)
+
+if Metrics.enabled():
+    Metrics.install(app)
+    Metrics.registry.gauge('graph_version', 'Number of changes made to the graph.', lambda: graph.version)
+    Metrics.registry.gauge('graph_vertices', 'Number of vertices in the graph.', lambda: graph.num_vertices)
+    Metrics.registry.gauge('response_cache_hits', 'Responses served from the response cache.',
+                           lambda: response_cache.hits)
+    Metrics.registry.gauge('response_cache_misses', 'Responses built because they were not cached.',
+                           lambda: response_cache.misses)
+
+'''
+Serves new_graph instead of the graph loaded from data.json, dropping every cached response
+'''
+def set_graph(new_graph):
+    global graph
+    graph = new_graph
+    response_cache.clear()
+
+'''
+Runs a route that changes the graph while holding the graph's write lock
+a graph still served from the snapshot is thawed first, so the first write waits for the thaw
+'''
+def writes(view):
+    @functools.wraps(view)
+    def wrapper(**kwargs):
+        global graph
+        with graph.lock.write():
+            graph = mutable(graph)
+            return view(**kwargs)
+    return wrapper
+
+'''
+Serves a GET route from response_cache, holding the graph's read lock
+version_of is called with the route's arguments and returns the version of the data the response
+depends on, so the cached body is reused until that data changes
+responses carry an ETag, and requests whose If-None-Match matches it get a 304 without a body
+streamed responses, such as whole listings, are neither cached nor tagged, see stream_names
+'''
+def cached(version_of):
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            with graph.lock.read():
+                key = (request.path, tuple(sorted(request.args.items(multi=True))), version_of(**kwargs))
+                entry = response_cache.get(key)
+                if entry is None:
+                    response = make_response(view(**kwargs))
+                    if response.is_streamed:
+                        # reading the body would serialize it all at once, under the lock
+                        return response
+                    entry = response_cache.put(key, response.get_data(), response.status_code, response.mimetype)
+
+            body, status, mimetype, etag = entry
+            response = Response(body, status=status, mimetype=mimetype)
+            response.set_etag(etag)
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+def graph_version(**kwargs):
+    return graph.version
+
+def vertex_version(name):
+    return graph.get_vertex_version(name.replace('_', ' '))
 
 # test
 @app.route('/')
 def index():
     return jsonify({'Hello': 'World'})
 
+def actor_json(v):
+    return {
+        'name': v.get_id(),
+        'age': v.get_info(),
+        'gross income': v.get_income(),
+    }
+
+def movie_json(v):
+    return {
+        'name': v.get_id(),
+        'release year': v.get_info(),
+        'gross income': v.get_income(),
+    }
+
+'''
+True if the caller asked a mutation to return the whole actor or movie list, as it used to
+'''
+def wants_full_list():
+    return request.args.get('full', '').lower() in ('1', 'true', 'yes')
+
+def encode_cursor(name):
+    return base64.urlsafe_b64encode(name.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    return base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+
 '''
-If given a name, filters out all actors that contain name
-Else display all actors in the graph
+Streams {key: names} as JSON, serializing the names a chunk at a time
+names must be a list of its own, as it is read after the graph's lock is released
+'''
+def stream_names(key, names):
+    def generate():
+        yield '{' + json.dumps(key) + ': ['
+        for i in range(0, len(names), STREAM_CHUNK_SIZE):
+            chunk = ', '.join(json.dumps(name) for name in names[i:i + STREAM_CHUNK_SIZE])
+            yield (', ' if i else '') + chunk
+        yield ']}'
+
+    return Response(generate(), mimetype='application/json')
+
+'''
+Lists the names of a type
+with limit and/or cursor, returns one page in name order along with the cursor of the next page
+else streams every name
+'''
+def list_names(key, type):
+    limit = request.args.get('limit', type=int)
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        names = graph.get_actors() if type == 'Actor' else graph.get_movies()
+        return stream_names(key, names)
+
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except (binascii.Error, UnicodeError, ValueError):
+        return jsonify({'error': 'invalid cursor'}), 400
+
+    limit = min(max(limit or DEFAULT_PAGE_SIZE, 1), MAX_PAGE_SIZE)
+    names = graph.page_names(type, after, limit)
+    next_cursor = encode_cursor(names[-1]) if len(names) == limit else None
+    return jsonify({key: names, 'next_cursor': next_cursor})
+
+'''
+If given a name, filters out all actors that contain name, at most limit of them if given
+Else display all actors in the graph, one page at a time if given a limit or cursor
 '''
 @app.route('/actors', methods=['GET'])
+@cached(graph_version)
 def actors_attr():
-    actors = graph.get_actors()
     result = request.args.get('name')
     if result:
         result = ''.join(x for x in result if x.isalpha())
-        res_actors = [x for x in actors if result in x]
+        res_actors = graph.search_names(result, 'Actor', request.args.get('limit', type=int))
         return jsonify({'movies': res_actors})
 
-    return jsonify({'actors': actors})
+    return list_names('actors', 'Actor')
 
 
 '''
-If given a name, filters out all movies that contain name
-Else display all actors in the graph
+If given a name, filters out all movies that contain name, at most limit of them if given
+If given from and/or to, lists the movies released in those years, inclusive, with their totals
+Else display all movies in the graph, one page at a time if given a limit or cursor
 '''
 @app.route('/movies', methods=['GET'])
+@cached(graph_version)
 def movies_attr():
-    movies = graph.get_movies()
     result = request.args.get('name')
     if result:
         result = ''.join(x for x in result if x.isalpha())
-        res_movies = [x for x in movies if result in x]
+        res_movies = graph.search_names(result, 'Movie', request.args.get('limit', type=int))
         return jsonify({'movies': res_movies})
 
+    if 'from' in request.args or 'to' in request.args:
+        return movies_in_range()
+
+    return list_names('movies', 'Movie')
+
+def movies_in_range():
+    start = request.args.get('from', type=int)
+    end = request.args.get('to', type=int)
+    for key, value in (('from', start), ('to', end)):
+        if key in request.args and value is None:
+            return jsonify({'error': key + ' must be a year'}), 400
 
-    return jsonify({'movies': movies})
+    return jsonify({
+        'from': start,
+        'to': end,
+        'totals': graph.get_year_totals(start, end),
+        'movies': graph.get_movies_in_range(start, end),
+    })
+
+'''
+Pages through a ranking of the actors, highest first
+by = paid (default), income, age, connections or age_income
+limit = maximum number of entries (default 50), offset = number of entries to skip
+'''
+@app.route('/actors/top', methods=['GET'])
+@cached(graph_version)
+def top_actors():
+    by = request.args.get('by', 'paid')
+    limit = request.args.get('limit', 50, type=int)
+    offset = request.args.get('offset', 0, type=int)
+    if by not in Leaderboards.RANKINGS:
+        return jsonify({'error': 'cannot rank actors by ' + by}), 400
+
+    ranking = graph.get_ranking(by, max(offset, 0), max(limit, 0))
+    if by == 'age_income':
+        entries = [{'age': key, 'gross income': score} for key, score in ranking]
+    else:
+        entries = [{'name': key, by: score} for key, score in ranking]
+
+    return jsonify({
+        'by': by,
+        'offset': offset,
+        'total': graph.get_ranking_size(by),
+        'actors': entries,
+    })
 
 '''
 Returns the first Actor object that has the correct name
 Displays actor attributes and metadata
 '''
 @app.route('/actors/<string:name>', methods=['GET'])
+@cached(vertex_version)
 def return_actor(name):
     name = name.replace('_', ' ')
     v = graph.get_vertex(name)
     if v:
-        ret = {
-            'name': name,
-            'age': v.get_info(),
-            'gross income': v.get_income(),
-        }
-        return jsonify(ret)
+        return jsonify(actor_json(v))
     else:
         return jsonify({'actor': name + ' not found'})
 
+'''
+Lists the actors whose movies are most like the given actor's, most similar first
+k = maximum number of actors (default 10, at most MAX_SIMILAR)
+'''
+@app.route('/actors/<string:name>/similar', methods=['GET'])
+@cached(graph_version)
+def similar_actors(name):
+    name = name.replace('_', ' ')
+    if not graph.has_vertex(name, 'Actor'):
+        return jsonify({'error': name + ' not found'}), 404
+
+    k = min(max(request.args.get('k', 10, type=int), 1), MAX_SIMILAR)
+    return jsonify({
+        'actor': name,
+        'similar': [{'name': other, 'similarity': score} for other, score in graph.similar_actors(name, k)],
+    })
+
 '''
 Returns the first Movie object that has correct name
 Displays movie attributes and metadata
 '''
 @app.route('/movies/<string:name>', methods=['GET'])
+@cached(vertex_version)
 def return_movie(name):
     name = name.replace('_', ' ')
     v = graph.get_vertex(name)
     if v:
-        ret = {
-            'name': name,
-            'release year': v.get_info(),
-            'gross income': v.get_income(),
-        }
-        return jsonify(ret)
+        return jsonify(movie_json(v))
     else:
         return jsonify({'movie' : name + ' not found'})
 
@@ -84,12 +360,14 @@ def return_movie(name):
 Given a gross_income, update Actor object's income attribute in graph
 '''
 @app.route('/actors/<string:name>', methods=['PUT'])
+@writes
 def put_actor(name):
-    total_gross = request.args.get('total_gross')
+    total_gross = request.args.get('total_gross', type=int)
     name = name.replace('_', ' ')
     v = graph.get_vertex(name)
-    v.set_income(total_gross)
     if v:
+        if total_gross is not None:
+            v.set_income(total_gross)
         ret = {
             'name': name,
             'age': v.get_info(),
@@ -104,12 +382,14 @@ def put_actor(name):
 Given a box_office, update Movie object's income attribute in graph
 '''
 @app.route('/movies/<string:name>', methods=['PUT'])
+@writes
 def put_movie(name):
-    box_office = request.args.get('box_office')
+    box_office = request.args.get('box_office', type=int)
     name = name.replace('_', ' ')
     v = graph.get_vertex(name)
-    v.set_income(box_office)
     if v:
+        if box_office is not None:
+            v.set_income(box_office)
         ret = {
             'name': name,
             'release year': v.get_info(),
@@ -122,14 +402,21 @@ def put_movie(name):
 
 '''
 Add a new Actor object to graph given a name
+Returns the new actor, or every actor if full=true
+409 if a movie already has the name
 '''
 @app.route('/actors/<string:name>', methods=['POST'])
+@writes
 def add_actor(name):
     name = name.replace('_', ' ')
-    if name not in graph.get_actors():
-        graph.add_vertex(name, type='Actor')
-        actors = graph.get_actors()
-        return jsonify({'actors': actors})
+    if graph.has_vertex(name) and not graph.has_vertex(name, 'Actor'):
+        # adding the vertex would replace the other one, and drop its edges
+        return jsonify({'error': name + ' already exists with another type'}), 409
+    if not graph.has_vertex(name, 'Actor'):
+        v = graph.add_vertex(name, type='Actor')
+        if wants_full_list():
+            return jsonify({'actors': graph.get_actors()})
+        return jsonify({'actor': actor_json(v)})
 
     else:
         return jsonify({'actor': name + ' already in actors list'})
@@ -137,14 +424,21 @@ def add_actor(name):
 
 '''
 Add a new Movie object to graph given a name
+Returns the new movie, or every movie if full=true
+409 if an actor already has the name
 '''
 @app.route('/movies/<string:name>', methods=['POST'])
+@writes
 def add_movie(name):
     name = name.replace('_', ' ')
-    if name not in graph.get_movies():
-        graph.add_vertex(name, type='Movie')
-        movies = graph.get_movies()
-        return jsonify({'movies': movies})
+    if graph.has_vertex(name) and not graph.has_vertex(name, 'Movie'):
+        # adding the vertex would replace the other one, and drop its edges
+        return jsonify({'error': name + ' already exists with another type'}), 409
+    if not graph.has_vertex(name, 'Movie'):
+        v = graph.add_vertex(name, type='Movie')
+        if wants_full_list():
+            return jsonify({'movies': graph.get_movies()})
+        return jsonify({'movie': movie_json(v)})
 
     else:
         return jsonify({'movie': name + ' already in movies list'})
@@ -153,14 +447,18 @@ def add_movie(name):
 '''
 Delete Actor object with the given name from graph
 If that actor is currently in the graph
+Returns the deleted actor, or every remaining actor if full=true
 '''
 @app.route('/actors/<string:name>', methods=['DELETE'])
+@writes
 def remove_actor(name):
     name = name.replace('_', ' ')
-    if name in graph.get_actors():
+    if graph.has_vertex(name, 'Actor'):
+        v = graph.get_vertex(name)
         graph.remove_vertex(name)
-        actors = graph.get_actors()
-        return jsonify({'actors': actors})
+        if wants_full_list():
+            return jsonify({'actors': graph.get_actors()})
+        return jsonify({'actor': actor_json(v)})
 
     else:
         return jsonify({'actor': name + ' not found'})
@@ -169,18 +467,85 @@ def remove_actor(name):
 '''
 Delete Movie object with the given name from graph
 If that actor is currently in the graph
+Returns the deleted movie, or every remaining movie if full=true
 '''
 @app.route('/movies/<string:name>', methods=['DELETE'])
+@writes
 def remove_movie(name):
     name = name.replace('_', ' ')
-    if name in graph.get_movies():
+    if graph.has_vertex(name, 'Movie'):
+        v = graph.get_vertex(name)
         graph.remove_vertex(name)
-        movies = graph.get_movies()
-        return jsonify({'movies': movies})
+        if wants_full_list():
+            return jsonify({'movies': graph.get_movies()})
+        return jsonify({'movie': movie_json(v)})
 
     else:
         return jsonify({'movie': name + ' not found'})
 
 
+'''
+Finds how two actors or movies are connected, with the fewest links
+from, to = names of the two ends
+via = movies to only link actors through the movies they share
+max_depth = longest path to look for, in links
+'''
+@app.route('/path', methods=['GET'])
+@cached(graph_version)
+def path():
+    frm = request.args.get('from', '').replace('_', ' ')
+    to = request.args.get('to', '').replace('_', ' ')
+    for name in (frm, to):
+        if not graph.has_vertex(name):
+            return jsonify({'error': name + ' not found'}), 404
+
+    movies_only = request.args.get('via') == 'movies'
+    found = graph.shortest_path(frm, to, movies_only, request.args.get('max_depth', type=int))
+    return jsonify({
+        'from': frm,
+        'to': to,
+        'path': found,
+        'degrees': None if found is None else len(found) - 1,
+    })
+
+
+'''
+Draws the neighborhood of an actor or movie as a PNG image
+hops = how many links away from name to go (default 1, at most 3)
+max_nodes = most vertices to draw (default 50, at most 500), the highest ranked are kept
+rank = degree (default) or income, what vertices are ranked by
+'''
+@app.route('/ego/<string:name>.png', methods=['GET'])
+@cached(graph_version)
+def ego_image(name):
+    name = name.replace('_', ' ')
+    if not graph.has_vertex(name):
+        return jsonify({'error': name + ' not found'}), 404
+
+    rank_by = request.args.get('rank', 'degree')
+    if rank_by not in Visualization.RANKINGS:
+        return jsonify({'error': 'cannot rank vertices by ' + rank_by}), 400
+    hops = min(max(request.args.get('hops', 1, type=int), 1), MAX_EGO_HOPS)
+    max_nodes = min(max(request.args.get('max_nodes', 50, type=int), 1), MAX_EGO_NODES)
+
+    image = Visualization.render_ego_network(graph, name, hops, max_nodes, rank_by)
+    return Response(image, mimetype='image/png')
+
+
+'''
+Applies a JSON array of upsert, income, delete and edge operations in one request, see Batch
+The whole batch is applied under one hold of the write lock
+Returns the status of every operation
+'''
+@app.route('/batch', methods=['POST'])
+@writes
+def batch():
+    operations = request.get_json(silent=True)
+    if not isinstance(operations, list):
+        return jsonify({'error': 'expected a JSON array of operations'}), 400
+
+    return jsonify({'results': Batch.apply_batch(graph, operations)})
+
+
 if __name__ == '__main__':
-    app.run(debug=True, port = 5000)
\ No newline at end of file
+    app.run(debug=True, port = 5000, threaded=True)
\ No newline at end of file
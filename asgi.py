@@ -0,0 +1,12 @@
+"""
+ASGI entry point for serving the api with an async server, e.g.
+    uvicorn asgi:app
+Requests run on a thread pool, many in flight at once; the api routes hold the graph's
+reader-writer lock, so concurrent reads share the graph and writes apply one at a time.
+Needs the asgiref package (pip install asgiref).
+"""
+
+from asgiref.wsgi import WsgiToAsgi
+import api
+
+app = WsgiToAsgi(api.app)